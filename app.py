@@ -1,19 +1,244 @@
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import date, datetime, timedelta
 from functools import wraps
+import bisect
+import csv
+import hashlib
+import hmac
+import html
+import io
 import json
-
+import math
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+
+import click
 import numpy as np
-from flask import Flask, jsonify, redirect, render_template, request, session, url_for
+from flask import (
+    Flask,
+    Response,
+    g,
+    has_app_context,
+    has_request_context,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    url_for,
+)
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.sql.util import find_tables
 from werkzeug.security import check_password_hash, generate_password_hash
 
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used instead
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack is only offered when it is installed
+    msgpack = None
+
+
+def database_url():
+    """The database to use: ``DATABASE_URL`` if set, else the local SQLite file."""
+    url = os.environ.get("DATABASE_URL", "sqlite:///tracker.db")
+    # Hosting providers still hand out the scheme SQLAlchemy no longer accepts.
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def engine_options(url):
+    """Connection pool settings suited to the database behind ``url``."""
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        return {}
+    pool_size = int(os.environ.get("DB_POOL_SIZE", 5))
+    max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    if url.startswith("sqlite"):
+        # SQLite allows one writer at a time, so extra connections only queue
+        # on its lock; keep the pool small and let busy_timeout do the waiting.
+        return {"pool_size": pool_size, "max_overflow": max_overflow, "pool_timeout": 30}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    }
+
+
+def shard_binds(count):
+    """Flask-SQLAlchemy binds for ``count`` shard databases, named ``shard0`` onwards.
+
+    ``DATABASE_SHARD_URL`` is formatted with each shard's index; relative
+    SQLite paths end up in the instance folder like the main database.
+    """
+    template = os.environ.get("DATABASE_SHARD_URL", "sqlite:///tracker-shard{index}.db")
+    binds = {}
+    for index in range(count):
+        url = template.format(index=index)
+        if url.startswith("postgres://"):
+            url = "postgresql://" + url[len("postgres://"):]
+        binds[f"shard{index}"] = {"url": url, **engine_options(url)}
+    return binds
+
+
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def negotiate_response_format():
+    """"msgpack" if the request's ``Accept`` header prefers MessagePack and msgpack is installed, else "json"."""
+    if msgpack is None or not has_request_context():
+        return "json"
+    best = request.accept_mimetypes.best_match(["application/json", *MSGPACK_MIMETYPES])
+    return "msgpack" if best in MSGPACK_MIMETYPES else "json"
+
+
+class AppJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding through orjson when it is installed and
+    answering in MessagePack to clients that ask for it.
+
+    ``jsonify`` builds every response through ``response()``, so all routes
+    negotiate their format from the ``Accept`` header without changes.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj, "json")[0].decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def encode(self, obj, response_format):
+        """``obj`` encoded as ``response_format``, in bytes, and the mimetype to send it with."""
+        if response_format == "msgpack":
+            return msgpack.packb(obj, default=self.default), MSGPACK_MIMETYPES[0]
+        if orjson is None:
+            return super().dumps(obj).encode(), self.mimetype
+        # Dates still go through default(), so they look the same as with the standard encoder.
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=options), self.mimetype
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        response_format = negotiate_response_format()
+        if response_format == "json":
+            response = super().response(obj)
+        else:
+            body, mimetype = self.encode(obj, response_format)
+            response = self._app.response_class(body, mimetype=mimetype)
+        response.vary.add("Accept")
+        return response
+
 
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///tracker.db"
+app.json = AppJSONProvider(app)
+app.config["SQLALCHEMY_DATABASE_URI"] = database_url()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Applied to every new SQLite connection; ignored for other databases.
+app.config["SQLITE_PRAGMAS"] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
 app.config["SECRET_KEY"] = "your-secret-key-change-this-in-production"
+app.config["DASHBOARD_CACHE_SIZE"] = 512
+app.config["LEADERBOARD_CACHE_SIZE"] = 128
+app.config["LEADERBOARD_CACHE_SECONDS"] = 30
+app.config["BAR_SERIES_CACHE_SIZE"] = 256
+app.config["SERVER_TIMING_HEADER"] = os.environ.get("SERVER_TIMING_HEADER") == "1"
+app.config["SLOW_QUERY_SECONDS"] = 0.1
+app.config["SLOW_QUERY_SAMPLES"] = 20
+# /metrics answers loopback clients only, or anyone sending this token as
+# "Authorization: Bearer <token>" when it is set.
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN", "")
+# Full Werkzeug method string with its parameters, as stored before the first
+# "$" of a hash, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000". Hashes
+# made with anything else are upgraded on the next successful login.
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# 0 hashes inside the request thread instead of in a process pool.
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+app.config["PASSWORD_HASH_QUEUE"] = 16
+app.config["PASSWORD_HASH_TIMEOUT"] = 10
+app.config["AUTH_RATE_WINDOW_SECONDS"] = 60
+app.config["AUTH_RATE_LIMIT_PER_IP"] = 20
+app.config["AUTH_RATE_LIMIT_PER_USERNAME"] = 10
+# Request bodies above this are refused with 413; history imports are the
+# only large ones.
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", 16 * 1024 * 1024))
+# Empty for the in-process broker, or a redis:// URL to fan events out across
+# worker processes and hosts through Redis streams.
+app.config["EVENT_BROKER_URL"] = os.environ.get("EVENT_BROKER_URL", "")
+app.config["EVENT_REPLAY_SIZE"] = 200
+app.config["EVENT_HEARTBEAT_SECONDS"] = 15
+app.config["EVENT_STREAM_MAX_SECONDS"] = 300
+app.config["EVENT_RETRY_MS"] = 3000
+# Rendered chart images, named by the hash of what they show and shared by
+# every worker process on the host.
+app.config["SNAPSHOT_CACHE_DIR"] = os.environ.get("SNAPSHOT_CACHE_DIR") or os.path.join(app.instance_path, "snapshots")
+app.config["SNAPSHOT_CACHE_MAX_BYTES"] = int(os.environ.get("SNAPSHOT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Widgets and their history are spread over this many extra databases, one
+# user per database; 0 keeps everything in the main database. Accounts, shard
+# assignments and the leaderboard always stay in the main database.
+app.config["DATABASE_SHARDS"] = int(os.environ.get("DATABASE_SHARDS", 0))
+app.config["SQLALCHEMY_BINDS"] = shard_binds(app.config["DATABASE_SHARDS"])
+app.config["SHARD_MOVE_GRACE_SECONDS"] = 2
+
+# Set by using_shard() to point widget queries at one database, overriding the
+# logged-in user's shard. None is the main database, which is where users
+# registered before sharding was enabled keep their widgets.
+current_shard = ContextVar("current_shard")
+
+
+def active_shard():
+    """The database widget queries go to: the one picked by ``using_shard``, else the user's."""
+    try:
+        return current_shard.get()
+    except LookupError:
+        return g.get("user_shard") if has_app_context() else None
 
-db = SQLAlchemy(app)
+
+class ShardedSession(FlaskSession):
+    """Send statements on the widget tables to ``current_shard``, everything else to its usual bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and app.config["DATABASE_SHARDS"]:
+            if mapper is not None:
+                sharded = mapper.local_table in SHARDED_TABLES
+            else:
+                sharded = clause is not None and any(
+                    table in SHARDED_TABLES for table in find_tables(clause, include_crud=True)
+                )
+            if sharded:
+                return self._db.engines[active_shard()]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(app, session_options={"class_": ShardedSession})
 
 
 class User(db.Model):
@@ -21,12 +246,17 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped with every change to the user's dashboard; see invalidate_dashboard().
+    dashboard_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = run_hash_job(generate_password_hash, password, app.config["PASSWORD_HASH_METHOD"])
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return run_hash_job(check_password_hash, self.password_hash, password)
+
+    def needs_rehash(self):
+        return self.password_hash.split("$", 1)[0] != app.config["PASSWORD_HASH_METHOD"]
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -38,16 +268,21 @@ class DashboardWidget(db.Model):
     widget_type = db.Column(db.String(20), nullable=False)
     title = db.Column(db.String(120), nullable=False)
     position = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped on every change to the widget's data; see bump_widget_version().
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship("User", backref="dashboard_widgets")
 
+    __table_args__ = (db.Index("ix_dashboard_widget_user_position", "user_id", "position"),)
+
     def to_dict(self):
         return {
             "id": self.id,
             "type": self.widget_type,
             "title": self.title,
             "position": self.position,
+            "version": self.version,
         }
 
 
@@ -56,8 +291,11 @@ class RadarWidgetData(db.Model):
     widget_id = db.Column(
         db.Integer, db.ForeignKey("dashboard_widget.id"), unique=True, nullable=False
     )
-    domains = db.Column(db.Text, nullable=False)
-    scores = db.Column(db.Text, nullable=False)
+    # Domains and scores now live in RadarDomain rows; these JSON columns are
+    # only read once by migrate_widget_configs() and emptied afterwards.
+    legacy_domains = db.Column("domains", db.Text, nullable=False, default="[]")
+    legacy_scores = db.Column("scores", db.Text, nullable=False, default="[]")
+    decay_evaluated_on = db.Column(db.Date, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     widget = db.relationship(
@@ -66,16 +304,36 @@ class RadarWidgetData(db.Model):
     )
 
     def get_domains(self):
-        return json.loads(self.domains)
+        return [domain.name for domain in self.widget.radar_domains]
 
     def get_scores(self):
-        return json.loads(self.scores)
-
-    def set_domains(self, domain_list):
-        self.domains = json.dumps(domain_list)
+        return [domain.score for domain in self.widget.radar_domains]
 
     def set_scores(self, score_list):
-        self.scores = json.dumps(score_list)
+        for domain, score in zip(self.widget.radar_domains, score_list):
+            if domain.score != score:
+                domain.score = score
+
+
+class RadarDomain(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    widget_id = db.Column(db.Integer, db.ForeignKey("dashboard_widget.id"), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+
+    widget = db.relationship(
+        "DashboardWidget",
+        backref=db.backref(
+            "radar_domains",
+            order_by="RadarDomain.position",
+            cascade="all, delete-orphan",
+        ),
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint("widget_id", "position", name="uq_radar_domain_widget_position"),
+    )
 
 
 class RadarDailyAdjustment(db.Model):
@@ -93,8 +351,28 @@ class RadarDailyAdjustment(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("widget_id", "domain_index", "entry_date", name="uq_radar_daily_adjustment"),
+        db.Index("ix_radar_daily_adjustment_widget_date", "widget_id", "entry_date"),
+    )
+
+
+class RadarScoreSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    widget_id = db.Column(db.Integer, db.ForeignKey("dashboard_widget.id"), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    scores = db.Column(db.Text, nullable=False)
+
+    widget = db.relationship(
+        "DashboardWidget",
+        backref=db.backref("radar_snapshots", cascade="all, delete-orphan"),
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint("widget_id", "snapshot_date", name="uq_radar_score_snapshot"),
     )
 
+    def get_scores(self):
+        return json.loads(self.scores)
+
 
 class BarWidgetData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -133,12 +411,19 @@ class BarEntry(db.Model):
         db.UniqueConstraint("widget_id", "date", name="uq_bar_entry_widget_date"),
     )
 
-    def to_dict(self):
+    def to_dict(self, compact=False):
+        if compact:
+            return {
+                "id": self.id,
+                "value": self.value,
+                "date": self.date.toordinal() - EPOCH_ORDINAL,
+                "timestamp": int((self.timestamp - EPOCH).total_seconds()),
+            }
         return {
             "id": self.id,
             "value": self.value,
-            "date": self.date.strftime("%Y-%m-%d"),
-            "timestamp": self.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            "date": self.date.isoformat(),
+            "timestamp": self.timestamp.isoformat(" ", "seconds"),
         }
 
 
@@ -147,7 +432,9 @@ class PieWidgetData(db.Model):
     widget_id = db.Column(
         db.Integer, db.ForeignKey("dashboard_widget.id"), unique=True, nullable=False
     )
-    categories = db.Column(db.Text, nullable=False)
+    # Categories now live in PieCategory rows; this JSON column is only read
+    # once by migrate_widget_configs() and emptied afterwards.
+    legacy_categories = db.Column("categories", db.Text, nullable=False, default="[]")
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     widget = db.relationship(
@@ -156,10 +443,7 @@ class PieWidgetData(db.Model):
     )
 
     def get_categories(self):
-        return json.loads(self.categories)
-
-    def set_categories(self, category_list):
-        self.categories = json.dumps(category_list)
+        return [category.name for category in self.widget.pie_categories]
 
     def to_dict(self):
         return {
@@ -167,6 +451,26 @@ class PieWidgetData(db.Model):
         }
 
 
+class PieCategory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    widget_id = db.Column(db.Integer, db.ForeignKey("dashboard_widget.id"), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+
+    widget = db.relationship(
+        "DashboardWidget",
+        backref=db.backref(
+            "pie_categories",
+            order_by="PieCategory.position",
+            cascade="all, delete-orphan",
+        ),
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint("widget_id", "position", name="uq_pie_category_widget_position"),
+    )
+
+
 class PieEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     widget_id = db.Column(db.Integer, db.ForeignKey("dashboard_widget.id"), nullable=False)
@@ -182,18 +486,1064 @@ class PieEntry(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("widget_id", "category_index", "entry_date", name="uq_pie_entry_widget_category_date"),
+        db.Index("ix_pie_entry_widget_date", "widget_id", "entry_date"),
     )
 
     def to_dict(self):
         return {
             "category_index": self.category_index,
             "hours": self.hours,
-            "entry_date": self.entry_date.strftime("%Y-%m-%d"),
+            "entry_date": self.entry_date.isoformat(),
+        }
+
+
+# Indexes that earlier versions created and that are no longer declared, by
+# table; sync_schema() drops them from existing databases.
+DROPPED_INDEXES = {
+    # Duplicated the index behind uq_bar_entry_widget_date.
+    "bar_entry": ("ix_bar_entry_widget_date",),
+}
+
+
+def sync_schema(engine, tables):
+    """Add the columns and indexes declared on ``tables`` that the database behind ``engine`` is missing.
+
+    ``create_all()`` only creates missing tables, so a column or an index
+    added to a table that already exists would otherwise never reach existing
+    databases. New columns on existing tables must therefore be nullable or
+    carry a server default. Indexes listed in ``DROPPED_INDEXES`` are removed.
+    """
+    inspector = db.inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in tables:
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index_name in DROPPED_INDEXES.get(table.name, ()):
+                if index_name in existing_indexes:
+                    connection.execute(text(f"DROP INDEX {preparer.quote(index_name)}"))
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_sql = f"{preparer.quote(column.name)} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    column_sql += f" DEFAULT {column.server_default.arg}"
+                connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_sql}"))
+
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+class PieRollup(db.Model):
+    """Hours per category of a pie widget summed over a calendar week or month.
+
+    The row with ``category_index == PIE_TOTAL_INDEX`` holds the period totals:
+    all tracked hours, and in ``days`` the number of days with any hours
+    logged. On category rows ``days`` counts the days that category was used.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    widget_id = db.Column(db.Integer, db.ForeignKey("dashboard_widget.id"), nullable=False)
+    period = db.Column(db.String(5), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    category_index = db.Column(db.Integer, nullable=False)
+    hours = db.Column(db.Float, nullable=False, default=0)
+    days = db.Column(db.Integer, nullable=False, default=0)
+
+    widget = db.relationship(
+        "DashboardWidget",
+        backref=db.backref("pie_rollups", cascade="all, delete-orphan"),
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "widget_id", "period", "period_start", "category_index", name="uq_pie_rollup_period_category"
+        ),
+    )
+
+
+class WidgetAnalytics(db.Model):
+    """Streak and total state of a bar widget, or of one radar domain, up to ``through_day``.
+
+    ``series_index`` is 0 for a bar widget and the domain position for a radar
+    one. A day counts as active when the bar value, or the domain's net change,
+    is above zero. Days are only folded in once they are over, so today's
+    entry, which can still change, is added when the analytics are read.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    widget_id = db.Column(db.Integer, db.ForeignKey("dashboard_widget.id"), nullable=False)
+    series_index = db.Column(db.Integer, nullable=False)
+    first_day = db.Column(db.Date, nullable=False)
+    through_day = db.Column(db.Date, nullable=False)
+    active_days = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    best_streak = db.Column(db.Integer, nullable=False, default=0)
+    trailing_streak = db.Column(db.Integer, nullable=False, default=0)
+
+    widget = db.relationship(
+        "DashboardWidget",
+        backref=db.backref("analytics", cascade="all, delete-orphan"),
+    )
+
+    __table_args__ = (db.UniqueConstraint("widget_id", "series_index", name="uq_widget_analytics_series"),)
+
+
+class SyncOperation(db.Model):
+    """The stored outcome of one client operation sent to ``/sync``, by idempotency key."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint("user_id", "key", name="uq_sync_operation_user_key"),)
+
+    def to_dict(self):
+        return {"key": self.key, "status": self.status, "error": self.error}
+
+
+class LeaderboardEntry(db.Model):
+    """A user's consistency score, kept current on every write.
+
+    One point per day with any logged activity plus the longest streak of
+    consecutive active days. Neither changes because time passed, so a rank
+    only moves when someone writes. Every score change goes through
+    ``move_leaderboard_score`` to keep the rank tree in step.
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    active_days = db.Column(db.Integer, nullable=False, default=0)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    best_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_active_day = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship(
+        "User",
+        backref=db.backref("leaderboard_entry", uselist=False, cascade="all, delete-orphan"),
+    )
+
+    __table_args__ = (db.Index("ix_leaderboard_entry_rank", score.desc(), user_id),)
+
+    def to_dict(self, rank):
+        streak_alive = self.last_active_day is not None and self.last_active_day >= current_day() - timedelta(days=1)
+        return {
+            "rank": rank,
+            "username": self.user.username,
+            "score": self.score,
+            "tier": rank_tier(self.score),
+            "active_days": self.active_days,
+            "current_streak": self.current_streak if streak_alive else 0,
+            "best_streak": self.best_streak,
         }
 
 
+# Scores from this value up share the tree's top slot.
+LEADERBOARD_RANK_TREE_SIZE = 2**20
+
+
+class LeaderboardRankNode(db.Model):
+    """A node of a Fenwick tree counting leaderboard users by score.
+
+    Node ``i`` counts the users whose score plus one lies in
+    ``(i - (i & -i), i]``. The users at or below a score are the sum of at most
+    20 nodes, a score change updates as many, and the last node counts
+    everyone, so a rank never needs a scan of the users ahead.
+    """
+
+    node = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    users = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ShardAssignment(db.Model):
+    """Which shard database holds a user's widgets.
+
+    Users without a row keep theirs in the main database. ``moving`` is set
+    while ``flask move-user`` copies them, and their requests are refused
+    until the copy is done.
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    shard = db.Column(db.String(40), nullable=True)
+    moving = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class WidgetIdCounter(db.Model):
+    """The last dashboard widget id handed out while sharding is on, in a single row.
+
+    Widget ids appear in URLs and events and are kept when a user is moved to
+    another shard, so no two shards may ever reuse one.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Everything that belongs to one user's widgets; these tables exist in every
+# shard database and their rows move together when a user changes shard.
+SHARDED_MODELS = (
+    DashboardWidget,
+    RadarWidgetData,
+    RadarDomain,
+    RadarDailyAdjustment,
+    RadarScoreSnapshot,
+    BarWidgetData,
+    BarEntry,
+    PieWidgetData,
+    PieCategory,
+    PieEntry,
+    PieRollup,
+    WidgetAnalytics,
+    SyncOperation,
+)
+SHARDED_TABLES = frozenset(model.__table__ for model in SHARDED_MODELS)
+
+
+def migrate_widget_configs():
+    """Move radar and pie configs from their legacy JSON columns into per-row tables.
+
+    Each migrated row gets its JSON emptied, so this only does work once per
+    widget. If another worker migrated the same rows concurrently, the unique
+    constraints reject the duplicates and this run is rolled back.
+    """
+    radars = RadarWidgetData.query.filter(RadarWidgetData.legacy_domains != "[]").all()
+    for radar in radars:
+        scores = json.loads(radar.legacy_scores)
+        db.session.add_all(
+            RadarDomain(
+                widget_id=radar.widget_id,
+                position=index,
+                name=name,
+                score=float(scores[index]) if index < len(scores) else 0.0,
+            )
+            for index, name in enumerate(json.loads(radar.legacy_domains))
+        )
+        radar.legacy_domains = radar.legacy_scores = "[]"
+
+    pies = PieWidgetData.query.filter(PieWidgetData.legacy_categories != "[]").all()
+    for pie in pies:
+        db.session.add_all(
+            PieCategory(widget_id=pie.widget_id, position=index, name=name)
+            for index, name in enumerate(json.loads(pie.legacy_categories))
+        )
+        pie.legacy_categories = "[]"
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply ``SQLITE_PRAGMAS`` to a freshly opened SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config["SQLITE_PRAGMAS"].items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def shard_names():
+    """Every database that can hold widgets: the main one, as None, then each shard."""
+    return [None, *app.config["SQLALCHEMY_BINDS"]]
+
+
+def shard_metadata():
+    """The sharded tables as they are created in a shard database.
+
+    Foreign keys into tables that only the main database has, such as
+    ``user``, are left out.
+    """
+    metadata = db.MetaData()
+    shard_table_names = {table.name for table in SHARDED_TABLES}
+    for table in db.metadata.sorted_tables:
+        if table not in SHARDED_TABLES:
+            continue
+        shard_table = table.to_metadata(metadata)
+        for constraint in list(shard_table.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split(".")[0] not in shard_table_names:
+                shard_table.constraints.discard(constraint)
+                for element in constraint.elements:
+                    element.parent.foreign_keys.discard(element)
+                    shard_table.foreign_keys.discard(element)
+    return metadata
+
+
+def seed_widget_id_counter():
+    """Make sure widget ids handed out from now on are above every id the main database used."""
+    highest = db.session.query(db.func.max(DashboardWidget.id)).scalar() or 0
+    counter = db.session.get(WidgetIdCounter, 1)
+    if counter is None:
+        db.session.add(WidgetIdCounter(id=1, last_id=highest))
+    elif counter.last_id < highest:
+        counter.last_id = highest
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+
+def rank_tree_path(score):
+    """The rank tree node of ``score`` and the nodes above it, which all count a user at that score."""
+    index = min(score, LEADERBOARD_RANK_TREE_SIZE - 1) + 1
+    while index <= LEADERBOARD_RANK_TREE_SIZE:
+        yield index
+        index += index & -index
+
+
+def rank_tree_prefix(score):
+    """The rank tree nodes whose sum is the number of users scoring at most ``score``."""
+    index = min(score, LEADERBOARD_RANK_TREE_SIZE - 1) + 1
+    while index > 0:
+        yield index
+        index -= index & -index
+
+
+def rebuild_leaderboard_rank_tree():
+    """Refill the rank tree from the stored scores; the caller commits."""
+    LeaderboardRankNode.query.delete()
+    nodes = defaultdict(int)
+    for score, users in db.session.query(LeaderboardEntry.score, db.func.count()).group_by(LeaderboardEntry.score):
+        for node in rank_tree_path(score):
+            nodes[node] += users
+    if nodes:
+        rows = [{"node": node, "users": users} for node, users in nodes.items()]
+        db.session.execute(db.insert(LeaderboardRankNode), rows)
+
+
+def seed_leaderboard_rank_tree():
+    """Build the rank tree once for leaderboards stored before it existed."""
+    if db.session.query(LeaderboardRankNode.node).first() or not db.session.query(LeaderboardEntry.user_id).first():
+        return
+    rebuild_leaderboard_rank_tree()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker seeded it at the same time.
+        db.session.rollback()
+
+
+def allocate_widget_id():
+    """A new widget id unique across shards, or None to let the database pick one when unsharded."""
+    if not app.config["DATABASE_SHARDS"]:
+        return None
+    counter = WidgetIdCounter.__table__
+    with db.engine.begin() as connection:
+        return connection.execute(
+            counter.update()
+            .where(counter.c.id == 1)
+            .values(last_id=counter.c.last_id + 1)
+            .returning(counter.c.last_id)
+        ).scalar_one()
+
+
 with app.app_context():
+    for engine in db.engines.values():
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", apply_sqlite_pragmas)
     db.create_all()
+    sync_schema(db.engine, db.metadata.sorted_tables)
+    if app.config["DATABASE_SHARDS"]:
+        shard_tables = shard_metadata()
+        for name in shard_names()[1:]:
+            shard_tables.create_all(db.engines[name])
+            sync_schema(db.engines[name], shard_tables.sorted_tables)
+        seed_widget_id_counter()
+    seed_leaderboard_rank_tree()
+    migrate_widget_configs()
+
+
+def upsert_rows(model, rows, index_elements, update_columns, increment=False):
+    """Insert ``rows`` or update the ones clashing on ``index_elements``, in one statement.
+
+    With ``increment`` the update adds the new values to the stored ones
+    instead of replacing them.
+    """
+    if not rows:
+        return
+
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(model)
+    if increment:
+        values = {name: getattr(model, name) + statement.excluded[name] for name in update_columns}
+    else:
+        values = {name: statement.excluded[name] for name in update_columns}
+    db.session.execute(
+        statement.on_conflict_do_update(index_elements=index_elements, set_=values),
+        rows,
+    )
+
+
+def insert_missing_row(model, values, index_elements):
+    """Insert one row unless a row clashing on ``index_elements`` exists; returns whether it was inserted.
+
+    Concurrent callers inserting the same row don't fail: the database lets
+    one insert through and the others find the row already there.
+    """
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(model).values(**values).on_conflict_do_nothing(index_elements=index_elements)
+    return db.session.execute(statement).rowcount == 1
+
+
+class LRUCache:
+    """A thread-safe, size-bounded LRU mapping with hit/miss counters.
+
+    With ``ttl`` (in seconds) entries also expire on their own.
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Keyed by the user's dashboard version, which every write bumps in the same
+# transaction, so any worker or CLI writer invalidates it and stale payloads
+# simply age out.
+dashboard_cache = LRUCache(app.config["DASHBOARD_CACHE_SIZE"])
+leaderboard_cache = LRUCache(app.config["LEADERBOARD_CACHE_SIZE"], ttl=app.config["LEADERBOARD_CACHE_SECONDS"])
+# Keyed by widget version, which every entry write bumps, so stale buckets are
+# never read and simply age out.
+bar_series_cache = LRUCache(app.config["BAR_SERIES_CACHE_SIZE"])
+
+
+class DiskCache:
+    """A size-bounded directory of files named by the hash of their cache key.
+
+    Reads touch a file's mtime, so eviction removes the least recently used
+    files first. Each process keeps a running total of the directory size and
+    rescans the directory once that total passes ``max_bytes``, so several
+    workers can share one directory.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        try:
+            with open(self.path(name), "rb") as cached:
+                data = cached.read()
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def set(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written aside and renamed, so readers never see half a file.
+        temp_path = f"{self.path(name)}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, self.path(name))
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return [
+                    (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                    for entry in entries
+                    if entry.is_file() and not entry.name.endswith(".tmp")
+                ]
+        except FileNotFoundError:
+            return []
+
+    def _evict(self):
+        """Remove the least recently used files until the directory is under 90% of ``max_bytes``."""
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass  # Another worker evicted it first.
+            total -= size
+        self._size = total
+
+    def stats(self):
+        files = self._scan()
+        with self._lock:
+            return {
+                "entries": len(files),
+                "bytes": sum(size for _, size, _ in files),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+snapshot_cache = DiskCache(app.config["SNAPSHOT_CACHE_DIR"], app.config["SNAPSHOT_CACHE_MAX_BYTES"])
+
+
+def invalidate_dashboard(user_id):
+    """Bump a user's dashboard version as part of a write; call it before committing.
+
+    The version lives in the database, so the change reaches the dashboard
+    caches and ETags of every worker, and a payload that was being built while
+    the write happened is stored under the old version, which is never read
+    again. With shards the user row is in the main database, so the bump
+    commits alongside the shard's write rather than atomically with it.
+    """
+    User.query.filter(User.id == user_id).update(
+        {User.dashboard_version: User.dashboard_version + 1}, synchronize_session=False
+    )
+
+
+class HashingBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+
+hash_executor = None
+hash_executor_lock = threading.Lock()
+hash_slots = threading.BoundedSemaphore(app.config["PASSWORD_HASH_QUEUE"])
+
+
+def run_hash_job(function, *args):
+    """Run a password hashing function on the hashing process pool.
+
+    The pool is started on first use. At most ``PASSWORD_HASH_QUEUE`` jobs
+    may be queued or running at once; past that ``HashingBusy`` is raised
+    instead of letting hash work pile up behind the request threads.
+    """
+    global hash_executor
+    if app.config["PASSWORD_HASH_WORKERS"] == 0:
+        return function(*args)
+    if not hash_slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        with hash_executor_lock:
+            if hash_executor is None:
+                hash_executor = ProcessPoolExecutor(max_workers=app.config["PASSWORD_HASH_WORKERS"])
+        return hash_executor.submit(function, *args).result(timeout=app.config["PASSWORD_HASH_TIMEOUT"])
+    except FutureTimeoutError:
+        raise HashingBusy() from None
+    finally:
+        hash_slots.release()
+
+
+class RateLimiter:
+    """A thread-safe sliding-window counter of attempts per key.
+
+    Only the ``max_keys`` most recently used keys are tracked.
+    """
+
+    def __init__(self, window, max_keys=10000):
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit):
+        """Count an attempt; returns the seconds to wait if ``key`` is over ``limit``, else 0."""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.pop(key, None) or deque()
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            self._attempts[key] = attempts
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+            if len(attempts) >= limit:
+                return int(attempts[0] + self.window - now) + 1
+            attempts.append(now)
+            return 0
+
+
+auth_rate_limiter = RateLimiter(app.config["AUTH_RATE_WINDOW_SECONDS"])
+
+
+def throttle_auth(username):
+    """Count a login or registration attempt; returns a 429 response if it is over the limits."""
+    retry_after = max(
+        auth_rate_limiter.hit(("ip", request.remote_addr), app.config["AUTH_RATE_LIMIT_PER_IP"]),
+        auth_rate_limiter.hit(("user", str(username).lower()), app.config["AUTH_RATE_LIMIT_PER_USERNAME"]),
+    )
+    if not retry_after:
+        return None
+    response = jsonify({"success": False, "message": "Too many attempts. Please wait a minute and try again."})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def hashing_busy_response():
+    response = jsonify({"success": False, "message": "The server is busy. Please try again in a moment."})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def prometheus_labels(**labels):
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class RequestMetrics:
+    """Thread-safe per-endpoint request and SQL counters, rendered for Prometheus.
+
+    Like the caches, the numbers are per process: each worker reports its own.
+    """
+
+    def __init__(self, buckets, slow_query_samples):
+        self.buckets = buckets
+        self.latency = {}
+        self.requests = defaultdict(int)
+        self.sql_statements = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+        self.slow_queries = deque(maxlen=slow_query_samples)
+        self._lock = threading.Lock()
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            counts, total = self.latency.get((endpoint, method), ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.latency[(endpoint, method)] = (counts, total + seconds)
+            self.requests[(endpoint, method, status)] += 1
+
+    def observe_query(self, endpoint, statement, seconds, slow):
+        with self._lock:
+            self.sql_statements[endpoint] += 1
+            self.sql_seconds[endpoint] += seconds
+            if slow:
+                self.slow_queries.append((endpoint, " ".join(statement.split())[:200], seconds))
+
+    def render(self, caches):
+        lines = [
+            "# HELP progvis_request_duration_seconds Request latency by endpoint.",
+            "# TYPE progvis_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (endpoint, method), (counts, total) in sorted(self.latency.items()):
+                cumulative = np.cumsum(counts).tolist()
+                for bound, count in zip([*map(str, self.buckets), "+Inf"], cumulative):
+                    labels = prometheus_labels(endpoint=endpoint, method=method, le=bound)
+                    lines.append(f"progvis_request_duration_seconds_bucket{labels} {count}")
+                labels = prometheus_labels(endpoint=endpoint, method=method)
+                lines.append(f"progvis_request_duration_seconds_sum{labels} {total:.6f}")
+                lines.append(f"progvis_request_duration_seconds_count{labels} {cumulative[-1]}")
+
+            lines += [
+                "# HELP progvis_requests_total Requests by endpoint and status code.",
+                "# TYPE progvis_requests_total counter",
+            ]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                labels = prometheus_labels(endpoint=endpoint, method=method, status=status)
+                lines.append(f"progvis_requests_total{labels} {count}")
+
+            lines += [
+                "# HELP progvis_sql_statements_total SQL statements executed by endpoint.",
+                "# TYPE progvis_sql_statements_total counter",
+            ]
+            for endpoint, count in sorted(self.sql_statements.items()):
+                lines.append(f"progvis_sql_statements_total{prometheus_labels(endpoint=endpoint)} {count}")
+            lines += [
+                "# HELP progvis_sql_duration_seconds_total Time spent in SQL statements by endpoint.",
+                "# TYPE progvis_sql_duration_seconds_total counter",
+            ]
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                labels = prometheus_labels(endpoint=endpoint)
+                lines.append(f"progvis_sql_duration_seconds_total{labels} {seconds:.6f}")
+
+            lines += [
+                "# HELP progvis_slow_query_seconds Duration of the most recent slow SQL statements.",
+                "# TYPE progvis_slow_query_seconds gauge",
+            ]
+            for endpoint, statement, seconds in self.slow_queries:
+                labels = prometheus_labels(endpoint=endpoint, statement=statement)
+                lines.append(f"progvis_slow_query_seconds{labels} {seconds:.6f}")
+
+        lines += [
+            "# HELP progvis_cache_entries Entries held by each in-process cache.",
+            "# TYPE progvis_cache_entries gauge",
+        ]
+        cache_stats = {name: cache.stats() for name, cache in caches.items()}
+        for name, stats in cache_stats.items():
+            lines.append(f"progvis_cache_entries{prometheus_labels(cache=name)} {stats['entries']}")
+        for counter in ("hits", "misses", "evictions"):
+            lines += [
+                f"# HELP progvis_cache_{counter}_total Cache {counter} by cache.",
+                f"# TYPE progvis_cache_{counter}_total counter",
+            ]
+            for name, stats in cache_stats.items():
+                lines.append(f"progvis_cache_{counter}_total{prometheus_labels(cache=name)} {stats[counter]}")
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics(LATENCY_BUCKETS, app.config["SLOW_QUERY_SAMPLES"])
+
+
+def metrics_endpoint():
+    if has_request_context():
+        return request.endpoint or "unmatched"
+    return "none"
+
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def discard_query_timer(exception_context):
+    """Drop the timer of a statement that raised, so the next one doesn't pick it up."""
+    connection = exception_context.connection
+    if exception_context.execution_context is None or connection is None:
+        return
+    if connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+    request_metrics.observe_query(
+        metrics_endpoint(), statement, seconds, seconds >= app.config["SLOW_QUERY_SECONDS"]
+    )
+    if has_request_context():
+        g.sql_statements = g.get("sql_statements", 0) + 1
+        g.sql_seconds = g.get("sql_seconds", 0.0) + seconds
+
+
+with app.app_context():
+    for engine in db.engines.values():
+        event.listen(engine, "before_cursor_execute", start_query_timer)
+        event.listen(engine, "after_cursor_execute", record_query)
+        event.listen(engine, "handle_error", discard_query_timer)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    """Record the request in the metrics and, if enabled, add a Server-Timing header.
+
+    Streamed bodies are timed up to the point the response starts, not until
+    the last chunk has been sent.
+    """
+    seconds = time.perf_counter() - g.get("request_started", time.perf_counter())
+    request_metrics.observe_request(metrics_endpoint(), request.method, response.status_code, seconds)
+    if app.config["SERVER_TIMING_HEADER"]:
+        sql_statements = g.get("sql_statements", 0)
+        sql_ms = g.get("sql_seconds", 0.0) * 1000
+        response.headers["Server-Timing"] = (
+            f'db;dur={sql_ms:.2f};desc="{sql_statements} queries", app;dur={seconds * 1000:.2f}'
+        )
+    return response
+
+
+class MemoryEventBroker:
+    """In-process pub/sub of per-user widget events with a short replay buffer.
+
+    Only clients connected to the same worker process see each other's events,
+    so deployments with several workers should use ``RedisEventBroker``.
+    """
+
+    def __init__(self, replay_size):
+        self.replay_size = replay_size
+        self._next_id = 1
+        self._recent = defaultdict(lambda: deque(maxlen=self.replay_size))
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event_type, data):
+        with self._lock:
+            event = (str(self._next_id), event_type, data)
+            self._next_id += 1
+            self._recent[user_id].append(event)
+            for subscriber in self._subscribers[user_id]:
+                subscriber.put(event)
+
+    def subscribe(self, user_id, last_event_id=None, events=None):
+        """Return a subscription that first replays the events after ``last_event_id``.
+
+        If that id has already left the replay buffer, the replay starts with a
+        ``resync`` event telling the client to reload instead. Events are handed
+        to ``events.put()``; by default a ``queue.Queue`` read by ``get()``.
+        """
+        subscription = queue.Queue() if events is None else events
+        with self._lock:
+            if last_event_id is not None:
+                recent = self._recent[user_id]
+                valid = last_event_id.isascii() and last_event_id.isdigit()
+                # An id this process never handed out comes from before a
+                # restart, when the counter began again at 1.
+                if not valid or int(last_event_id) >= self._next_id or (
+                    recent and int(recent[0][0]) > int(last_event_id) + 1
+                ):
+                    subscription.put((str(self._next_id - 1), "resync", {}))
+                else:
+                    for event in recent:
+                        if int(event[0]) > int(last_event_id):
+                            subscription.put(event)
+            self._subscribers[user_id].add(subscription)
+        return MemorySubscription(self, user_id, subscription)
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            self._subscribers[user_id].discard(subscription)
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+
+class MemorySubscription:
+    def __init__(self, broker, user_id, events):
+        self.broker = broker
+        self.user_id = user_id
+        self.events = events
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds for events; returns them all, or an empty list."""
+        try:
+            events = [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.broker.unsubscribe(self.user_id, self.events)
+
+
+class RedisEventBroker:
+    """Per-user widget events kept in capped Redis streams, shared by every worker.
+
+    Stream entry ids double as SSE event ids, so reconnecting clients resume
+    with ``XREAD`` from their ``Last-Event-ID``.
+    """
+
+    def __init__(self, url, replay_size):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("EVENT_BROKER_URL points at Redis, but the redis package is not installed.") from None
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.replay_size = replay_size
+
+    def stream_key(self, user_id):
+        return f"progvis:events:{user_id}"
+
+    def publish(self, user_id, event_type, data):
+        self.client.xadd(
+            self.stream_key(user_id),
+            {"type": event_type, "data": json.dumps(data)},
+            maxlen=self.replay_size,
+            approximate=True,
+        )
+
+    def subscribe(self, user_id, last_event_id=None):
+        return RedisSubscription(self, user_id, last_event_id)
+
+
+STREAM_ID_PATTERN = re.compile(r"([0-9]+)-([0-9]+)")
+
+
+class RedisSubscription:
+    def __init__(self, broker, user_id, last_event_id):
+        self.broker = broker
+        self.key = broker.stream_key(user_id)
+        self.pending = []
+        # Read from the newest entry's id rather than "$", which XREAD would
+        # resolve afresh on every call and so skip what arrived in between.
+        latest = broker.client.xrevrange(self.key, count=1)
+        self.last_id = latest[0][0] if latest else "0-0"
+        if last_event_id:
+            requested = self.stream_id(last_event_id)
+            first = broker.client.xrange(self.key, count=1)
+            if (
+                requested is None
+                or requested > self.stream_id(self.last_id)
+                or (first and self.stream_id(first[0][0]) > requested)
+            ):
+                self.pending.append((self.last_id, "resync", {}))
+            else:
+                self.last_id = "-".join(map(str, requested))
+
+    @staticmethod
+    def stream_id(value):
+        """``(milliseconds, sequence)`` of a stream entry id, or None if it is not one."""
+        match = STREAM_ID_PATTERN.fullmatch(value)
+        return (int(match[1]), int(match[2])) if match else None
+
+    def get(self, timeout):
+        if self.pending:
+            events, self.pending = self.pending, []
+            return events
+        response = self.broker.client.xread({self.key: self.last_id}, block=int(timeout * 1000), count=100)
+        events = []
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                events.append((entry_id, fields["type"], json.loads(fields["data"])))
+                self.last_id = entry_id
+        return events
+
+    def close(self):
+        pass
+
+
+def create_event_broker():
+    url = app.config["EVENT_BROKER_URL"]
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisEventBroker(url, app.config["EVENT_REPLAY_SIZE"])
+    return MemoryEventBroker(app.config["EVENT_REPLAY_SIZE"])
+
+
+event_broker = create_event_broker()
+
+
+def publish_widget_event(user_id, event_type, data):
+    """Tell the user's other tabs and devices about a committed change.
+
+    The change is already saved, so a broker failure is logged rather than
+    turned into an error response; the clients catch up on their next reload.
+    """
+    try:
+        event_broker.publish(user_id, event_type, data)
+    except Exception:
+        app.logger.exception("Could not publish %s event", event_type)
+
+
+def hashed_shard(user_id):
+    """The shard a new user is placed on, spread evenly and the same in every process."""
+    shard_count = app.config["DATABASE_SHARDS"]
+    return f"shard{zlib.crc32(str(user_id).encode()) % shard_count}"
+
+
+def shard_assignments(user_ids):
+    """The shard of each user, keyed by user id; users on the main database map to None."""
+    assignments = dict.fromkeys(user_ids)
+    if app.config["DATABASE_SHARDS"]:
+        rows = db.session.query(ShardAssignment.user_id, ShardAssignment.shard).filter(
+            ShardAssignment.user_id.in_(user_ids)
+        )
+        assignments.update(rows)
+    return assignments
+
+
+@contextmanager
+def using_shard(shard):
+    """Route widget queries to ``shard`` inside the block."""
+    token = current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        current_shard.reset(token)
+
+
+def each_shard():
+    """Run the caller's loop body once per database holding widgets, routed to it.
+
+    Ids of the tables other than ``dashboard_widget`` repeat across shards, so
+    the session forgets the loaded objects before moving on to the next one.
+    """
+    for shard in shard_names():
+        with using_shard(shard):
+            yield shard
+        db.session.expunge_all()
+
+
+@app.before_request
+def select_user_shard():
+    if not app.config["DATABASE_SHARDS"] or "user_id" not in session:
+        return None
+    assignment = db.session.get(ShardAssignment, session["user_id"])
+    if assignment is not None and assignment.moving:
+        response = jsonify({"error": "Your data is being moved to another database. Try again in a moment."})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    # Kept on g rather than in current_shard so that streamed responses, which
+    # run after the request's teardown, still reach the same database.
+    g.user_shard = assignment.shard if assignment else None
+    return None
+
+
+@app.errorhandler(413)
+def request_too_large(exc):
+    limit_mib = app.config["MAX_CONTENT_LENGTH"] / (1024 * 1024)
+    return jsonify({"error": f"The request body must not exceed {limit_mib:g} MiB."}), 413
 
 
 def login_required(f):
@@ -206,10 +1556,119 @@ def login_required(f):
     return decorated_function
 
 
+RADAR_DAILY_LIMIT = 1
+# With ?dates=compact, dates are sent as days since the epoch and timestamps as
+# seconds since it.
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+MAX_PIE_HOURS = 24
+IMPORT_CHUNK_SIZE = 2000
+EXPORT_FETCH_SIZE = 1000
+EXPORT_BUFFER_BYTES = 64 * 1024
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_CSV_FIELDS = ("record", "widget_id", "widget_type", "title", "date", "key", "value")
+RADAR_DECAY_INACTIVE_DAYS = 4
+RADAR_DECAY_FLOOR = 0.0
+CLI_CHUNK_SIZE = 500
+RADAR_COMPARE_DAYS = 20
+MAX_RADAR_COMPARE_DAYS = 3650
+PIE_TOTAL_INDEX = -1
+PIE_PERIODS = ("week", "month")
+ANALYTICS_WIDGET_TYPES = ("bar", "radar")
+ANALYTICS_AVERAGE_SPANS = (7, 30)
+ANALYTICS_SERIES_DAYS = 30
+ANALYTICS_TREND_DAYS = 90
+ANALYTICS_RECENT_DAYS = 30
+RANK_TIERS = (
+    (730, "Obsidian"),
+    (365, "Diamond"),
+    (180, "Platinum"),
+    (90, "Gold"),
+    (30, "Silver"),
+    (7, "Bronze"),
+    (0, "Iron"),
+)
+LEADERBOARD_PAGE_SIZE = 20
+MAX_LEADERBOARD_PAGE_SIZE = 100
+MAX_LEADERBOARD_NEIGHBORS = 25
+BAR_WINDOW_DAYS = 30
+MAX_BAR_WINDOW_DAYS = 366
+BAR_HISTORY_PAGE_SIZE = 50
+BAR_SERIES_DAYS = 365
+MAX_BAR_SERIES_DAYS = 3660
+BAR_SERIES_POINTS = 120
+MAX_BAR_SERIES_POINTS = 1000
+BAR_SERIES_RESOLUTIONS = ("auto", "day", "week", "month", "lttb")
+BAR_BUCKET_RESOLUTIONS = ("week", "month")
+BAR_SERIES_AGGREGATES = ("sum", "mean", "max")
+MAX_BAR_HISTORY_PAGE_SIZE = 200
+MAX_SYNC_OPERATIONS = 100
+MAX_SYNC_KEY_LENGTH = 64
+SYNC_KEY_RETENTION_DAYS = 7
+# Widgets are ordered by sparse positions, so a move rewrites only the moved
+# row; see move_widget().
+POSITION_GAP = 1024
+SNAPSHOT_FORMATS = {"svg": "image/svg+xml", "png": "image/png"}
+SNAPSHOT_WIDTH = 640
+SNAPSHOT_HEIGHT = 400
+MIN_SNAPSHOT_SIZE = 200
+MAX_SNAPSHOT_SIZE = 2000
+# Part of every snapshot hash: bump it when the drawing code changes so images
+# rendered by the old code are no longer served.
+SNAPSHOT_RENDERER_VERSION = 1
+# Part of every dashboard ETag: bump it when the payload changes shape so
+# browsers do not revalidate copies in the old format.
+DASHBOARD_PAYLOAD_VERSION = 1
+SNAPSHOT_FONT = "Georgia, 'Times New Roman', serif"
+
+
 def current_day():
     return datetime.now().date()
 
 
+def parse_iso_date(raw_value):
+    try:
+        return datetime.strptime(raw_value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise ValueError("Dates must use the YYYY-MM-DD format.") from None
+
+
+def parse_int_arg(name, default, minimum, maximum):
+    raw_value = request.args.get(name)
+    if raw_value is None:
+        return default
+    try:
+        value = int(raw_value)
+    except ValueError:
+        raise ValueError(f'"{name}" must be a whole number.') from None
+    if value < minimum or value > maximum:
+        raise ValueError(f'"{name}" must be between {minimum} and {maximum}.')
+    return value
+
+
+def parse_window_days():
+    return parse_int_arg("days", BAR_WINDOW_DAYS, 1, MAX_BAR_WINDOW_DAYS)
+
+
+def wants_delta_response():
+    """Whether a mutation should answer with a compact delta (``?delta=1``) instead of the full widget."""
+    return request.args.get("delta") == "1"
+
+
+def wants_compact_dates():
+    """Whether dates should be sent as epoch days (``?dates=compact``) instead of ISO strings."""
+    return request.args.get("dates") == "compact"
+
+
+def bump_widget_version(widget):
+    """Count a change to the widget's data so clients can tell whether their copy is current."""
+    widget.version = DashboardWidget.version + 1
+
+
+def bar_window_start(days):
+    return current_day() - timedelta(days=days - 1)
+
+
 def sigmoid(x):
     return 1 / (1 + np.exp(-0.1 * x))
 
@@ -221,6 +1680,28 @@ def normalize_domains(raw_domains):
     return domains
 
 
+def parse_bar_value(raw_value):
+    try:
+        value = float(raw_value)
+    except (TypeError, ValueError):
+        raise ValueError("Please enter a valid number.") from None
+
+    if value < 0:
+        raise ValueError("Please enter a positive number.")
+    return value
+
+
+def parse_pie_hours(raw_value):
+    try:
+        hours = float(raw_value)
+    except (TypeError, ValueError):
+        raise ValueError("Please enter valid hour values.") from None
+
+    if hours < 0:
+        raise ValueError("Hours cannot be negative.")
+    return round(hours, 2)
+
+
 def normalize_pie_categories(raw_categories):
     categories = [category.strip() for category in raw_categories if category and category.strip()]
     if not categories:
@@ -243,19 +1724,178 @@ def normalize_pie_categories(raw_categories):
     return normalized
 
 
-def build_bar_series(entries, days=30):
-    today = current_day()
+def build_bar_series(entries, days=BAR_WINDOW_DAYS, compact=False):
+    """The daily values of the window; compact series carry the first day instead of a label per day."""
     value_map = {entry.date: entry.value for entry in entries}
-    start_day = today - timedelta(days=days - 1)
+    start_day = bar_window_start(days)
+    window = [start_day + timedelta(days=offset) for offset in range(days)]
+    values = [value_map.get(point_date, 0) for point_date in window]
+    if compact:
+        return {"start": start_day.toordinal() - EPOCH_ORDINAL, "values": values}
+    return {"labels": [f"{point_date.month:02d}-{point_date.day:02d}" for point_date in window], "values": values}
+
+
+def bar_bucket_ids(ordinals, resolution):
+    """The week or month bucket of each day ordinal; weeks start on Monday like the pie periods."""
+    if resolution == "week":
+        # Ordinal 1 (0001-01-01) is a Monday.
+        return (ordinals - 1) // 7
+    days = np.asarray(ordinals, dtype="int64") - EPOCH_ORDINAL
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype("int64")
+    return months + (EPOCH.year * 12 + EPOCH.month - 1)
+
+
+def bar_bucket_start_ordinals(bucket_ids, resolution):
+    if resolution == "week":
+        return bucket_ids * 7 + 1
+    months = (bucket_ids - (EPOCH.year * 12 + EPOCH.month - 1)).astype("datetime64[M]")
+    return months.astype("datetime64[D]").astype("int64") + EPOCH_ORDINAL
+
+
+def load_bar_buckets(widget):
+    """Weekly and monthly sums and maxima over a bar widget's whole history.
+
+    Built from a single query and cached per widget version, so any entry write
+    makes the next request rebuild them. Only buckets holding entries are kept.
+    """
+    cache_key = (widget.id, widget.version)
+    buckets = bar_series_cache.get(cache_key)
+    if buckets is not None:
+        return buckets
+
+    rows = (
+        BarEntry.query.with_entities(BarEntry.date, BarEntry.value)
+        .filter(BarEntry.widget_id == widget.id)
+        .order_by(BarEntry.date)
+        .all()
+    )
+    ordinals = np.array([row.date.toordinal() for row in rows], dtype="int64")
+    values = np.array([row.value for row in rows], dtype=float)
+    buckets = {}
+    for resolution in BAR_BUCKET_RESOLUTIONS:
+        bucket_ids = bar_bucket_ids(ordinals, resolution)
+        if not len(bucket_ids):
+            buckets[resolution] = (bucket_ids, values, values)
+            continue
+        bounds = np.flatnonzero(np.diff(bucket_ids, prepend=bucket_ids[0] - 1))
+        buckets[resolution] = (
+            bucket_ids[bounds],
+            np.add.reduceat(values, bounds),
+            np.maximum.reduceat(values, bounds),
+        )
+    bar_series_cache.set(cache_key, buckets)
+    return buckets
+
+
+def load_bar_days(widget, start, end):
+    """The daily values of a bar widget from ``start`` to ``end``, with 0 on days without an entry."""
+    rows = (
+        BarEntry.query.with_entities(BarEntry.date, BarEntry.value)
+        .filter(BarEntry.widget_id == widget.id, BarEntry.date >= start, BarEntry.date <= end)
+        .all()
+    )
+    values = np.zeros((end - start).days + 1)
+    offsets = np.array([(row.date - start).days for row in rows], dtype="int64")
+    values[offsets] = [row.value for row in rows]
+    return values
+
+
+def lttb_indices(values, threshold):
+    """Pick ``threshold`` points of a series with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept; every bucket in between contributes the
+    point spanning the largest triangle with the point picked before it and the
+    average of the next bucket, which keeps peaks and dips that plain averaging
+    would flatten.
+    """
+    count = len(values)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    edges = np.linspace(1, count - 1, threshold - 1).astype("int64")
+    picked = np.empty(threshold, dtype="int64")
+    picked[0], picked[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        low, high = edges[bucket], edges[bucket + 1]
+        next_high = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_x = (high + next_high - 1) / 2
+        next_y = values[high:next_high].mean()
+        candidates = np.arange(low, high)
+        areas = np.abs(
+            (previous - next_x) * (values[candidates] - values[previous])
+            - (previous - candidates) * (next_y - values[previous])
+        )
+        previous = low + int(np.argmax(areas))
+        picked[bucket + 1] = previous
+    return picked
+
+
+def build_bar_resolution_series(widget, start, end, resolution, aggregate, points, compact=False):
+    """A bar widget's history from ``start`` to ``end`` at a resolution that fits ``points``.
+
+    ``auto`` picks the finest of day, week and month with at most ``points``
+    values and falls back to an LTTB selection of the days. Week and month
+    values cover whole buckets, so the first and last may reach past the range;
+    a bucket's mean spreads its sum over its calendar days up to today.
+    """
+    day_count = (end - start).days + 1
+    start_ordinal, end_ordinal = start.toordinal(), end.toordinal()
+    if resolution == "auto":
+        resolution = "lttb"
+        if day_count <= points:
+            resolution = "day"
+        else:
+            for bucket_resolution in BAR_BUCKET_RESOLUTIONS:
+                first, last = bar_bucket_ids(np.array([start_ordinal, end_ordinal]), bucket_resolution)
+                if last - first + 1 <= points:
+                    resolution = bucket_resolution
+                    break
+
+    if resolution in BAR_BUCKET_RESOLUTIONS:
+        first, last = bar_bucket_ids(np.array([start_ordinal, end_ordinal]), resolution)
+        bucket_ids = np.arange(first, last + 1)
+        held_ids, sums, maxima = load_bar_buckets(widget)[resolution]
+        low, high = np.searchsorted(held_ids, [first, last + 1])
+        values = np.zeros(len(bucket_ids))
+        values[held_ids[low:high] - first] = (maxima if aggregate == "max" else sums)[low:high]
+        ordinals = bar_bucket_start_ordinals(bucket_ids, resolution)
+        if aggregate == "mean":
+            bucket_ends = bar_bucket_start_ordinals(bucket_ids + 1, resolution)
+            bucket_ends = np.minimum(bucket_ends, current_day().toordinal() + 1)
+            values = values / np.maximum(bucket_ends - ordinals, 1)
+    else:
+        values = load_bar_days(widget, start, end)
+        ordinals = np.arange(start_ordinal, end_ordinal + 1)
+        if resolution == "lttb":
+            picked = lttb_indices(values, points)
+            values, ordinals = values[picked], ordinals[picked]
+        aggregate = None
+
+    if compact:
+        dates = (ordinals - EPOCH_ORDINAL).tolist()
+    else:
+        dates = [date.fromordinal(ordinal).isoformat() for ordinal in ordinals.tolist()]
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "resolution": resolution,
+        "aggregate": aggregate,
+        "dates": dates,
+        "values": values.tolist(),
+    }
 
-    labels = []
-    values = []
-    for offset in range(days):
-        point_date = start_day + timedelta(days=offset)
-        labels.append(point_date.strftime("%m-%d"))
-        values.append(value_map.get(point_date, 0))
 
-    return {"labels": labels, "values": values}
+def group_rows_by_widget(rows):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.widget_id].append(row)
+    return grouped
+
+
+def build_radar_deltas(adjustments, domain_count):
+    delta_map = {item.domain_index: item.delta for item in adjustments}
+    return [delta_map.get(index, 0) for index in range(domain_count)]
 
 
 def get_today_radar_adjustments(widget, domain_count):
@@ -265,14 +1905,217 @@ def get_today_radar_adjustments(widget, domain_count):
         .order_by(RadarDailyAdjustment.domain_index)
         .all()
     )
-    delta_map = {item.domain_index: item.delta for item in adjustments}
-    return [delta_map.get(index, 0) for index in range(domain_count)]
+    return build_radar_deltas(adjustments, domain_count)
+
+
+def find_decay_steps(active, anchors):
+    """Mark the days each domain loses a point over a block of evaluated days.
+
+    ``active`` is a ``(days, domains)`` boolean matrix of the days a domain got
+    a +1, and ``anchors`` holds, per domain, the offset of its last active day
+    before the block (always negative). A domain loses a point on every
+    ``RADAR_DECAY_INACTIVE_DAYS``-th day in a row without activity. Returns a
+    boolean matrix shaped like ``active``.
+    """
+    day_index = np.arange(active.shape[0])[:, None]
+    last_active = np.where(active, day_index, anchors[None, :])
+    last_active = np.maximum.accumulate(last_active, axis=0)
+    gap = day_index - last_active
+    return (gap > 0) & (gap % RADAR_DECAY_INACTIVE_DAYS == 0)
+
+
+def apply_radar_decay(radar_rows):
+    """Catch up the inactivity decay of radar widgets up to yesterday.
+
+    Each widget remembers the last day it was evaluated, so calling this again
+    on the same day is a no-op, and catching up any number of missed days costs
+    two queries for the whole batch. Today is never evaluated since the user
+    can still log it. A score snapshot is written for every day a step
+    landed on, and the widget's version is bumped. Decay stops at zero: it
+    never takes a score below it, and a score the user already took below
+    zero is left alone. The widgets must have their ``widget`` relationship
+    loaded. Returns the radars whose scores changed; the caller commits and
+    invalidates the dashboards of their users.
+    """
+    yesterday = current_day() - timedelta(days=1)
+    base_days = {}
+    for radar in radar_rows:
+        created_on = radar.widget.created_at.date()
+        base_day = max(radar.decay_evaluated_on or created_on, created_on)
+        if base_day < yesterday:
+            base_days[radar.widget_id] = base_day
+        elif radar.decay_evaluated_on is None:
+            radar.decay_evaluated_on = base_day
+
+    if not base_days:
+        return []
+
+    widget_ids = list(base_days)
+    anchor_rows = (
+        db.session.query(
+            RadarDailyAdjustment.widget_id,
+            RadarDailyAdjustment.domain_index,
+            db.func.max(RadarDailyAdjustment.entry_date),
+        )
+        .join(RadarWidgetData, RadarWidgetData.widget_id == RadarDailyAdjustment.widget_id)
+        .filter(
+            RadarDailyAdjustment.widget_id.in_(widget_ids),
+            RadarDailyAdjustment.delta > 0,
+            RadarDailyAdjustment.entry_date <= RadarWidgetData.decay_evaluated_on,
+        )
+        .group_by(RadarDailyAdjustment.widget_id, RadarDailyAdjustment.domain_index)
+        .all()
+    )
+    activity_rows = (
+        db.session.query(
+            RadarDailyAdjustment.widget_id,
+            RadarDailyAdjustment.domain_index,
+            RadarDailyAdjustment.entry_date,
+        )
+        .filter(
+            RadarDailyAdjustment.widget_id.in_(widget_ids),
+            RadarDailyAdjustment.delta > 0,
+            RadarDailyAdjustment.entry_date > min(base_days.values()),
+            RadarDailyAdjustment.entry_date <= yesterday,
+        )
+        .all()
+    )
+    anchors_by_widget = group_rows_by_widget(anchor_rows)
+    activity_by_widget = group_rows_by_widget(activity_rows)
+
+    changed = []
+    snapshot_rows = []
+    for radar in radar_rows:
+        base_day = base_days.get(radar.widget_id)
+        if base_day is None:
+            continue
 
+        scores = np.array(radar.get_scores(), dtype=float)
+        day_count = (yesterday - base_day).days
+        anchors = np.full(len(scores), (radar.widget.created_at.date() - base_day).days)
+        for _, domain_index, anchor_day in anchors_by_widget[radar.widget_id]:
+            if domain_index < len(scores):
+                # Imported gains may predate the widget; decay starts at creation.
+                anchors[domain_index] = max(anchors[domain_index], (anchor_day - base_day).days)
+        active = np.zeros((day_count, len(scores)), dtype=bool)
+        for _, domain_index, entry_date in activity_by_widget[radar.widget_id]:
+            if entry_date > base_day and domain_index < len(scores):
+                active[(entry_date - base_day).days - 1, domain_index] = True
+
+        # Offsets are relative to the first evaluated day, the day after base_day.
+        steps = find_decay_steps(active, anchors - 1)
+        step_days = np.flatnonzero(steps.any(axis=1))
+        if step_days.size:
+            # Scores only went down since base_day, so clamping the running
+            # total matches clamping after every single step.
+            floor = np.minimum(scores, RADAR_DECAY_FLOOR)
+            history = np.maximum(scores - np.cumsum(steps, axis=0), floor)
+            for offset in step_days:
+                snapshot_rows.append(
+                    {
+                        "widget_id": radar.widget_id,
+                        "snapshot_date": base_day + timedelta(days=int(offset) + 1),
+                        "scores": json.dumps(history[offset].tolist()),
+                    }
+                )
+            radar.set_scores(history[-1].tolist())
+            bump_widget_version(radar.widget)
+            changed.append(radar)
+        radar.decay_evaluated_on = yesterday
 
-def serialize_radar_widget(widget):
+    upsert_rows(RadarScoreSnapshot, snapshot_rows, ["widget_id", "snapshot_date"], ["scores"])
+    return changed
+
+
+def apply_radar_decay_for_user(user_id):
+    """Bring every radar of a user up to date before it is read."""
+    radar_rows = (
+        RadarWidgetData.query.join(DashboardWidget)
+        .options(joinedload(RadarWidgetData.widget).selectinload(DashboardWidget.radar_domains))
+        .filter(
+            DashboardWidget.user_id == user_id,
+            db.or_(
+                RadarWidgetData.decay_evaluated_on.is_(None),
+                RadarWidgetData.decay_evaluated_on < current_day() - timedelta(days=1),
+            ),
+        )
+        .all()
+    )
+    if radar_rows:
+        if apply_radar_decay(radar_rows):
+            invalidate_dashboard(user_id)
+        db.session.commit()
+
+
+def record_radar_snapshot(radar, scores):
+    """Store ``scores`` as the end-of-day state of today for a radar widget."""
+    upsert_rows(
+        RadarScoreSnapshot,
+        [{"widget_id": radar.widget_id, "snapshot_date": current_day(), "scores": json.dumps(scores)}],
+        ["widget_id", "snapshot_date"],
+        ["scores"],
+    )
+
+
+def get_radar_snapshot_scores(widget_ids, day):
+    """Return the scores each radar had at the end of ``day``, keyed by widget id.
+
+    A single query picks, per widget, the latest snapshot on or before ``day``
+    through the ``(widget_id, snapshot_date)`` index. Widgets without such a
+    snapshot had not moved from their initial all-zero scores yet and are left
+    out of the result.
+    """
+    if not widget_ids:
+        return {}
+
+    latest = (
+        db.session.query(
+            RadarScoreSnapshot.widget_id,
+            db.func.max(RadarScoreSnapshot.snapshot_date).label("snapshot_date"),
+        )
+        .filter(
+            RadarScoreSnapshot.widget_id.in_(widget_ids),
+            RadarScoreSnapshot.snapshot_date <= day,
+        )
+        .group_by(RadarScoreSnapshot.widget_id)
+        .subquery()
+    )
+    snapshots = RadarScoreSnapshot.query.join(
+        latest,
+        db.and_(
+            RadarScoreSnapshot.widget_id == latest.c.widget_id,
+            RadarScoreSnapshot.snapshot_date == latest.c.snapshot_date,
+        ),
+    )
+    return {snapshot.widget_id: snapshot.get_scores() for snapshot in snapshots}
+
+
+def parse_compare_day():
+    raw_date = request.args.get("compare_date")
+    if raw_date:
+        return parse_iso_date(raw_date)
+    days = parse_int_arg("compare_days", RADAR_COMPARE_DAYS, 1, MAX_RADAR_COMPARE_DAYS)
+    return current_day() - timedelta(days=days)
+
+
+def serialize_radar_widget(widget, adjustments=None, compare_scores=None, compare_day=None, compact=False):
+    """Serialize a radar widget along with its scores as of ``compare_day``.
+
+    ``compare_scores`` may be passed in when the snapshot was already fetched;
+    ``compare_day`` defaults to ``RADAR_COMPARE_DAYS`` days ago.
+    """
     domains = widget.radar_data.get_domains()
     scores = widget.radar_data.get_scores()
-    daily_deltas = get_today_radar_adjustments(widget, len(domains))
+    if adjustments is None:
+        daily_deltas = get_today_radar_adjustments(widget, len(domains))
+    else:
+        daily_deltas = build_radar_deltas(adjustments, len(domains))
+    if compare_day is None:
+        compare_day = current_day() - timedelta(days=RADAR_COMPARE_DAYS)
+    if compare_scores is None:
+        compare_scores = get_radar_snapshot_scores([widget.id], compare_day).get(widget.id)
+    if compare_scores is None:
+        compare_scores = [0.0] * len(domains)
     return {
         **widget.to_dict(),
         "config": {
@@ -283,22 +2126,61 @@ def serialize_radar_widget(widget):
         "plot": {
             "theta": domains,
             "r": [100 * sigmoid(score) for score in scores],
+            "comparison": {
+                "date": compare_day.toordinal() - EPOCH_ORDINAL if compact else compare_day.isoformat(),
+                "scores": compare_scores,
+                "r": [100 * sigmoid(score) for score in compare_scores],
+            },
         },
     }
 
 
-def serialize_bar_widget(widget):
-    entries = sorted(widget.bar_entries, key=lambda item: item.date)
+def get_bar_window_entries(widget, days=BAR_WINDOW_DAYS):
+    return (
+        BarEntry.query.filter(
+            BarEntry.widget_id == widget.id,
+            BarEntry.date >= bar_window_start(days),
+        )
+        .order_by(BarEntry.date)
+        .all()
+    )
+
+
+def serialize_bar_widget(widget, entries=None, days=BAR_WINDOW_DAYS, compact=False):
+    """Serialize a bar widget with only the entries of its last ``days`` days.
+
+    Older entries are served page by page from ``/widgets/<id>/bar/history``.
+    """
+    if entries is None:
+        entries = get_bar_window_entries(widget, days)
+    entries = sorted(entries, key=lambda item: item.date)
     today_entry = next((entry for entry in entries if entry.date == current_day()), None)
     return {
         **widget.to_dict(),
         "config": widget.bar_data.to_dict(),
-        "entries": [entry.to_dict() for entry in entries],
-        "today_entry": today_entry.to_dict() if today_entry else None,
-        "series": build_bar_series(entries),
+        "window_days": days,
+        "entries": [entry.to_dict(compact) for entry in entries],
+        "today_entry": today_entry.to_dict(compact) if today_entry else None,
+        "series": build_bar_series(entries, days, compact),
+    }
+
+
+def serialize_bar_delta(widget, day, entry):
+    """The part of a bar widget that a change to the entry of ``day`` touches."""
+    return {
+        "id": widget.id,
+        "version": widget.version,
+        "date": day.isoformat(),
+        "entry": entry.to_dict() if entry else None,
+        "point": {"label": f"{day.month:02d}-{day.day:02d}", "value": entry.value if entry else 0},
     }
 
 
+def build_pie_values(entries, category_count):
+    entry_map = {item.category_index: item.hours for item in entries}
+    return [entry_map.get(index, 0) for index in range(category_count)]
+
+
 def get_today_pie_entries(widget, category_count):
     today = current_day()
     entries = (
@@ -306,8 +2188,7 @@ def get_today_pie_entries(widget, category_count):
         .order_by(PieEntry.category_index)
         .all()
     )
-    entry_map = {item.category_index: item.hours for item in entries}
-    return [entry_map.get(index, 0) for index in range(category_count)]
+    return build_pie_values(entries, category_count)
 
 
 def build_pie_plot(values):
@@ -323,9 +2204,520 @@ def build_pie_plot(values):
     }
 
 
-def serialize_pie_widget(widget):
+def pie_period_start(period, day):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def pie_period_end(period, period_start):
+    if period == "week":
+        return period_start + timedelta(days=6)
+    next_month = (period_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def build_pie_rollup_rows(widget_id, day, old_hours, new_hours):
+    """Turn one day's change of pie hours into increments for its week and month rollups."""
+    increments = []
+    for index, (old_value, new_value) in enumerate(zip(old_hours, new_hours)):
+        day_change = int(new_value > 0) - int(old_value > 0)
+        if new_value != old_value or day_change:
+            increments.append((index, new_value - old_value, day_change))
+
+    logged_change = int(any(value > 0 for value in new_hours)) - int(any(value > 0 for value in old_hours))
+    if increments or logged_change:
+        increments.append((PIE_TOTAL_INDEX, sum(new_hours) - sum(old_hours), logged_change))
+
+    return [
+        {
+            "widget_id": widget_id,
+            "period": period,
+            "period_start": pie_period_start(period, day),
+            "category_index": index,
+            "hours": hours,
+            "days": days,
+        }
+        for period in PIE_PERIODS
+        for index, hours, days in increments
+    ]
+
+
+def rebuild_pie_rollups(widget_ids):
+    """Recompute the week and month rollups of pie widgets from their daily entries."""
+    if not widget_ids:
+        return
+
+    PieRollup.query.filter(PieRollup.widget_id.in_(widget_ids)).delete(synchronize_session=False)
+    totals = defaultdict(lambda: [0.0, 0])
+    logged_days = set()
+    entries = (
+        db.session.query(PieEntry.widget_id, PieEntry.entry_date, PieEntry.category_index, PieEntry.hours)
+        .filter(PieEntry.widget_id.in_(widget_ids), PieEntry.hours > 0)
+        .yield_per(1000)
+    )
+    for widget_id, entry_date, category_index, hours in entries:
+        for period in PIE_PERIODS:
+            period_start = pie_period_start(period, entry_date)
+            for index in (category_index, PIE_TOTAL_INDEX):
+                total = totals[(widget_id, period, period_start, index)]
+                total[0] += hours
+                if index != PIE_TOTAL_INDEX:
+                    total[1] += 1
+            if (widget_id, period, entry_date) not in logged_days:
+                logged_days.add((widget_id, period, entry_date))
+                totals[(widget_id, period, period_start, PIE_TOTAL_INDEX)][1] += 1
+
+    upsert_rows(
+        PieRollup,
+        [
+            {
+                "widget_id": widget_id,
+                "period": period,
+                "period_start": period_start,
+                "category_index": index,
+                "hours": round(hours, 2),
+                "days": days,
+            }
+            for (widget_id, period, period_start, index), (hours, days) in totals.items()
+        ],
+        ["widget_id", "period", "period_start", "category_index"],
+        ["hours", "days"],
+    )
+
+
+def split_pie_range(start, end):
+    """Cover ``[start, end]`` with whole months, then whole weeks, then single days.
+
+    Weeks never run past the start of a month that fits the range entirely, so
+    a long range is mostly made of month rollups and only its ragged edges
+    fall back to weeks and raw daily entries.
+    """
+    months, weeks, days = [], [], []
+    day = start
+    while day <= end:
+        month_end = pie_period_end("month", pie_period_start("month", day))
+        if day.day == 1 and month_end <= end:
+            months.append(day)
+            day = month_end + timedelta(days=1)
+            continue
+
+        next_month = month_end + timedelta(days=1)
+        boundary = next_month if pie_period_end("month", next_month) <= end else end + timedelta(days=1)
+        if day.weekday() == 0 and day + timedelta(days=6) < boundary:
+            weeks.append(day)
+            day += timedelta(days=7)
+        else:
+            days.append(day)
+            day += timedelta(days=1)
+
+    return months, weeks, days
+
+
+def summarize_pie_range(widget, start, end):
+    """Aggregate a pie widget's hours per category between two days, inclusive."""
+    categories = widget.pie_data.get_categories()
+    months, weeks, days = split_pie_range(start, end)
+    hours = np.zeros(len(categories))
+    category_days = np.zeros(len(categories), dtype=int)
+    logged_days = 0
+
+    if months or weeks:
+        rollups = (
+            db.session.query(
+                PieRollup.category_index,
+                db.func.sum(PieRollup.hours),
+                db.func.sum(PieRollup.days),
+            )
+            .filter(
+                PieRollup.widget_id == widget.id,
+                db.or_(
+                    db.and_(PieRollup.period == "month", PieRollup.period_start.in_(months)),
+                    db.and_(PieRollup.period == "week", PieRollup.period_start.in_(weeks)),
+                ),
+            )
+            .group_by(PieRollup.category_index)
+        )
+        for category_index, total_hours, total_days in rollups:
+            if category_index == PIE_TOTAL_INDEX:
+                logged_days += total_days
+            elif category_index < len(categories):
+                hours[category_index] += total_hours
+                category_days[category_index] += total_days
+
+    if days:
+        daily_rows = (
+            db.session.query(
+                PieEntry.entry_date,
+                PieEntry.category_index,
+                db.func.sum(PieEntry.hours),
+            )
+            .filter(
+                PieEntry.widget_id == widget.id,
+                PieEntry.entry_date.in_(days),
+                PieEntry.hours > 0,
+            )
+            .group_by(PieEntry.entry_date, PieEntry.category_index)
+            .all()
+        )
+        logged_days += len({entry_date for entry_date, _, _ in daily_rows})
+        for _, category_index, total_hours in daily_rows:
+            if category_index < len(categories):
+                hours[category_index] += total_hours
+                category_days[category_index] += 1
+
+    tracked_hours = round(float(hours.sum()), 2)
+    wasted_hours = round(24 * logged_days - tracked_hours, 2)
+    average_hours = (hours / logged_days).round(2).tolist() if logged_days else [0.0] * len(categories)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "labels": categories + ["Wasted"],
+        "hours": hours.round(2).tolist() + [wasted_hours],
+        "category_days": category_days.tolist(),
+        "days_logged": logged_days,
+        "tracked_hours": tracked_hours,
+        "wasted_hours": wasted_hours,
+        "average_day": build_pie_plot(average_hours),
+    }
+
+
+def rank_tier(score):
+    return next(name for threshold, name in RANK_TIERS if score >= threshold)
+
+
+def lock_leaderboard_entry(user_id):
+    """A user's leaderboard row, created at score 0 if missing and locked until the caller commits.
+
+    Each score change moves the user in the rank tree from the score it read,
+    so two writes of the same user must not both start from the same row.
+    PostgreSQL holds the row with ``FOR UPDATE``; SQLite serializes writers
+    already, and the insert above it takes the write lock.
+    """
+    if insert_missing_row(
+        LeaderboardEntry,
+        {"user_id": user_id, "score": 0, "active_days": 0, "current_streak": 0, "best_streak": 0},
+        ["user_id"],
+    ):
+        move_leaderboard_score(None, 0)
+    return LeaderboardEntry.query.filter_by(user_id=user_id).with_for_update().populate_existing().one()
+
+
+def record_user_activity(user_id):
+    """Count today as an active day for the leaderboard; the caller commits.
+
+    Only the user's own row is touched, so keeping scores current costs the
+    same whatever the number of users.
+    """
+    today = current_day()
+    entry = lock_leaderboard_entry(user_id)
+    old_score = entry.score
+    if entry.last_active_day is not None and entry.last_active_day >= today:
+        return
+
+    if entry.last_active_day == today - timedelta(days=1):
+        entry.current_streak += 1
+    else:
+        entry.current_streak = 1
+    entry.active_days += 1
+    entry.best_streak = max(entry.best_streak, entry.current_streak)
+    entry.score = entry.active_days + entry.best_streak
+    entry.last_active_day = today
+    move_leaderboard_score(old_score, entry.score)
+
+
+def user_active_on(user_id, day):
+    """Whether a user logged anything on ``day`` in any of their widgets."""
+    return any(
+        query.filter(DashboardWidget.user_id == user_id, day_column == day).first() is not None
+        for day_column, query in activity_day_queries()
+    )
+
+
+def revoke_user_activity(user_id):
+    """Stop counting today for the leaderboard once nothing logged today is left; the caller commits.
+
+    A write that clears today's last bar, pie hours or radar gain would
+    otherwise keep a day that ``rebuild_leaderboard_entries`` does not count.
+    The streaks the day extended are not stored, so the user's row is
+    recomputed from their history, which only happens on such writes.
+    """
+    entry = db.session.get(LeaderboardEntry, user_id)
+    today = current_day()
+    if entry is None or entry.last_active_day != today or user_active_on(user_id, today):
+        return
+    rebuild_leaderboard_entries([user_id])
+
+
+def move_leaderboard_score(old_score, new_score):
+    """Move a user from one score to another in the rank tree; ``old_score`` None adds them.
+
+    The caller commits, so the tree changes with the score in one transaction.
+    """
+    if old_score == new_score:
+        return
+    nodes = defaultdict(int)
+    if old_score is not None:
+        for node in rank_tree_path(old_score):
+            nodes[node] -= 1
+    for node in rank_tree_path(new_score):
+        nodes[node] += 1
+    upsert_rows(
+        LeaderboardRankNode,
+        [{"node": node, "users": users} for node, users in nodes.items() if users],
+        ["node"],
+        ["users"],
+        increment=True,
+    )
+
+
+def leaderboard_ranks(scores):
+    """The rank of each of ``scores``: one more than the users scoring higher, from one read of the rank tree.
+
+    Users with the same score share a rank.
+    """
+    prefixes = {score: list(rank_tree_prefix(score)) for score in set(scores)}
+    wanted = {LEADERBOARD_RANK_TREE_SIZE}.union(*prefixes.values())
+    counts = dict(
+        db.session.query(LeaderboardRankNode.node, LeaderboardRankNode.users).filter(
+            LeaderboardRankNode.node.in_(wanted)
+        )
+    )
+    total = counts.get(LEADERBOARD_RANK_TREE_SIZE, 0)
+    return {score: total - sum(counts.get(node, 0) for node in nodes) + 1 for score, nodes in prefixes.items()}
+
+
+def activity_day_queries():
+    """Queries of the (user id, day) pairs with logged activity, each with its day column."""
+    return [
+        (
+            BarEntry.date,
+            db.session.query(DashboardWidget.user_id, BarEntry.date)
+            .join(BarEntry, BarEntry.widget_id == DashboardWidget.id)
+            .filter(BarEntry.value > 0),
+        ),
+        (
+            PieEntry.entry_date,
+            db.session.query(DashboardWidget.user_id, PieEntry.entry_date)
+            .join(PieEntry, PieEntry.widget_id == DashboardWidget.id)
+            .filter(PieEntry.hours > 0),
+        ),
+        (
+            RadarDailyAdjustment.entry_date,
+            db.session.query(DashboardWidget.user_id, RadarDailyAdjustment.entry_date)
+            .join(RadarDailyAdjustment, RadarDailyAdjustment.widget_id == DashboardWidget.id)
+            .filter(RadarDailyAdjustment.delta > 0),
+        ),
+    ]
+
+
+def collect_activity_days(user_ids):
+    """Return the sorted distinct days each user logged anything on, keyed by user id.
+
+    With sharding on, every database is asked about the users it holds.
+    """
+    users_by_shard = defaultdict(list)
+    for user_id, shard in shard_assignments(user_ids).items():
+        users_by_shard[shard].append(user_id)
+
+    days_by_user = defaultdict(set)
+    for shard, shard_user_ids in users_by_shard.items():
+        with using_shard(shard):
+            for _, query in activity_day_queries():
+                for user_id, day in query.filter(DashboardWidget.user_id.in_(shard_user_ids)).distinct():
+                    days_by_user[user_id].add(day)
+    return {user_id: sorted(days) for user_id, days in days_by_user.items()}
+
+
+def rebuild_leaderboard_entries(user_ids):
+    """Recompute the leaderboard rows of some users from their whole history.
+
+    Used after history is written out of order, e.g. by an import; the regular
+    write path goes through ``record_user_activity``.
+    """
+    days_by_user = collect_activity_days(user_ids)
+    for user_id in user_ids:
+        days = days_by_user.get(user_id, [])
+        entry = lock_leaderboard_entry(user_id)
+        old_score = entry.score
+        if not days:
+            entry.active_days = entry.current_streak = entry.best_streak = entry.score = 0
+            entry.last_active_day = None
+            move_leaderboard_score(old_score, entry.score)
+            continue
+
+        ordinals = np.array([day.toordinal() for day in days])
+        run_starts = np.flatnonzero(np.diff(ordinals, prepend=ordinals[0] - 2) != 1)
+        run_lengths = np.diff(np.append(run_starts, len(ordinals)))
+        entry.active_days = len(days)
+        entry.current_streak = int(run_lengths[-1])
+        entry.best_streak = int(run_lengths.max())
+        entry.score = entry.active_days + entry.best_streak
+        entry.last_active_day = days[-1]
+        move_leaderboard_score(old_score, entry.score)
+
+
+def load_analytics_values(widget, start, end):
+    """A widget's daily bar values, or net change per radar domain, as a (days, series) array."""
+    if widget.widget_type == "bar":
+        return load_bar_days(widget, start, end)[:, None]
+
+    rows = (
+        RadarDailyAdjustment.query.with_entities(
+            RadarDailyAdjustment.entry_date, RadarDailyAdjustment.domain_index, RadarDailyAdjustment.delta
+        )
+        .filter(
+            RadarDailyAdjustment.widget_id == widget.id,
+            RadarDailyAdjustment.entry_date >= start,
+            RadarDailyAdjustment.entry_date <= end,
+        )
+        .all()
+    )
+    values = np.zeros(((end - start).days + 1, len(widget.radar_domains)))
+    offsets = np.array([(row.entry_date - start).days for row in rows], dtype="int64")
+    domains = np.array([row.domain_index for row in rows], dtype="int64")
+    np.add.at(values, (offsets, domains), [row.delta for row in rows])
+    return values
+
+
+def analytics_first_day(widget):
+    """The day tracking started: the widget's creation, or its earliest entry if that is older."""
+    if widget.widget_type == "bar":
+        model, column = BarEntry, BarEntry.date
+    else:
+        model, column = RadarDailyAdjustment, RadarDailyAdjustment.entry_date
+    earliest = db.session.query(db.func.min(column)).filter(model.widget_id == widget.id).scalar()
+    first_day = min(widget.created_at.date(), current_day())
+    return min(first_day, earliest) if earliest else first_day
+
+
+def fold_widget_analytics(rows, values, through_day):
+    """Add the days of ``values``, the last of which is ``through_day``, to a widget's analytics rows.
+
+    The streak running on each day is its distance to the last inactive day
+    before it; the stored trailing streak is carried in as a run of active
+    days just before the first one.
+    """
+    active = values > 0
+    day_index = np.arange(len(values))[:, None]
+    trailing = np.array([row.trailing_streak for row in rows])
+    last_inactive = np.maximum.accumulate(np.where(active, -1 - trailing[None, :], day_index), axis=0)
+    streaks = day_index - last_inactive
+    for position, row in enumerate(rows):
+        row.active_days += int(active[:, position].sum())
+        row.total += float(values[:, position].sum())
+        row.best_streak = max(row.best_streak, int(streaks[:, position].max()))
+        row.trailing_streak = int(streaks[-1, position])
+        row.through_day = through_day
+
+
+def refresh_widget_analytics(widget, rebuild=False, build_missing=True):
+    """Fold the days up to yesterday into a widget's stored analytics and return its rows; the caller commits.
+
+    Only the days since the last refresh are read, normally none or one. The
+    whole history is read when ``rebuild`` is set, e.g. after an import
+    rewrote past days, and when the widget has no analytics yet, unless
+    ``build_missing`` is off; then an empty list is returned.
+    """
+    series_count = 1 if widget.widget_type == "bar" else len(widget.radar_domains)
+    rows = WidgetAnalytics.query.filter_by(widget_id=widget.id).order_by(WidgetAnalytics.series_index).all()
+    if len(rows) != series_count and not (rebuild or build_missing):
+        return []
+    if rebuild or len(rows) != series_count:
+        first_day = analytics_first_day(widget)
+        rows_by_index = {row.series_index: row for row in rows}
+        rows = []
+        for index in range(series_count):
+            row = rows_by_index.get(index)
+            if row is None:
+                row = WidgetAnalytics(widget_id=widget.id, series_index=index)
+                db.session.add(row)
+            row.first_day, row.through_day = first_day, first_day - timedelta(days=1)
+            row.active_days = row.best_streak = row.trailing_streak = 0
+            row.total = 0.0
+            rows.append(row)
+
+    yesterday = current_day() - timedelta(days=1)
+    if rows[0].through_day < yesterday:
+        start = rows[0].through_day + timedelta(days=1)
+        fold_widget_analytics(rows, load_analytics_values(widget, start, yesterday), yesterday)
+    return rows
+
+
+def serialize_widget_analytics(widget, rows, compact=False):
+    """The stored analytics of a widget with today's entry added, and its recent averages and trend.
+
+    Moving averages and the trend slope only need the last
+    ``ANALYTICS_TREND_DAYS`` days, which are read in one query.
+    """
+    today = current_day()
+    first_day = rows[0].first_day
+    window_start = max(first_day, today - timedelta(days=ANALYTICS_TREND_DAYS - 1))
+    values = load_analytics_values(widget, window_start, today)
+    tracked_days = (today - first_day).days + 1
+
+    def format_day(day):
+        return day.toordinal() - EPOCH_ORDINAL if compact else day.isoformat()
+
+    series = []
+    for position, row in enumerate(rows):
+        today_value = float(values[-1, position])
+        current_streak = row.trailing_streak + 1 if today_value > 0 else row.trailing_streak
+        active_days = row.active_days + int(today_value > 0)
+        series.append(
+            {
+                "streak": {"current": current_streak, "longest": max(row.best_streak, current_streak)},
+                "active_days": active_days,
+                "consistency": round(active_days / tracked_days, 4),
+                "total": row.total + today_value,
+            }
+        )
+
+    payload = {
+        "id": widget.id,
+        "type": widget.widget_type,
+        "as_of": format_day(today),
+        "first_day": format_day(first_day),
+        "tracked_days": tracked_days,
+    }
+    if widget.widget_type == "radar":
+        recent = values[-ANALYTICS_RECENT_DAYS:] > 0
+        recent_active = recent.sum(axis=0)
+        payload["domains"] = [
+            {
+                "name": domain.name,
+                **stats,
+                "recent_active_days": int(recent_active[position]),
+                "recent_consistency": round(float(recent_active[position]) / len(recent), 4),
+            }
+            for position, (domain, stats) in enumerate(zip(widget.radar_domains, series))
+        ]
+        return payload
+
+    daily = values[:, 0]
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    shown = min(ANALYTICS_SERIES_DAYS, len(daily))
+    ends = np.arange(len(daily) - shown, len(daily)) + 1
+    averages = {}
+    for span in ANALYTICS_AVERAGE_SPANS:
+        starts = np.maximum(ends - span, 0)
+        averages[str(span)] = np.round((cumulative[ends] - cumulative[starts]) / (ends - starts), 4).tolist()
+    slope = np.polyfit(np.arange(len(daily)), daily, 1)[0] if len(daily) > 1 else None
+    return {
+        **payload,
+        **series[0],
+        "daily_mean": round(series[0]["total"] / tracked_days, 4),
+        "moving_averages": {"start": format_day(today - timedelta(days=shown - 1)), **averages},
+        "trend": {"days": len(daily), "slope": None if slope is None else round(float(slope), 4)},
+    }
+
+
+def serialize_pie_widget(widget, entries=None):
     categories = widget.pie_data.get_categories()
-    today_values = get_today_pie_entries(widget, len(categories))
+    if entries is None:
+        today_values = get_today_pie_entries(widget, len(categories))
+    else:
+        today_values = build_pie_values(entries, len(categories))
     plot = build_pie_plot(today_values)
     return {
         **widget.to_dict(),
@@ -341,16 +2733,594 @@ def serialize_pie_widget(widget):
     }
 
 
-def serialize_widget(widget):
+def serialize_pie_delta(widget, today_values):
+    """The part of a pie widget that saving today's hours touches; labels and colors stay put."""
+    plot = build_pie_plot(today_values)
+    return {
+        "id": widget.id,
+        "version": widget.version,
+        "today_entries": today_values,
+        "plot": {
+            "values": plot["values"],
+            "wasted_hours": plot["wasted_hours"],
+            "total_tracked": plot["total_tracked"],
+        },
+    }
+
+
+def serialize_widget(
+    widget, rows=None, bar_days=BAR_WINDOW_DAYS, compare_scores=None, compare_day=None, compact=False
+):
     if widget.widget_type == "radar":
-        return serialize_radar_widget(widget)
+        return serialize_radar_widget(widget, rows, compare_scores, compare_day, compact)
     if widget.widget_type == "bar":
-        return serialize_bar_widget(widget)
+        return serialize_bar_widget(widget, rows, bar_days, compact)
     if widget.widget_type == "pie":
-        return serialize_pie_widget(widget)
+        return serialize_pie_widget(widget, rows)
     return widget.to_dict()
 
 
+def svg_text(x, y, content, size=12, anchor="middle", color="#1f2937", extra=""):
+    return (
+        f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}" fill="{color}"{extra}>'
+        f"{html.escape(str(content))}</text>"
+    )
+
+
+def svg_points(points):
+    return " ".join(f"{x:.1f},{y:.1f}" for x, y in points)
+
+
+def svg_document(spec, body):
+    width, height = spec["width"], spec["height"]
+    title = svg_text(width / 2, 24, spec["title"], size=16, extra=' font-weight="bold"')
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="{html.escape(SNAPSHOT_FONT)}">'
+        f'<rect width="{width}" height="{height}" fill="#fffdf7"/>{title}{"".join(body)}</svg>'
+    )
+
+
+def nice_axis_max(value):
+    """The smallest 1, 2, 2.5 or 5 times a power of ten that is at least ``value``."""
+    if value <= 0:
+        return 1
+    magnitude = 10 ** math.floor(math.log10(value))
+    return next(step * magnitude for step in (1, 2, 2.5, 5, 10) if step * magnitude >= value)
+
+
+def render_radar_svg(spec):
+    """Draw a radar like the dashboard does: today over the dotted comparison, on a 0-100 axis."""
+    chart = spec["chart"]
+    width, height = spec["width"], spec["height"]
+    center_x, center_y = width / 2, (height + 36) / 2
+    radius = max(10, min(width / 2, (height - 36) / 2) - 48)
+    count = len(chart["theta"])
+    # Plotly's polar default: the first domain points east, the rest follow counter-clockwise.
+    angles = [2 * math.pi * index / count for index in range(count)]
+
+    def point(value, angle):
+        return center_x + radius * value / 100 * math.cos(angle), center_y - radius * value / 100 * math.sin(angle)
+
+    body = [
+        f'<circle cx="{center_x:.1f}" cy="{center_y:.1f}" r="{radius * level / 100:.1f}" fill="none" stroke="#e5e7eb"/>'
+        for level in (20, 40, 60, 80, 100)
+    ]
+    for angle, name in zip(angles, chart["theta"]):
+        end_x, end_y = point(100, angle)
+        label_x, label_y = point(112, angle)
+        anchor = "start" if math.cos(angle) > 0.3 else "end" if math.cos(angle) < -0.3 else "middle"
+        body.append(
+            f'<line x1="{center_x:.1f}" y1="{center_y:.1f}" x2="{end_x:.1f}" y2="{end_y:.1f}" stroke="#e5e7eb"/>'
+        )
+        body.append(svg_text(label_x, label_y + 4, name, anchor=anchor))
+
+    traces = [
+        (chart["comparison_r"], "rgb(148, 163, 184)", "rgba(148, 163, 184, 0.15)", 2, ' stroke-dasharray="3 3"', 3),
+        (chart["r"], "rgb(106, 168, 79)", "rgba(106, 168, 79, 0.3)", 3, "", 5),
+    ]
+    for values, color, fill, line_width, dash, marker_radius in traces:
+        points = [point(value, angle) for value, angle in zip(values, angles)]
+        body.append(
+            f'<polygon points="{svg_points(points)}" fill="{fill}" stroke="{color}" '
+            f'stroke-width="{line_width}"{dash}/>'
+        )
+        body.extend(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{marker_radius}" fill="{color}"/>' for x, y in points)
+    comparison_label = f"vs {chart['comparison_date']}"
+    body.append(svg_text(width - 12, height - 12, comparison_label, size=11, anchor="end", color="#6b7280"))
+    return svg_document(spec, body)
+
+
+def render_bar_svg(spec):
+    """Draw the windowed bar series with a labelled value axis."""
+    chart = spec["chart"]
+    width, height = spec["width"], spec["height"]
+    left, right, top, bottom = 64, 16, 44, 40
+    plot_width, plot_height = width - left - right, height - top - bottom
+    values = chart["values"]
+    axis_max = nice_axis_max(max(values, default=0))
+
+    body = []
+    for tick in range(5):
+        tick_value = axis_max * tick / 4
+        y = top + plot_height * (1 - tick / 4)
+        body.append(f'<line x1="{left}" y1="{y:.1f}" x2="{width - right}" y2="{y:.1f}" stroke="#e5e7eb"/>')
+        body.append(svg_text(left - 8, y + 4, f"{tick_value:g}", size=11, anchor="end", color="#6b7280"))
+
+    slot = plot_width / max(1, len(values))
+    label_every = math.ceil(len(values) / max(1, plot_width // 44)) or 1
+    for index, (label, value) in enumerate(zip(chart["labels"], values)):
+        bar_height = plot_height * value / axis_max
+        x = left + slot * index
+        body.append(
+            f'<rect x="{x + slot * 0.175:.1f}" y="{top + plot_height - bar_height:.1f}" '
+            f'width="{slot * 0.65:.1f}" height="{bar_height:.1f}" fill="#f59e0b"/>'
+        )
+        if index % label_every == 0:
+            body.append(svg_text(x + slot / 2, height - bottom + 16, label, size=10, color="#6b7280"))
+
+    axis_label_y = top + plot_height / 2
+    rotate = f' transform="rotate(-90 16 {axis_label_y:.1f})"'
+    body.append(svg_text(16, axis_label_y, chart["y_label"], extra=rotate))
+    body.append(svg_text(left + plot_width / 2, height - 6, f"Last {len(values)} days", size=11, color="#6b7280"))
+    return svg_document(spec, body)
+
+
+def render_pie_svg(spec):
+    """Draw today's hours as a donut, starting at twelve o'clock and going clockwise, with a legend."""
+    chart = spec["chart"]
+    width, height = spec["width"], spec["height"]
+    center_x, center_y = width * 0.36, (height + 36) / 2
+    outer = max(10, min(width * 0.3, (height - 36) / 2 - 16))
+    inner = outer * 0.4
+    total = sum(chart["values"])
+
+    def point(radius, turn):
+        angle = 2 * math.pi * turn
+        return center_x + radius * math.sin(angle), center_y - radius * math.cos(angle)
+
+    body = []
+    start = 0.0
+    for value, color in zip(chart["values"], chart["colors"]):
+        if value <= 0:
+            continue
+        share = value / total
+        if share > 0.9999:
+            middle = (outer + inner) / 2
+            body.append(
+                f'<circle cx="{center_x:.1f}" cy="{center_y:.1f}" r="{middle:.1f}" fill="none" '
+                f'stroke="{color}" stroke-width="{outer - inner:.1f}"/>'
+            )
+        else:
+            end = start + share
+            large_arc = 1 if share > 0.5 else 0
+            (ox1, oy1), (ox2, oy2) = point(outer, start), point(outer, end)
+            (ix1, iy1), (ix2, iy2) = point(inner, end), point(inner, start)
+            body.append(
+                f'<path d="M{ox1:.1f},{oy1:.1f} A{outer:.1f},{outer:.1f} 0 {large_arc} 1 {ox2:.1f},{oy2:.1f} '
+                f'L{ix1:.1f},{iy1:.1f} A{inner:.1f},{inner:.1f} 0 {large_arc} 0 {ix2:.1f},{iy2:.1f} Z" '
+                f'fill="{color}" stroke="#ffffff" stroke-width="2"/>'
+            )
+        if share >= 0.05:
+            label_x, label_y = point((outer + inner) / 2, start + share / 2)
+            body.append(svg_text(label_x, label_y + 4, f"{share:.0%}", size=11, color="#ffffff"))
+        start += share
+
+    body.append(svg_text(center_x, center_y - 2, f"{chart['total_tracked']:g} h", size=14))
+    body.append(svg_text(center_x, center_y + 14, "tracked", size=11, color="#6b7280"))
+
+    legend_x = center_x + outer + 32
+    legend_top = center_y - 11 * len(chart["labels"])
+    for index, (label, value, color) in enumerate(zip(chart["labels"], chart["values"], chart["colors"])):
+        y = legend_top + 22 * index
+        body.append(f'<rect x="{legend_x:.1f}" y="{y:.1f}" width="12" height="12" rx="2" fill="{color}"/>')
+        body.append(svg_text(legend_x + 20, y + 11, f"{label}  {value:g} h", anchor="start"))
+    return svg_document(spec, body)
+
+
+SNAPSHOT_RENDERERS = {"radar": render_radar_svg, "bar": render_bar_svg, "pie": render_pie_svg}
+
+
+def build_snapshot_spec(payload, width, height):
+    """Everything a snapshot image shows, taken from a serialized widget."""
+    if payload["type"] == "radar":
+        chart = {
+            "theta": payload["plot"]["theta"],
+            "r": payload["plot"]["r"],
+            "comparison_r": payload["plot"]["comparison"]["r"],
+            "comparison_date": payload["plot"]["comparison"]["date"],
+        }
+    elif payload["type"] == "bar":
+        config = payload["config"]
+        unit = f" ({config['unit']})" if config.get("unit") else ""
+        chart = {**payload["series"], "y_label": f"{config['metric_name']}{unit}"}
+    else:
+        plot = payload["plot"]
+        chart = {key: plot[key] for key in ("labels", "values", "colors", "total_tracked")}
+    return {
+        "renderer": SNAPSHOT_RENDERER_VERSION,
+        "type": payload["type"],
+        "title": payload["title"],
+        "width": width,
+        "height": height,
+        "chart": chart,
+    }
+
+
+def render_snapshot(spec, snapshot_format):
+    svg = SNAPSHOT_RENDERERS[spec["type"]](spec)
+    if snapshot_format == "svg":
+        return svg.encode()
+    try:
+        import cairosvg
+    except ImportError:
+        raise RuntimeError("PNG snapshots need the cairosvg package; ask for format=svg instead.") from None
+    return cairosvg.svg2png(bytestring=svg.encode(), output_width=spec["width"], output_height=spec["height"])
+
+
+def load_dashboard_widgets(user_id, bar_days=BAR_WINDOW_DAYS, compare_day=None, compact=False):
+    """Serialize all widgets of a user with a fixed number of queries.
+
+    The widget configs are loaded along with the widgets themselves, then today's
+    radar adjustments, the windowed bar entries and today's pie entries are
+    fetched with one query per table for every widget at once and grouped by
+    widget id, so the query count does not grow with the number of widgets.
+    Pending radar decay is applied first, in its own batch, and the radar
+    comparison snapshots as of ``compare_day`` come from one more query.
+    """
+    apply_radar_decay_for_user(user_id)
+
+    widgets = (
+        DashboardWidget.query.options(
+            joinedload(DashboardWidget.radar_data),
+            joinedload(DashboardWidget.bar_data),
+            joinedload(DashboardWidget.pie_data),
+            selectinload(DashboardWidget.radar_domains),
+            selectinload(DashboardWidget.pie_categories),
+        )
+        .filter_by(user_id=user_id)
+        .order_by(DashboardWidget.position, DashboardWidget.created_at)
+        .all()
+    )
+
+    widget_ids = defaultdict(list)
+    for widget in widgets:
+        widget_ids[widget.widget_type].append(widget.id)
+
+    today = current_day()
+    if compare_day is None:
+        compare_day = today - timedelta(days=RADAR_COMPARE_DAYS)
+    related_rows = defaultdict(list)
+    compare_scores = get_radar_snapshot_scores(widget_ids["radar"], compare_day)
+    if widget_ids["radar"]:
+        related_rows.update(
+            group_rows_by_widget(
+                RadarDailyAdjustment.query.filter(
+                    RadarDailyAdjustment.widget_id.in_(widget_ids["radar"]),
+                    RadarDailyAdjustment.entry_date == today,
+                )
+            )
+        )
+    if widget_ids["bar"]:
+        related_rows.update(
+            group_rows_by_widget(
+                BarEntry.query.filter(
+                    BarEntry.widget_id.in_(widget_ids["bar"]),
+                    BarEntry.date >= bar_window_start(bar_days),
+                )
+            )
+        )
+    if widget_ids["pie"]:
+        related_rows.update(
+            group_rows_by_widget(
+                PieEntry.query.filter(
+                    PieEntry.widget_id.in_(widget_ids["pie"]),
+                    PieEntry.entry_date == today,
+                )
+            )
+        )
+
+    for widget in widgets:
+        if widget.widget_type == "radar" and widget.id not in compare_scores:
+            compare_scores[widget.id] = [0.0] * len(widget.radar_data.get_domains())
+
+    return [
+        serialize_widget(
+            widget, related_rows[widget.id], bar_days, compare_scores.get(widget.id), compare_day, compact
+        )
+        for widget in widgets
+    ]
+
+
+def read_import_records(raw_data, import_format):
+    """Parse an uploaded CSV (with a header row) or JSONL document into row dicts."""
+    if import_format == "csv":
+        return list(csv.DictReader(io.StringIO(raw_data)))
+    if import_format != "jsonl":
+        raise ValueError('The import format must be "csv" or "jsonl".')
+
+    records = []
+    for line_number, line in enumerate(raw_data.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {line_number}: invalid JSON.") from None
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_number}: each line must be a JSON object.")
+        records.append(record)
+    return records
+
+
+def resolve_import_index(raw_value, index_by_name, label):
+    """Match a pie category or radar domain given by name (any case) or by 0-based index."""
+    text_value = str(raw_value if raw_value is not None else "").strip()
+    if text_value.lower() in index_by_name:
+        return index_by_name[text_value.lower()]
+    if text_value.isdigit() and int(text_value) < len(index_by_name):
+        return int(text_value)
+    raise ValueError(f'Unknown {label} "{text_value}".')
+
+
+def parse_import_records(widget, records):
+    """Validate import rows with the rules of the daily endpoints.
+
+    Returns the new values keyed by date for bar widgets and by
+    ``(date, index)`` for pie and radar widgets. Rows are numbered from 1 in
+    error messages.
+    """
+    today = current_day()
+    if widget.widget_type == "pie":
+        names = widget.pie_data.get_categories()
+    elif widget.widget_type == "radar":
+        names = widget.radar_data.get_domains()
+    else:
+        names = []
+    index_by_name = {name.lower(): index for index, name in enumerate(names)}
+
+    parsed = {}
+    for number, record in enumerate(records, start=1):
+        try:
+            day = parse_iso_date(record.get("date"))
+            if day > today:
+                raise ValueError("Dates cannot be in the future.")
+
+            if widget.widget_type == "bar":
+                key = day
+                value = parse_bar_value(record.get("value"))
+            elif widget.widget_type == "pie":
+                key = (day, resolve_import_index(record.get("category"), index_by_name, "activity"))
+                value = parse_pie_hours(record.get("hours"))
+            else:
+                key = (day, resolve_import_index(record.get("domain"), index_by_name, "domain"))
+                try:
+                    value = int(str(record.get("delta")).strip())
+                except ValueError:
+                    value = None
+                if value is None or abs(value) > RADAR_DAILY_LIMIT:
+                    raise ValueError("A domain's net change for a day must be -1, 0 or +1.")
+
+            if key in parsed:
+                raise ValueError("This date already appears earlier in the import.")
+            parsed[key] = value
+        except ValueError as exc:
+            raise ValueError(f"Row {number}: {exc}") from None
+
+    return parsed
+
+
+def load_existing_import_values(widget, parsed):
+    """Fetch the stored values an import would overwrite, plus the rest of the pie days it touches."""
+    if not parsed:
+        return {}
+
+    days = [key if widget.widget_type == "bar" else key[0] for key in parsed]
+    first_day, last_day = min(days), max(days)
+    if widget.widget_type == "pie":
+        rows = db.session.query(PieEntry.entry_date, PieEntry.category_index, PieEntry.hours).filter(
+            PieEntry.widget_id == widget.id, PieEntry.entry_date.between(first_day, last_day)
+        )
+    elif widget.widget_type == "radar":
+        rows = db.session.query(
+            RadarDailyAdjustment.entry_date, RadarDailyAdjustment.domain_index, RadarDailyAdjustment.delta
+        ).filter(
+            RadarDailyAdjustment.widget_id == widget.id,
+            RadarDailyAdjustment.entry_date.between(first_day, last_day),
+        )
+    else:
+        return {}
+    return {(day, index): value for day, index, value in rows}
+
+
+def write_import_chunk(widget, items, existing):
+    """Replace the stored values of one chunk of import rows with two batched statements."""
+    if widget.widget_type == "bar":
+        BarEntry.query.filter(
+            BarEntry.widget_id == widget.id, BarEntry.date.in_([day for day, _ in items])
+        ).delete(synchronize_session=False)
+        db.session.execute(
+            db.insert(BarEntry),
+            [{"widget_id": widget.id, "date": day, "value": value} for day, value in items],
+        )
+        return
+
+    if widget.widget_type == "pie":
+        model, date_column, index_column, value_name = PieEntry, PieEntry.entry_date, PieEntry.category_index, "hours"
+    else:
+        model, date_column = RadarDailyAdjustment, RadarDailyAdjustment.entry_date
+        index_column, value_name = RadarDailyAdjustment.domain_index, "delta"
+
+    model.query.filter(
+        model.widget_id == widget.id,
+        db.tuple_(date_column, index_column).in_([key for key, _ in items]),
+    ).delete(synchronize_session=False)
+    rows = [
+        {"widget_id": widget.id, date_column.key: day, index_column.key: index, value_name: value}
+        for (day, index), value in items
+        if value != 0
+    ]
+    if rows:
+        db.session.execute(db.insert(model), rows)
+
+    if widget.widget_type == "radar":
+        changes = np.zeros(len(widget.radar_domains))
+        for (day, index), delta in items:
+            changes[index] += delta - existing.get((day, index), 0)
+        for domain, change in zip(widget.radar_domains, changes.tolist()):
+            if change:
+                domain.score = RadarDomain.score + change
+
+
+def import_widget_entries(widget, records, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import dated rows into a widget, one transaction per chunk.
+
+    Every row is validated before anything is written, including the 24 hour
+    cap of each pie day once merged with the hours already stored. Rows
+    replace stored values for the same day (and category or domain); a zero
+    clears them. Derived data (pie rollups, radar snapshots, analytics, the
+    leaderboard) is rebuilt for the widget afterwards. Returns the number of rows imported.
+    """
+    parsed = parse_import_records(widget, records)
+    existing = load_existing_import_values(widget, parsed)
+
+    if widget.widget_type == "pie":
+        day_totals = defaultdict(float)
+        for key, hours in existing.items():
+            if key not in parsed:
+                day_totals[key[0]] += hours
+        for (day, _), hours in parsed.items():
+            day_totals[day] += hours
+        for day, total in sorted(day_totals.items()):
+            if total > MAX_PIE_HOURS:
+                raise ValueError(f"Tracked hours for {day.strftime('%Y-%m-%d')} would exceed 24.")
+
+    if widget.widget_type == "radar":
+        apply_radar_decay([widget.radar_data])
+
+    items = sorted(parsed.items())
+    for offset in range(0, len(items), chunk_size):
+        write_import_chunk(widget, items[offset : offset + chunk_size], existing)
+        db.session.commit()
+
+    if widget.widget_type == "pie":
+        rebuild_pie_rollups([widget.id])
+    elif widget.widget_type == "radar" and items:
+        # Snapshots from the first imported day on are replayed with decay;
+        # the older ones, and the decay they recorded, stay as they are.
+        first_day = items[0][0][0]
+        RadarScoreSnapshot.query.filter(
+            RadarScoreSnapshot.widget_id == widget.id, RadarScoreSnapshot.snapshot_date >= first_day
+        ).delete(synchronize_session=False)
+        rows, scores = replay_radar_history(widget.radar_data, first_day)
+        upsert_rows(RadarScoreSnapshot, rows, ["widget_id", "snapshot_date"], ["scores"])
+        widget.radar_data.set_scores(scores)
+    if widget.widget_type in ANALYTICS_WIDGET_TYPES:
+        refresh_widget_analytics(widget, rebuild=True)
+    rebuild_leaderboard_entries([widget.user_id])
+    bump_widget_version(widget)
+    invalidate_dashboard(widget.user_id)
+    db.session.commit()
+    publish_widget_event(widget.user_id, "widget.changed", {"id": widget.id, "version": widget.version})
+    return len(items)
+
+
+def iter_export_records(user_id):
+    """Yield a user's widgets, each followed by its full history, oldest day first.
+
+    History rows are read with ``yield_per`` so only one batch of rows is held
+    in memory at a time, however long the history is.
+    """
+    widgets = (
+        DashboardWidget.query.options(
+            joinedload(DashboardWidget.radar_data),
+            joinedload(DashboardWidget.bar_data),
+            joinedload(DashboardWidget.pie_data),
+            selectinload(DashboardWidget.radar_domains),
+            selectinload(DashboardWidget.pie_categories),
+        )
+        .filter_by(user_id=user_id)
+        .order_by(DashboardWidget.position, DashboardWidget.created_at)
+        .all()
+    )
+    for widget in widgets:
+        base = {"widget_id": widget.id, "widget_type": widget.widget_type, "title": widget.title}
+        if widget.widget_type == "bar":
+            yield {"record": "widget", **base, "config": widget.bar_data.to_dict()}
+            rows = (
+                db.session.query(BarEntry.date, BarEntry.value)
+                .filter(BarEntry.widget_id == widget.id)
+                .order_by(BarEntry.date)
+                .yield_per(EXPORT_FETCH_SIZE)
+            )
+            metric_name = widget.bar_data.metric_name
+            for day, value in rows:
+                yield {"record": "bar_entry", **base, "date": day.isoformat(), "key": metric_name, "value": value}
+        elif widget.widget_type == "pie":
+            categories = widget.pie_data.get_categories()
+            yield {"record": "widget", **base, "config": {"categories": categories}}
+            rows = (
+                db.session.query(PieEntry.entry_date, PieEntry.category_index, PieEntry.hours)
+                .filter(PieEntry.widget_id == widget.id)
+                .order_by(PieEntry.entry_date, PieEntry.category_index)
+                .yield_per(EXPORT_FETCH_SIZE)
+            )
+            for day, index, hours in rows:
+                name = categories[index] if index < len(categories) else str(index)
+                yield {"record": "pie_entry", **base, "date": day.isoformat(), "key": name, "value": hours}
+        elif widget.widget_type == "radar":
+            domains = widget.radar_data.get_domains()
+            yield {
+                "record": "widget",
+                **base,
+                "config": {"domains": domains, "scores": widget.radar_data.get_scores()},
+            }
+            rows = (
+                db.session.query(
+                    RadarDailyAdjustment.entry_date,
+                    RadarDailyAdjustment.domain_index,
+                    RadarDailyAdjustment.delta,
+                )
+                .filter(RadarDailyAdjustment.widget_id == widget.id)
+                .order_by(RadarDailyAdjustment.entry_date, RadarDailyAdjustment.domain_index)
+                .yield_per(EXPORT_FETCH_SIZE)
+            )
+            for day, index, delta in rows:
+                name = domains[index] if index < len(domains) else str(index)
+                yield {
+                    "record": "radar_adjustment",
+                    **base,
+                    "date": day.isoformat(),
+                    "key": name,
+                    "value": delta,
+                }
+
+
+def iter_export_chunks(records, export_format):
+    """Encode export records as NDJSON or CSV text, buffered into chunks of about 64 KiB."""
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_CSV_FIELDS)
+
+    for record in records:
+        if export_format == "csv":
+            if record["record"] == "widget":
+                record = {**record, "key": "config", "value": json.dumps(record["config"])}
+            writer.writerow([record.get(field, "") for field in EXPORT_CSV_FIELDS])
+        else:
+            buffer.write(json.dumps(record))
+            buffer.write("\n")
+
+        if buffer.tell() >= EXPORT_BUFFER_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
@@ -358,11 +3328,24 @@ def login():
         username = data.get("username")
         password = data.get("password")
 
+        throttled = throttle_auth(username)
+        if throttled:
+            return throttled
+
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
-            session["user_id"] = user.id
-            session["username"] = user.username
-            return jsonify({"success": True, "message": "Login successful"})
+        # Give the connection back to the pool while the hash is checked.
+        db.session.close()
+        try:
+            if user and isinstance(password, str) and user.check_password(password):
+                if user.needs_rehash():
+                    user.set_password(password)
+                    db.session.add(user)
+                    db.session.commit()
+                session["user_id"] = user.id
+                session["username"] = user.username
+                return jsonify({"success": True, "message": "Login successful"})
+        except HashingBusy:
+            return hashing_busy_response()
 
         return jsonify({"success": False, "message": "Invalid username or password"}), 401
 
@@ -380,12 +3363,22 @@ def register():
             return jsonify({"success": False, "message": "Username and password required"}), 400
         if len(password) < 4:
             return jsonify({"success": False, "message": "Password must be at least 4 characters"}), 400
+        throttled = throttle_auth(username)
+        if throttled:
+            return throttled
         if User.query.filter_by(username=username).first():
             return jsonify({"success": False, "message": "Username already taken"}), 400
 
+        db.session.close()
         new_user = User(username=username)
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except HashingBusy:
+            return hashing_busy_response()
         db.session.add(new_user)
+        if app.config["DATABASE_SHARDS"]:
+            db.session.flush()
+            db.session.add(ShardAssignment(user_id=new_user.id, shard=hashed_shard(new_user.id)))
         db.session.commit()
 
         session["user_id"] = new_user.id
@@ -410,12 +3403,73 @@ def index():
 @app.route("/dashboard-data")
 @login_required
 def dashboard_data():
-    widgets = (
-        DashboardWidget.query.filter_by(user_id=session["user_id"])
-        .order_by(DashboardWidget.position, DashboardWidget.created_at)
-        .all()
+    try:
+        bar_days = parse_window_days()
+        compare_day = parse_compare_day()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    user_id = session["user_id"]
+    compact = wants_compact_dates()
+    response_format = negotiate_response_format()
+    # Pending decay bumps the dashboard version, so it is applied before the
+    # version is read.
+    apply_radar_decay_for_user(user_id)
+    version = db.session.query(User.dashboard_version).filter(User.id == user_id).scalar()
+    cache_key = (user_id, version, current_day(), bar_days, compare_day, compact, response_format)
+    etag = hashlib.sha1(repr((DASHBOARD_PAYLOAD_VERSION, *cache_key)).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        # The browser's copy is current; nothing needs to be loaded or encoded.
+        response = Response(status=304)
+        cache_status = "revalidated"
+    else:
+        cached = dashboard_cache.get(cache_key)
+        if cached is None:
+            payload = {"widgets": load_dashboard_widgets(user_id, bar_days, compare_day, compact)}
+            cached = app.json.encode(payload, response_format)
+            dashboard_cache.set(cache_key, cached)
+            cache_status = "miss"
+        else:
+            cache_status = "hit"
+        body, mimetype = cached
+        response = Response(body, mimetype=mimetype)
+
+    response.vary.add("Accept")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["X-Dashboard-Cache"] = cache_status
+    return response.make_conditional(request)
+
+
+def next_widget_position(user_id):
+    """The position after the user's last widget, read off the (user_id, position) index."""
+    last_position = (
+        db.session.query(db.func.max(DashboardWidget.position)).filter(DashboardWidget.user_id == user_id).scalar()
     )
-    return jsonify({"widgets": [serialize_widget(widget) for widget in widgets]})
+    return POSITION_GAP if last_position is None else last_position + POSITION_GAP
+
+
+def write_widget_order(user_id, widget_ids):
+    """Space the user's widgets ``POSITION_GAP`` apart in the order given, in one UPDATE."""
+    positions = {widget_id: (index + 1) * POSITION_GAP for index, widget_id in enumerate(widget_ids)}
+    if positions:
+        DashboardWidget.query.filter(
+            DashboardWidget.user_id == user_id,
+            DashboardWidget.id.in_(positions),
+        ).update(
+            {DashboardWidget.position: db.case(positions, value=DashboardWidget.id)},
+            synchronize_session=False,
+        )
+    return positions
+
+
+def ordered_widget_ids(user_id):
+    return [
+        widget_id
+        for (widget_id,) in db.session.query(DashboardWidget.id)
+        .filter(DashboardWidget.user_id == user_id)
+        .order_by(DashboardWidget.position, DashboardWidget.created_at)
+    ]
 
 
 @app.route("/widgets", methods=["POST"])
@@ -426,7 +3480,8 @@ def create_widget():
     title = (data.get("title") or "").strip()
     user_id = session["user_id"]
 
-    position = DashboardWidget.query.filter_by(user_id=user_id).count()
+    position = next_widget_position(user_id)
+    widget_id = allocate_widget_id()
 
     if widget_type == "radar":
         try:
@@ -435,6 +3490,7 @@ def create_widget():
             return jsonify({"error": str(exc)}), 400
 
         widget = DashboardWidget(
+            id=widget_id,
             user_id=user_id,
             widget_type="radar",
             title=title or "Radar Chart",
@@ -443,10 +3499,11 @@ def create_widget():
         db.session.add(widget)
         db.session.flush()
 
-        radar_data = RadarWidgetData(widget_id=widget.id)
-        radar_data.set_domains(domains)
-        radar_data.set_scores([0.0] * len(domains))
-        db.session.add(radar_data)
+        db.session.add(RadarWidgetData(widget_id=widget.id, decay_evaluated_on=current_day()))
+        db.session.add_all(
+            RadarDomain(widget_id=widget.id, position=index, name=name, score=0.0)
+            for index, name in enumerate(domains)
+        )
 
     elif widget_type == "bar":
         metric_name = (data.get("metric_name") or "").strip()
@@ -455,6 +3512,7 @@ def create_widget():
             return jsonify({"error": "Please enter the habit or metric name for the bar chart."}), 400
 
         widget = DashboardWidget(
+            id=widget_id,
             user_id=user_id,
             widget_type="bar",
             title=title or f"{metric_name} Tracker",
@@ -477,6 +3535,7 @@ def create_widget():
             return jsonify({"error": str(exc)}), 400
 
         widget = DashboardWidget(
+            id=widget_id,
             user_id=user_id,
             widget_type="pie",
             title=title or "Time Distribution",
@@ -485,57 +3544,139 @@ def create_widget():
         db.session.add(widget)
         db.session.flush()
 
-        pie_data = PieWidgetData(widget_id=widget.id)
-        pie_data.set_categories(categories)
-        db.session.add(pie_data)
+        db.session.add(PieWidgetData(widget_id=widget.id))
+        db.session.add_all(
+            PieCategory(widget_id=widget.id, position=index, name=name)
+            for index, name in enumerate(categories)
+        )
     else:
         return jsonify({"error": "Unsupported widget type"}), 400
 
+    invalidate_dashboard(user_id)
     db.session.commit()
-    return jsonify({"widget": serialize_widget(widget)}), 201
+    payload = serialize_widget(widget)
+    publish_widget_event(user_id, "widget.created", {"widget": payload})
+    return jsonify({"widget": payload}), 201
 
 
 @app.route("/widgets/<int:widget_id>", methods=["DELETE"])
 @login_required
 def delete_widget(widget_id):
     widget = DashboardWidget.query.filter_by(id=widget_id, user_id=session["user_id"]).first_or_404()
-    deleted_position = widget.position
     user_id = widget.user_id
 
+    # Positions only need to sort, so the widgets after this one keep theirs.
     db.session.delete(widget)
+    # The widget's history no longer counts towards the leaderboard.
+    rebuild_leaderboard_entries([user_id])
+    invalidate_dashboard(user_id)
+    db.session.commit()
+    publish_widget_event(user_id, "widget.deleted", {"id": widget_id})
+    return jsonify({"success": True})
 
-    widgets_to_shift = (
-        DashboardWidget.query.filter(
-            DashboardWidget.user_id == user_id,
-            DashboardWidget.position > deleted_position,
-        )
-        .order_by(DashboardWidget.position)
-        .all()
+
+class MutationError(ValueError):
+    """A refused change to a widget's data; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def move_widget(widget, after_id):
+    """Place ``widget`` right after widget ``after_id``, or first when it is None.
+
+    The widget takes the midpoint of its new neighbours' positions, so only its
+    own row changes. Once a gap has been split down to nothing, the user's
+    widgets are spread out again in the same statement that places this one.
+    Returns the positions that changed, by widget id.
+    """
+    lower = None
+    if after_id is not None:
+        after = DashboardWidget.query.filter_by(id=after_id, user_id=widget.user_id).first()
+        if after is None or after.id == widget.id:
+            raise MutationError("Choose another of your widgets to move this one after.")
+        lower = after.position
+
+    others = DashboardWidget.query.filter(
+        DashboardWidget.user_id == widget.user_id,
+        DashboardWidget.id != widget.id,
     )
-    for item in widgets_to_shift:
-        item.position -= 1
+    if lower is not None:
+        others = others.filter(DashboardWidget.position > lower)
+    upper = others.with_entities(db.func.min(DashboardWidget.position)).scalar()
+
+    if lower is None and upper is None:
+        position = widget.position
+    elif lower is None:
+        position = upper - POSITION_GAP
+    elif upper is None:
+        position = lower + POSITION_GAP
+    elif upper - lower >= 2:
+        position = (lower + upper) // 2
+    else:
+        widget_ids = [widget_id for widget_id in ordered_widget_ids(widget.user_id) if widget_id != widget.id]
+        widget_ids.insert(widget_ids.index(after_id) + 1, widget.id)
+        positions = write_widget_order(widget.user_id, widget_ids)
+        db.session.expire(widget, ["position"])
+        return positions
+
+    widget.position = position
+    return {widget.id: position}
+
 
+@app.route("/widgets/order", methods=["PUT"])
+@login_required
+def reorder_widgets():
+    """Apply a whole new widget order, given as the list of every widget id, in one UPDATE."""
+    data = request.get_json() or {}
+    order = data.get("order")
+    user_id = session["user_id"]
+    widget_ids = ordered_widget_ids(user_id)
+    if (
+        not isinstance(order, list)
+        or not all(isinstance(widget_id, int) for widget_id in order)
+        or len(order) != len(widget_ids)
+        or set(order) != set(widget_ids)
+    ):
+        return jsonify({"error": "The order must list each of your widgets exactly once."}), 400
+
+    positions = write_widget_order(user_id, order)
+    invalidate_dashboard(user_id)
     db.session.commit()
-    return jsonify({"success": True})
+    publish_widget_event(user_id, "widgets.reordered", {"positions": positions})
+    return jsonify({"positions": positions})
 
 
-@app.route("/widgets/<int:widget_id>/radar/update-score", methods=["POST"])
+@app.route("/widgets/<int:widget_id>/move", methods=["POST"])
 @login_required
-def update_radar_score(widget_id):
-    widget = DashboardWidget.query.filter_by(
-        id=widget_id, user_id=session["user_id"], widget_type="radar"
-    ).first_or_404()
+def move_widget_route(widget_id):
+    widget = DashboardWidget.query.filter_by(id=widget_id, user_id=session["user_id"]).first_or_404()
+    after_id = (request.get_json() or {}).get("after")
+    if after_id is not None and not isinstance(after_id, int):
+        return jsonify({"error": "after must be a widget id or null."}), 400
 
-    data = request.get_json() or {}
-    index = data.get("index")
-    change = data.get("change")
+    try:
+        positions = move_widget(widget, after_id)
+    except MutationError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), exc.status
+
+    invalidate_dashboard(widget.user_id)
+    db.session.commit()
+    publish_widget_event(widget.user_id, "widgets.reordered", {"positions": positions})
+    return jsonify({"positions": positions})
+
+
+def change_radar_score(widget, index, change):
+    """Add ``change`` (+1 or -1) to a radar domain for today and return the new scores."""
+    apply_radar_decay([widget.radar_data])
     scores = widget.radar_data.get_scores()
-    domains = widget.radar_data.get_domains()
 
     if not isinstance(index, int) or index < 0 or index >= len(scores):
-        return jsonify({"error": "Invalid domain index"}), 400
+        raise MutationError("Invalid domain index")
     if change not in (-1, 1):
-        return jsonify({"error": "Invalid score change"}), 400
+        raise MutationError("Invalid score change")
 
     today = current_day()
     adjustment = RadarDailyAdjustment.query.filter_by(
@@ -544,39 +3685,155 @@ def update_radar_score(widget_id):
         entry_date=today,
     ).first()
 
-    if not adjustment:
-        adjustment = RadarDailyAdjustment(
-            widget_id=widget.id,
-            domain_index=index,
-            entry_date=today,
-            delta=0,
-        )
-        db.session.add(adjustment)
+    new_delta = (adjustment.delta if adjustment else 0) + change
+    if abs(new_delta) > RADAR_DAILY_LIMIT:
+        raise MutationError("For each domain, today's net change must stay between -1 and +1.")
 
-    new_delta = adjustment.delta + change
-    if new_delta < -1 or new_delta > 1:
-        return jsonify({"error": "For each domain, today's net change must stay between -1 and +1."}), 400
+    if new_delta == 0:
+        db.session.delete(adjustment)
+    elif adjustment:
+        adjustment.delta = new_delta
+    else:
+        db.session.add(
+            RadarDailyAdjustment(widget_id=widget.id, domain_index=index, entry_date=today, delta=new_delta)
+        )
 
-    adjustment.delta = new_delta
     scores[index] += change
-    widget.radar_data.set_scores(scores)
+    widget.radar_domains[index].score = RadarDomain.score + change
+    bump_widget_version(widget)
+    refresh_widget_analytics(widget, build_missing=False)
+    record_radar_snapshot(widget.radar_data, scores)
+    # Only a net gain for the day counts: -1 then +1 leaves nothing logged.
+    if new_delta > 0:
+        record_user_activity(widget.user_id)
+    else:
+        revoke_user_activity(widget.user_id)
+    return scores
+
+
+def find_today_bar_entry(widget):
+    return BarEntry.query.filter_by(widget_id=widget.id, date=current_day()).first()
 
-    if adjustment.delta == 0:
-        if adjustment in db.session.new:
-            db.session.expunge(adjustment)
+
+def insert_today_bar_entry(widget, value):
+    if find_today_bar_entry(widget):
+        raise MutationError("Today's bar already exists. Update or delete it instead.")
+
+    entry = BarEntry(widget_id=widget.id, value=value, date=current_day())
+    db.session.add(entry)
+    bump_widget_version(widget)
+    refresh_widget_analytics(widget, build_missing=False)
+    if value > 0:
+        record_user_activity(widget.user_id)
+    return entry
+
+
+def update_today_bar_entry(widget, value):
+    entry = find_today_bar_entry(widget)
+    if not entry:
+        raise MutationError("No bar has been entered for today yet.", 404)
+
+    entry.value = value
+    entry.timestamp = datetime.utcnow()
+    bump_widget_version(widget)
+    refresh_widget_analytics(widget, build_missing=False)
+    if value > 0:
+        record_user_activity(widget.user_id)
+    else:
+        revoke_user_activity(widget.user_id)
+    return entry
+
+
+def delete_today_bar_entry(widget):
+    entry = find_today_bar_entry(widget)
+    if not entry:
+        raise MutationError("No bar has been entered for today yet.", 404)
+
+    db.session.delete(entry)
+    bump_widget_version(widget)
+    refresh_widget_analytics(widget, build_missing=False)
+    revoke_user_activity(widget.user_id)
+
+
+def save_today_pie_hours(widget, raw_hours):
+    """Replace today's hours of a pie widget and keep its rollups in step; returns the parsed hours."""
+    categories = widget.pie_data.get_categories()
+    if not isinstance(raw_hours, list) or len(raw_hours) != len(categories):
+        raise MutationError("Please provide one hour value for each activity.")
+
+    try:
+        parsed_hours = [parse_pie_hours(value) for value in raw_hours]
+    except ValueError as exc:
+        raise MutationError(str(exc)) from None
+
+    if sum(parsed_hours) > MAX_PIE_HOURS:
+        raise MutationError("Tracked hours cannot exceed 24 for the current day.")
+
+    today = current_day()
+    existing_entries = PieEntry.query.filter_by(widget_id=widget.id, entry_date=today).all()
+    existing_by_index = {entry.category_index: entry for entry in existing_entries}
+    previous_hours = build_pie_values(existing_entries, len(categories))
+
+    for index, hours in enumerate(parsed_hours):
+        existing_entry = existing_by_index.get(index)
+        if hours == 0:
+            if existing_entry:
+                db.session.delete(existing_entry)
+            continue
+
+        if existing_entry:
+            existing_entry.hours = hours
         else:
-            db.session.delete(adjustment)
+            db.session.add(
+                PieEntry(
+                    widget_id=widget.id,
+                    category_index=index,
+                    hours=hours,
+                    entry_date=today,
+                )
+            )
+
+    upsert_rows(
+        PieRollup,
+        build_pie_rollup_rows(widget.id, today, previous_hours, parsed_hours),
+        ["widget_id", "period", "period_start", "category_index"],
+        ["hours", "days"],
+        increment=True,
+    )
+    bump_widget_version(widget)
+    if any(hours > 0 for hours in parsed_hours):
+        record_user_activity(widget.user_id)
+    else:
+        revoke_user_activity(widget.user_id)
+    return parsed_hours
+
+
+@app.route("/widgets/<int:widget_id>/radar/update-score", methods=["POST"])
+@login_required
+def update_radar_score(widget_id):
+    widget = DashboardWidget.query.filter_by(
+        id=widget_id, user_id=session["user_id"], widget_type="radar"
+    ).first_or_404()
 
+    data = request.get_json() or {}
+    try:
+        scores = change_radar_score(widget, data.get("index"), data.get("change"))
+    except MutationError as exc:
+        return jsonify({"error": str(exc)}), exc.status
+
+    domains = widget.radar_data.get_domains()
+    invalidate_dashboard(widget.user_id)
     db.session.commit()
 
-    return jsonify(
-        {
-            "theta": domains,
-            "r": [100 * sigmoid(score) for score in scores],
-            "scores": scores,
-            "today_deltas": get_today_radar_adjustments(widget, len(domains)),
-        }
-    )
+    result = {
+        "theta": domains,
+        "r": [100 * sigmoid(score) for score in scores],
+        "scores": scores,
+        "today_deltas": get_today_radar_adjustments(widget, len(domains)),
+        "version": widget.version,
+    }
+    publish_widget_event(widget.user_id, "widget.radar", {"id": widget.id, **result})
+    return jsonify(result)
 
 
 @app.route("/widgets/<int:widget_id>/bar/entry", methods=["POST"])
@@ -588,21 +3845,20 @@ def create_bar_entry(widget_id):
 
     data = request.get_json() or {}
     try:
-        value = float(data.get("value"))
-    except (TypeError, ValueError):
-        return jsonify({"error": "Please enter a valid number."}), 400
-
-    if value < 0:
-        return jsonify({"error": "Please enter a positive number."}), 400
-
-    today = current_day()
-    existing_entry = BarEntry.query.filter_by(widget_id=widget.id, date=today).first()
-    if existing_entry:
-        return jsonify({"error": "Today's bar already exists. Update or delete it instead."}), 400
-
-    db.session.add(BarEntry(widget_id=widget.id, value=value, date=today))
+        days = parse_window_days()
+        entry = insert_today_bar_entry(widget, parse_bar_value(data.get("value")))
+    except MutationError as exc:
+        return jsonify({"error": str(exc)}), exc.status
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    invalidate_dashboard(widget.user_id)
     db.session.commit()
-    return jsonify({"widget": serialize_bar_widget(widget)})
+    delta = serialize_bar_delta(widget, current_day(), entry)
+    publish_widget_event(widget.user_id, "widget.bar", delta)
+    if wants_delta_response():
+        return jsonify({"delta": delta})
+    return jsonify({"widget": serialize_bar_widget(widget, days=days, compact=wants_compact_dates())})
 
 
 @app.route("/widgets/<int:widget_id>/bar/entry", methods=["PUT"])
@@ -614,39 +3870,114 @@ def update_bar_entry(widget_id):
 
     data = request.get_json() or {}
     try:
-        value = float(data.get("value"))
-    except (TypeError, ValueError):
-        return jsonify({"error": "Please enter a valid number."}), 400
+        days = parse_window_days()
+        entry = update_today_bar_entry(widget, parse_bar_value(data.get("value")))
+    except MutationError as exc:
+        return jsonify({"error": str(exc)}), exc.status
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    invalidate_dashboard(widget.user_id)
+    db.session.commit()
+    delta = serialize_bar_delta(widget, current_day(), entry)
+    publish_widget_event(widget.user_id, "widget.bar", delta)
+    if wants_delta_response():
+        return jsonify({"delta": delta})
+    return jsonify({"widget": serialize_bar_widget(widget, days=days, compact=wants_compact_dates())})
 
-    if value < 0:
-        return jsonify({"error": "Please enter a positive number."}), 400
 
-    today = current_day()
-    existing_entry = BarEntry.query.filter_by(widget_id=widget.id, date=today).first()
-    if not existing_entry:
-        return jsonify({"error": "No bar has been entered for today yet."}), 404
+@app.route("/widgets/<int:widget_id>/bar/entry", methods=["DELETE"])
+@login_required
+def delete_bar_entry(widget_id):
+    widget = DashboardWidget.query.filter_by(
+        id=widget_id, user_id=session["user_id"], widget_type="bar"
+    ).first_or_404()
 
-    existing_entry.value = value
-    existing_entry.timestamp = datetime.utcnow()
+    try:
+        days = parse_window_days()
+        delete_today_bar_entry(widget)
+    except MutationError as exc:
+        return jsonify({"error": str(exc)}), exc.status
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    invalidate_dashboard(widget.user_id)
     db.session.commit()
-    return jsonify({"widget": serialize_bar_widget(widget)})
+    delta = serialize_bar_delta(widget, current_day(), None)
+    publish_widget_event(widget.user_id, "widget.bar", delta)
+    if wants_delta_response():
+        return jsonify({"delta": delta})
+    return jsonify({"widget": serialize_bar_widget(widget, days=days, compact=wants_compact_dates())})
 
 
-@app.route("/widgets/<int:widget_id>/bar/entry", methods=["DELETE"])
+@app.route("/widgets/<int:widget_id>/bar/history")
 @login_required
-def delete_bar_entry(widget_id):
+def bar_history(widget_id):
+    """Page backwards through a bar widget's entries, newest first.
+
+    Pass the ``next_before`` value of a page as ``before`` to get the next one.
+    """
     widget = DashboardWidget.query.filter_by(
         id=widget_id, user_id=session["user_id"], widget_type="bar"
     ).first_or_404()
 
-    today = current_day()
-    existing_entry = BarEntry.query.filter_by(widget_id=widget.id, date=today).first()
-    if not existing_entry:
-        return jsonify({"error": "No bar has been entered for today yet."}), 404
+    try:
+        limit = parse_int_arg("limit", BAR_HISTORY_PAGE_SIZE, 1, MAX_BAR_HISTORY_PAGE_SIZE)
+        raw_before = request.args.get("before")
+        before = parse_iso_date(raw_before) if raw_before else None
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    query = BarEntry.query.filter(BarEntry.widget_id == widget.id)
+    if before:
+        query = query.filter(BarEntry.date < before)
+    entries = query.order_by(BarEntry.date.desc()).limit(limit).all()
+
+    next_before = entries[-1].date.isoformat() if len(entries) == limit else None
+    compact = wants_compact_dates()
+    return jsonify(
+        {
+            "entries": [entry.to_dict(compact) for entry in entries],
+            "next_before": next_before,
+        }
+    )
 
-    db.session.delete(existing_entry)
-    db.session.commit()
-    return jsonify({"widget": serialize_bar_widget(widget)})
+
+@app.route("/widgets/<int:widget_id>/bar/series")
+@login_required
+def bar_series(widget_id):
+    """A bar widget's history over any range, reduced to about ``points`` values.
+
+    ``resolution`` is day, week, month, lttb or auto (the default), and week and
+    month buckets are combined with ``agg`` (sum, mean or max). The range runs
+    from ``start`` to ``end``, by default the year up to today.
+    """
+    widget = DashboardWidget.query.filter_by(
+        id=widget_id, user_id=session["user_id"], widget_type="bar"
+    ).first_or_404()
+
+    try:
+        raw_end = request.args.get("end")
+        end = parse_iso_date(raw_end) if raw_end else current_day()
+        raw_start = request.args.get("start")
+        start = parse_iso_date(raw_start) if raw_start else end - timedelta(days=BAR_SERIES_DAYS - 1)
+        if start > end:
+            raise ValueError("The start date must not be after the end date.")
+        if (end - start).days >= MAX_BAR_SERIES_DAYS:
+            raise ValueError(f"The range must not exceed {MAX_BAR_SERIES_DAYS} days.")
+        points = parse_int_arg("points", BAR_SERIES_POINTS, 3, MAX_BAR_SERIES_POINTS)
+        resolution = request.args.get("resolution", "auto")
+        if resolution not in BAR_SERIES_RESOLUTIONS:
+            raise ValueError('"resolution" must be auto, day, week, month or lttb.')
+        aggregate = request.args.get("agg", "sum")
+        if aggregate not in BAR_SERIES_AGGREGATES:
+            raise ValueError('"agg" must be sum, mean or max.')
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    return jsonify(
+        build_bar_resolution_series(widget, start, end, resolution, aggregate, points, wants_compact_dates())
+    )
 
 
 @app.route("/widgets/<int:widget_id>/pie/entry", methods=["PUT"])
@@ -657,52 +3988,855 @@ def update_pie_entry(widget_id):
     ).first_or_404()
 
     data = request.get_json() or {}
-    raw_hours = data.get("hours")
-    categories = widget.pie_data.get_categories()
+    try:
+        parsed_hours = save_today_pie_hours(widget, data.get("hours"))
+    except MutationError as exc:
+        return jsonify({"error": str(exc)}), exc.status
 
-    if not isinstance(raw_hours, list) or len(raw_hours) != len(categories):
-        return jsonify({"error": "Please provide one hour value for each activity."}), 400
+    invalidate_dashboard(widget.user_id)
+    db.session.commit()
+    delta = serialize_pie_delta(widget, parsed_hours)
+    publish_widget_event(widget.user_id, "widget.pie", delta)
+    if wants_delta_response():
+        return jsonify({"delta": delta})
+    return jsonify({"widget": serialize_pie_widget(widget)})
+
+
+SYNC_OPERATION_TYPES = {"radar.change": "radar", "bar.set": "bar", "bar.delete": "bar", "pie.set": "pie"}
 
-    parsed_hours = []
-    for value in raw_hours:
+
+def apply_sync_operation(widget, operation):
+    """Apply one queued client change to ``widget``; raises ValueError when it is refused.
+
+    An operation may name the ``date`` it was made on. Only today's data can
+    change, so an operation queued on a day that has since ended is refused
+    rather than applied to the wrong day.
+    """
+    operation_type = operation.get("op")
+    if operation_type not in SYNC_OPERATION_TYPES:
+        raise MutationError(f'Unknown operation "{operation_type}".')
+    if widget is None or widget.widget_type != SYNC_OPERATION_TYPES[operation_type]:
+        raise MutationError("Widget not found.", 404)
+    raw_date = operation.get("date")
+    if raw_date is not None and parse_iso_date(raw_date) != current_day():
+        raise MutationError("That day is over; only today's entries can still change.", 409)
+
+    if operation_type == "radar.change":
+        change_radar_score(widget, operation.get("index"), operation.get("change"))
+    elif operation_type == "bar.set":
+        value = parse_bar_value(operation.get("value"))
+        if find_today_bar_entry(widget):
+            update_today_bar_entry(widget, value)
+        else:
+            insert_today_bar_entry(widget, value)
+    elif operation_type == "bar.delete":
+        delete_today_bar_entry(widget)
+    else:
+        save_today_pie_hours(widget, operation.get("hours"))
+
+
+@app.route("/sync", methods=["POST"])
+@login_required
+def sync_operations():
+    """Apply a batch of queued client changes, in order, in one transaction.
+
+    Each operation runs in a savepoint, so a refused one is rolled back on its
+    own and reported in its result while the rest still apply. Operations
+    carry a client-generated ``key``; the outcome is stored under it, and a
+    retried batch gets the stored outcome back instead of a second change.
+    """
+    data = request.get_json() or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "Provide a non-empty list of operations."}), 400
+    if len(operations) > MAX_SYNC_OPERATIONS:
+        return jsonify({"error": f"Send at most {MAX_SYNC_OPERATIONS} operations per batch."}), 400
+    for operation in operations:
+        key = operation.get("key") if isinstance(operation, dict) else None
+        if not isinstance(key, str) or not 0 < len(key) <= MAX_SYNC_KEY_LENGTH:
+            return jsonify({"error": f"Every operation needs a key of 1 to {MAX_SYNC_KEY_LENGTH} characters."}), 400
+        widget_id = operation.get("widget_id")
+        if not isinstance(widget_id, int) or isinstance(widget_id, bool):
+            return jsonify({"error": "Every operation needs the integer id of its widget."}), 400
+
+    user_id = session["user_id"]
+    for attempt in range(2):
         try:
-            parsed_value = float(value)
-        except (TypeError, ValueError):
-            return jsonify({"error": "Please enter valid hour values."}), 400
+            results, versions, applied = apply_sync_batch(user_id, operations)
+            if applied:
+                invalidate_dashboard(user_id)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # A concurrent batch stored an outcome under one of these keys
+            # first. Its changes stand and ours are rolled back; running the
+            # batch again replays its outcomes and applies the rest.
+            db.session.rollback()
+    else:
+        return jsonify({"error": "Another batch with the same keys is being applied; try again."}), 409
 
-        if parsed_value < 0:
-            return jsonify({"error": "Hours cannot be negative."}), 400
+    for widget_id in applied:
+        publish_widget_event(user_id, "widget.changed", {"id": widget_id, "version": versions[str(widget_id)]})
+    return jsonify({"results": results, "versions": versions})
 
-        parsed_hours.append(round(parsed_value, 2))
 
-    if sum(parsed_hours) > 24:
-        return jsonify({"error": "Tracked hours cannot exceed 24 for the current day."}), 400
+def stored_sync_outcomes(user_id, keys):
+    """The outcomes already stored under some of ``keys``, by key."""
+    return {
+        outcome.key: outcome
+        for outcome in SyncOperation.query.filter(SyncOperation.user_id == user_id, SyncOperation.key.in_(keys))
+    }
 
-    today = current_day()
-    existing_entries = PieEntry.query.filter_by(widget_id=widget.id, entry_date=today).all()
-    existing_by_index = {entry.category_index: entry for entry in existing_entries}
 
-    for index, hours in enumerate(parsed_hours):
-        existing_entry = existing_by_index.get(index)
-        if hours == 0:
-            if existing_entry:
-                db.session.delete(existing_entry)
+def apply_sync_batch(user_id, operations):
+    """Apply the operations not applied before; the caller commits.
+
+    Returns the per-operation results, the version of each widget named in
+    the batch, and the ids of the widgets this call changed.
+    """
+    # This DELETE also opens the transaction. The savepoints below must nest
+    # inside it: under SQLite, releasing an outermost savepoint commits.
+    SyncOperation.query.filter(
+        SyncOperation.user_id == user_id,
+        SyncOperation.created_at < datetime.utcnow() - timedelta(days=SYNC_KEY_RETENTION_DAYS),
+    ).delete(synchronize_session=False)
+
+    outcomes = stored_sync_outcomes(user_id, [operation["key"] for operation in operations])
+    widget_ids = {operation["widget_id"] for operation in operations}
+    widgets = {
+        widget.id: widget
+        for widget in DashboardWidget.query.filter(
+            DashboardWidget.user_id == user_id, DashboardWidget.id.in_(widget_ids)
+        ).options(
+            joinedload(DashboardWidget.radar_data),
+            joinedload(DashboardWidget.pie_data),
+            selectinload(DashboardWidget.radar_domains),
+            selectinload(DashboardWidget.pie_categories),
+        )
+    }
+
+    results, applied = [], set()
+    for operation in operations:
+        outcome = outcomes.get(operation["key"])
+        if outcome:
+            results.append({**outcome.to_dict(), "replayed": True})
             continue
 
-        if existing_entry:
-            existing_entry.hours = hours
+        savepoint = db.session.begin_nested()
+        try:
+            apply_sync_operation(widgets.get(operation["widget_id"]), operation)
+            savepoint.commit()
+            status, error = 200, None
+            applied.add(operation["widget_id"])
+        except ValueError as exc:
+            savepoint.rollback()
+            status, error = getattr(exc, "status", 400), str(exc)
+
+        outcome = SyncOperation(user_id=user_id, key=operation["key"], status=status, error=error)
+        db.session.add(outcome)
+        outcomes[outcome.key] = outcome
+        results.append(outcome.to_dict())
+
+    # Versions are bumped with a SQL expression, so the loaded widgets hold
+    # expired values; read them all in one query instead of a reload per widget.
+    versions = {
+        str(widget_id): version
+        for widget_id, version in db.session.query(DashboardWidget.id, DashboardWidget.version).filter(
+            DashboardWidget.id.in_(widgets)
+        )
+    }
+    return results, versions, applied
+
+
+def format_server_event(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/events")
+@login_required
+def event_stream():
+    """Stream the current user's widget changes as server-sent events.
+
+    A comment line goes out every ``EVENT_HEARTBEAT_SECONDS`` to keep proxies
+    from closing an idle stream. Streams end after ``EVENT_STREAM_MAX_SECONDS``
+    so worker threads are recycled. The browser then reconnects on its own,
+    sending ``Last-Event-ID``, and the events it missed are replayed.
+    """
+    user_id = session["user_id"]
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscription = event_broker.subscribe(user_id, last_event_id)
+    heartbeat = app.config["EVENT_HEARTBEAT_SECONDS"]
+    closes_at = time.monotonic() + app.config["EVENT_STREAM_MAX_SECONDS"]
+
+    def generate():
+        try:
+            yield f"retry: {app.config['EVENT_RETRY_MS']}\n\n"
+            while time.monotonic() < closes_at:
+                events = subscription.get(timeout=min(heartbeat, max(0.0, closes_at - time.monotonic())))
+                if not events:
+                    yield ": heartbeat\n\n"
+                for event_id, event_type, data in events:
+                    yield format_server_event(event_id, event_type, data)
+        finally:
+            subscription.close()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/export")
+@login_required
+def export_history():
+    """Stream every widget and history row of the current user as NDJSON or CSV."""
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": '"format" must be ndjson or csv.'}), 400
+
+    filename = f"w-progvis-{session['username']}-{current_day().strftime('%Y-%m-%d')}.{export_format}"
+    return Response(
+        stream_with_context(iter_export_chunks(iter_export_records(session["user_id"]), export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.route("/widgets/<int:widget_id>/import", methods=["POST"])
+@login_required
+def import_entries(widget_id):
+    """Import dated history into a widget from a CSV or JSONL request body.
+
+    Bar rows have ``date`` and ``value``, pie rows ``date``, ``category`` and
+    ``hours``, radar rows ``date``, ``domain`` and ``delta``. The format comes
+    from ``?format=csv|jsonl`` or else from the ``text/csv`` content type.
+    """
+    widget = DashboardWidget.query.filter_by(id=widget_id, user_id=session["user_id"]).first_or_404()
+
+    import_format = request.args.get("format") or ("csv" if request.mimetype == "text/csv" else "jsonl")
+    try:
+        records = read_import_records(request.get_data(as_text=True), import_format)
+        imported = import_widget_entries(widget, records)
+    except ValueError as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), 400
+
+    return jsonify({"imported": imported})
+
+
+@app.route("/widgets/<int:widget_id>/pie/summary")
+@login_required
+def pie_summary(widget_id):
+    """Summarize a pie widget over a week, a month or a custom range.
+
+    ``period=week`` and ``period=month`` cover the calendar period containing
+    ``date`` (today by default); ``period=custom`` takes ``start`` and ``end``.
+    """
+    widget = DashboardWidget.query.filter_by(
+        id=widget_id, user_id=session["user_id"], widget_type="pie"
+    ).first_or_404()
+
+    period = request.args.get("period", "week")
+    try:
+        if period in PIE_PERIODS:
+            raw_date = request.args.get("date")
+            start = pie_period_start(period, parse_iso_date(raw_date) if raw_date else current_day())
+            end = pie_period_end(period, start)
+        elif period == "custom":
+            start = parse_iso_date(request.args.get("start"))
+            end = parse_iso_date(request.args.get("end"))
+            if start > end:
+                raise ValueError("The start date must not be after the end date.")
         else:
-            db.session.add(
-                PieEntry(
-                    widget_id=widget.id,
-                    category_index=index,
-                    hours=hours,
-                    entry_date=today,
+            raise ValueError('"period" must be week, month or custom.')
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    return jsonify({"period": period, **summarize_pie_range(widget, start, end)})
+
+
+@app.route("/widgets/<int:widget_id>/analytics")
+@login_required
+def widget_analytics(widget_id):
+    """Streaks and consistency of a bar or radar widget, with moving averages and a trend for bars.
+
+    The history-wide figures are stored per widget and only the days since the
+    last request or write are added, so long histories are not read again.
+    """
+    widget = DashboardWidget.query.filter(
+        DashboardWidget.id == widget_id,
+        DashboardWidget.user_id == session["user_id"],
+        DashboardWidget.widget_type.in_(ANALYTICS_WIDGET_TYPES),
+    ).first_or_404()
+
+    rows = refresh_widget_analytics(widget)
+    payload = serialize_widget_analytics(widget, rows, wants_compact_dates())
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request stored the same widget's analytics first.
+        db.session.rollback()
+    return jsonify(payload)
+
+
+@app.route("/widgets/<int:widget_id>/snapshot")
+@login_required
+def widget_snapshot(widget_id):
+    """Render a widget's chart server-side as SVG or PNG.
+
+    Images are cached on disk under the widget's version, the day and the
+    request's parameters, so a chart that has not changed since it was last
+    drawn is served without loading its history. This relies on every write
+    to what a chart shows bumping the version in the same transaction: the
+    entry, score and import routes, ``/sync``, radar decay (lazy or from
+    ``apply-radar-decay``) and ``backfill-radar-snapshots`` all do, and a new
+    data path must too.
+    """
+    snapshot_format = request.args.get("format", "svg")
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        return jsonify({"error": '"format" must be svg or png.'}), 400
+    try:
+        width = parse_int_arg("width", SNAPSHOT_WIDTH, MIN_SNAPSHOT_SIZE, MAX_SNAPSHOT_SIZE)
+        height = parse_int_arg("height", SNAPSHOT_HEIGHT, MIN_SNAPSHOT_SIZE, MAX_SNAPSHOT_SIZE)
+        bar_days = parse_window_days()
+        compare_day = parse_compare_day()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    user_id = session["user_id"]
+    apply_radar_decay_for_user(user_id)
+    widget = DashboardWidget.query.filter_by(id=widget_id, user_id=user_id).first_or_404()
+    # Every change to what a chart shows bumps the widget's version, and the
+    # bar window and radar comparison move with the day.
+    key = (SNAPSHOT_RENDERER_VERSION, widget.id, widget.version, current_day(), bar_days, compare_day, width, height)
+    digest = hashlib.sha256(repr(key).encode()).hexdigest()
+
+    name = f"{digest}.{snapshot_format}"
+    image = snapshot_cache.get(name)
+    cache_status = "hit"
+    if image is None:
+        payload = serialize_widget(widget, bar_days=bar_days, compare_day=compare_day)
+        try:
+            image = render_snapshot(build_snapshot_spec(payload, width, height), snapshot_format)
+        except RuntimeError as exc:
+            return jsonify({"error": str(exc)}), 501
+        snapshot_cache.set(name, image)
+        cache_status = "miss"
+
+    response = Response(image, mimetype=SNAPSHOT_FORMATS[snapshot_format])
+    response.set_etag(digest)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["X-Snapshot-Cache"] = cache_status
+    return response.make_conditional(request)
+
+
+def parse_leaderboard_cursor(raw_value):
+    """The (score, user id) of the row a leaderboard page continues after, from its ``next_after`` value."""
+    score, separator, user_id = raw_value.partition(":")
+    if not (separator and score.isdigit() and user_id.isdigit()):
+        raise ValueError('"after" must be the "next_after" value of the previous page.')
+    return int(score), int(user_id)
+
+
+@app.route("/leaderboard")
+@login_required
+def leaderboard():
+    """Page through the leaderboard, best first.
+
+    Pages follow the rank index from the ``after`` cursor, the ``next_after``
+    value of the previous page, so a late page costs the same as the first.
+    """
+    try:
+        raw_after = request.args.get("after")
+        after = parse_leaderboard_cursor(raw_after) if raw_after else None
+        limit = parse_int_arg("limit", LEADERBOARD_PAGE_SIZE, 1, MAX_LEADERBOARD_PAGE_SIZE)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    page = leaderboard_cache.get((after, limit))
+    if page is None:
+        query = LeaderboardEntry.query.options(joinedload(LeaderboardEntry.user))
+        if after:
+            score, user_id = after
+            query = query.filter(
+                db.or_(
+                    LeaderboardEntry.score < score,
+                    db.and_(LeaderboardEntry.score == score, LeaderboardEntry.user_id > user_id),
+                )
+            )
+        entries = query.order_by(LeaderboardEntry.score.desc(), LeaderboardEntry.user_id).limit(limit + 1).all()
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        ranks = leaderboard_ranks([entry.score for entry in entries])
+        page = {
+            "entries": [entry.to_dict(ranks[entry.score]) for entry in entries],
+            "has_more": has_more,
+            "next_after": f"{entries[-1].score}:{entries[-1].user_id}" if has_more else None,
+        }
+        leaderboard_cache.set((after, limit), page)
+
+    return jsonify(page)
+
+
+@app.route("/leaderboard/me")
+@login_required
+def leaderboard_me():
+    """Return the current user's rank with the users just above and below."""
+    try:
+        neighbors = parse_int_arg("neighbors", 3, 0, MAX_LEADERBOARD_NEIGHBORS)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    entry = db.session.get(LeaderboardEntry, session["user_id"])
+    if entry is None:
+        return jsonify({"me": None, "above": [], "below": []})
+
+    above = (
+        LeaderboardEntry.query.options(joinedload(LeaderboardEntry.user))
+        .filter(
+            db.or_(
+                LeaderboardEntry.score > entry.score,
+                db.and_(LeaderboardEntry.score == entry.score, LeaderboardEntry.user_id < entry.user_id),
+            )
+        )
+        .order_by(LeaderboardEntry.score, LeaderboardEntry.user_id.desc())
+        .limit(neighbors)
+        .all()
+    )
+    below = (
+        LeaderboardEntry.query.options(joinedload(LeaderboardEntry.user))
+        .filter(
+            db.or_(
+                LeaderboardEntry.score < entry.score,
+                db.and_(LeaderboardEntry.score == entry.score, LeaderboardEntry.user_id > entry.user_id),
+            )
+        )
+        .order_by(LeaderboardEntry.score.desc(), LeaderboardEntry.user_id)
+        .limit(neighbors)
+        .all()
+    )
+    ranks = leaderboard_ranks([item.score for item in (entry, *above, *below)])
+    return jsonify(
+        {
+            "me": entry.to_dict(ranks[entry.score]),
+            "above": [item.to_dict(ranks[item.score]) for item in reversed(above)],
+            "below": [item.to_dict(ranks[item.score]) for item in below],
+        }
+    )
+
+
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1"}
+
+
+def metrics_allowed():
+    token = app.config["METRICS_TOKEN"]
+    if token:
+        return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    return request.remote_addr in LOOPBACK_ADDRESSES
+
+
+@app.route("/metrics")
+def metrics():
+    if not metrics_allowed():
+        return jsonify({"error": "Not allowed."}), 403
+    body = request_metrics.render(
+        {
+            "dashboard": dashboard_cache,
+            "leaderboard": leaderboard_cache,
+            "bar_series": bar_series_cache,
+            "snapshot": snapshot_cache,
+        }
+    )
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+@app.cli.command("import-entries")
+@click.argument("widget_id", type=int)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "import_format", type=click.Choice(["csv", "jsonl"]), help="Defaults to the file extension.")
+@click.option("--chunk-size", default=IMPORT_CHUNK_SIZE, show_default=True)
+def import_entries_command(widget_id, path, import_format, chunk_size):
+    """Import dated history from a CSV or JSONL file into a widget."""
+    shards = [shard for shard in each_shard() if db.session.get(DashboardWidget, widget_id) is not None]
+    if not shards:
+        raise click.ClickException(f"Widget {widget_id} does not exist.")
+
+    import_format = import_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, encoding="utf-8", newline="") as handle:
+        raw_data = handle.read()
+
+    started = time.perf_counter()
+    with using_shard(shards[0]):
+        widget = db.session.get(DashboardWidget, widget_id)
+        try:
+            imported = import_widget_entries(widget, read_import_records(raw_data, import_format), chunk_size)
+        except ValueError as exc:
+            db.session.rollback()
+            raise click.ClickException(str(exc)) from None
+    click.echo(f"Imported {imported} rows into widget {widget_id} in {time.perf_counter() - started:.2f}s.")
+
+
+@app.cli.command("export-history")
+@click.argument("username")
+@click.option("--format", "export_format", type=click.Choice(sorted(EXPORT_FORMATS)), default="ndjson", show_default=True)
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-", help="Defaults to stdout.")
+def export_history_command(username, export_format, output):
+    """Write a user's full history as NDJSON or CSV."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'User "{username}" does not exist.')
+
+    with using_shard(shard_assignments([user.id])[user.id]):
+        for chunk in iter_export_chunks(iter_export_records(user.id), export_format):
+            output.write(chunk)
+
+
+@app.cli.command("rebuild-leaderboard")
+def rebuild_leaderboard_command():
+    """Recompute every user's leaderboard score from their logged history."""
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    for offset in range(0, len(user_ids), CLI_CHUNK_SIZE):
+        rebuild_leaderboard_entries(user_ids[offset : offset + CLI_CHUNK_SIZE])
+        db.session.commit()
+    rebuild_leaderboard_rank_tree()
+    db.session.commit()
+    click.echo(f"Rebuilt leaderboard scores for {len(user_ids)} users.")
+
+
+@app.cli.command("rebuild-pie-rollups")
+def rebuild_pie_rollups_command():
+    """Recompute every pie widget's week and month rollups from its daily entries."""
+    rebuilt = 0
+    for _ in each_shard():
+        widget_ids = [
+            widget_id for (widget_id,) in db.session.query(PieWidgetData.widget_id).order_by(PieWidgetData.widget_id)
+        ]
+        for offset in range(0, len(widget_ids), CLI_CHUNK_SIZE):
+            rebuild_pie_rollups(widget_ids[offset : offset + CLI_CHUNK_SIZE])
+            db.session.commit()
+        rebuilt += len(widget_ids)
+    click.echo(f"Rebuilt rollups for {rebuilt} pie widgets.")
+
+
+@app.cli.command("rebalance-widget-positions")
+def rebalance_widget_positions_command():
+    """Spread every user's widget positions evenly apart again, keeping their order."""
+    rebalanced = 0
+    for _ in each_shard():
+        user_ids = [
+            user_id
+            for (user_id,) in db.session.query(DashboardWidget.user_id).distinct().order_by(DashboardWidget.user_id)
+        ]
+        for offset in range(0, len(user_ids), CLI_CHUNK_SIZE):
+            for user_id in user_ids[offset : offset + CLI_CHUNK_SIZE]:
+                write_widget_order(user_id, ordered_widget_ids(user_id))
+                invalidate_dashboard(user_id)
+            db.session.commit()
+        rebalanced += len(user_ids)
+    click.echo(f"Rebalanced widget positions for {rebalanced} users.")
+
+
+@app.cli.command("apply-radar-decay")
+@click.option("--chunk-size", default=CLI_CHUNK_SIZE, show_default=True)
+def apply_radar_decay_command(chunk_size):
+    """Catch up the inactivity decay of every radar widget, chunk by chunk."""
+    evaluated = changed = 0
+    for _ in each_shard():
+        last_id = 0
+        while True:
+            radar_rows = (
+                RadarWidgetData.query.options(
+                    joinedload(RadarWidgetData.widget).selectinload(DashboardWidget.radar_domains)
                 )
+                .filter(RadarWidgetData.id > last_id)
+                .order_by(RadarWidgetData.id)
+                .limit(chunk_size)
+                .all()
             )
+            if not radar_rows:
+                break
+
+            last_id = radar_rows[-1].id
+            decayed = apply_radar_decay(radar_rows)
+            evaluated += len(radar_rows)
+            changed += len(decayed)
+            for user_id in {radar.widget.user_id for radar in decayed}:
+                invalidate_dashboard(user_id)
+            db.session.commit()
+
+    click.echo(f"Evaluated {evaluated} radar widgets, {changed} decayed.")
+
+
+def replay_radar_history(radar, start_day):
+    """Replay a radar's scores day by day from ``start_day`` to today, decay included.
+
+    Starts from the last snapshot before ``start_day`` (zero scores without
+    one), adds each day's logged adjustments and takes the decay steps
+    ``apply_radar_decay`` takes, on the days it has evaluated. Returns the
+    snapshot rows of the days whose scores moved, plus today, and the scores
+    reached today.
+    """
+    domain_count = len(radar.get_domains())
+    today = current_day()
+    previous = (
+        RadarScoreSnapshot.query.filter(
+            RadarScoreSnapshot.widget_id == radar.widget_id, RadarScoreSnapshot.snapshot_date < start_day
+        )
+        .order_by(RadarScoreSnapshot.snapshot_date.desc())
+        .first()
+    )
+    scores = np.array(previous.get_scores() if previous else [0.0] * domain_count, dtype=float)
+
+    # As in apply_radar_decay, a domain's inactive run starts at its last
+    # gain, or at the widget's creation.
+    anchors = np.full(domain_count, (radar.widget.created_at.date() - start_day).days)
+    anchor_rows = (
+        db.session.query(RadarDailyAdjustment.domain_index, db.func.max(RadarDailyAdjustment.entry_date))
+        .filter(
+            RadarDailyAdjustment.widget_id == radar.widget_id,
+            RadarDailyAdjustment.delta > 0,
+            RadarDailyAdjustment.entry_date < start_day,
+        )
+        .group_by(RadarDailyAdjustment.domain_index)
+    )
+    for domain_index, anchor_day in anchor_rows:
+        if domain_index < domain_count:
+            anchors[domain_index] = max(anchors[domain_index], (anchor_day - start_day).days)
 
+    adjustments = (
+        db.session.query(
+            RadarDailyAdjustment.entry_date,
+            RadarDailyAdjustment.domain_index,
+            RadarDailyAdjustment.delta,
+        )
+        .filter(
+            RadarDailyAdjustment.widget_id == radar.widget_id,
+            RadarDailyAdjustment.entry_date >= start_day,
+            RadarDailyAdjustment.entry_date <= today,
+            RadarDailyAdjustment.domain_index < domain_count,
+        )
+        .all()
+    )
+    deltas = np.zeros(((today - start_day).days + 1, domain_count))
+    offsets = np.array([(item.entry_date - start_day).days for item in adjustments], dtype="int64")
+    domains = np.array([item.domain_index for item in adjustments], dtype="int64")
+    np.add.at(deltas, (offsets, domains), [item.delta for item in adjustments])
+
+    steps = np.zeros(deltas.shape, dtype=bool)
+    if radar.decay_evaluated_on is not None and radar.decay_evaluated_on >= start_day:
+        evaluated = (radar.decay_evaluated_on - start_day).days + 1
+        steps[:evaluated] = find_decay_steps(deltas[:evaluated] > 0, anchors)
+
+    rows = []
+    for offset in np.flatnonzero(deltas.any(axis=1) | steps.any(axis=1)).tolist():
+        scores = scores + deltas[offset]
+        # A step takes a point off but never pushes a score under the floor.
+        scores = np.where(steps[offset], np.maximum(scores - 1, np.minimum(scores, RADAR_DECAY_FLOOR)), scores)
+        rows.append(
+            {
+                "widget_id": radar.widget_id,
+                "snapshot_date": start_day + timedelta(days=offset),
+                "scores": json.dumps(scores.tolist()),
+            }
+        )
+    if not rows or rows[-1]["snapshot_date"] != today:
+        rows.append({"widget_id": radar.widget_id, "snapshot_date": today, "scores": json.dumps(scores.tolist())})
+    return rows, scores.tolist()
+
+
+@app.cli.command("backfill-radar-snapshots")
+@click.option("--all", "include_existing", is_flag=True, help="Also rebuild radars that already have snapshots.")
+@click.option("--chunk-size", default=CLI_CHUNK_SIZE, show_default=True)
+def backfill_radar_snapshots_command(include_existing, chunk_size):
+    """Write daily score snapshots for radars created before snapshots were recorded."""
+    backfilled = 0
+    for _ in each_shard():
+        last_id = 0
+        while True:
+            query = RadarWidgetData.query.filter(RadarWidgetData.id > last_id)
+            if not include_existing:
+                query = query.filter(
+                    ~db.exists().where(RadarScoreSnapshot.widget_id == RadarWidgetData.widget_id)
+                )
+            radar_rows = query.order_by(RadarWidgetData.id).limit(chunk_size).all()
+            if not radar_rows:
+                break
+
+            last_id = radar_rows[-1].id
+            rows = []
+            for radar in radar_rows:
+                first_day = (
+                    db.session.query(db.func.min(RadarDailyAdjustment.entry_date))
+                    .filter(RadarDailyAdjustment.widget_id == radar.widget_id)
+                    .scalar()
+                )
+                replayed, _ = replay_radar_history(radar, first_day or current_day())
+                # Decay applied before snapshots existed may not have followed
+                # today's rules, so today keeps the stored scores.
+                replayed[-1]["scores"] = json.dumps(radar.get_scores())
+                rows.extend(replayed)
+            upsert_rows(RadarScoreSnapshot, rows, ["widget_id", "snapshot_date"], ["scores"])
+            # Cached snapshot images are keyed on the version; redraw their comparisons.
+            widget_ids = [radar.widget_id for radar in radar_rows]
+            DashboardWidget.query.filter(DashboardWidget.id.in_(widget_ids)).update(
+                {DashboardWidget.version: DashboardWidget.version + 1}, synchronize_session=False
+            )
+            user_ids = {
+                user_id
+                for (user_id,) in db.session.query(DashboardWidget.user_id).filter(DashboardWidget.id.in_(widget_ids))
+            }
+            for user_id in user_ids:
+                invalidate_dashboard(user_id)
+            db.session.commit()
+            backfilled += len(radar_rows)
+
+    click.echo(f"Backfilled snapshots for {backfilled} radar widgets.")
+
+
+def user_widget_rows(table, user_id, widget_ids):
+    """The condition selecting one user's rows of a sharded table."""
+    if "widget_id" in table.c:
+        return table.c.widget_id.in_(widget_ids)
+    return table.c.user_id == user_id
+
+
+def copy_user_widgets(user_id, source, target):
+    """Copy every widget row of a user from one database to another; returns the rows copied.
+
+    Widget ids are kept, the rows of the other tables get new ids from the
+    target. Everything is written in one transaction on the target, so a
+    failed copy leaves nothing behind there.
+    """
+    widgets = DashboardWidget.__table__
+    tables = [table for table in db.metadata.sorted_tables if table in SHARDED_TABLES]
+    copied = 0
+    with db.engines[source].connect() as reader, db.engines[target].begin() as writer:
+        widget_ids = reader.execute(db.select(widgets.c.id).where(widgets.c.user_id == user_id)).scalars().all()
+        for table in tables:
+            statement = db.select(table).where(user_widget_rows(table, user_id, widget_ids))
+            result = reader.execute(statement.execution_options(yield_per=CLI_CHUNK_SIZE))
+            for partition in result.mappings().partitions():
+                rows = [dict(row) for row in partition]
+                if table is not widgets:
+                    for row in rows:
+                        del row["id"]
+                writer.execute(table.insert(), rows)
+                copied += len(rows)
+    return copied
+
+
+def delete_user_widgets(user_id, shard):
+    """Delete every widget row of a user from one database."""
+    widgets = DashboardWidget.__table__
+    tables = [table for table in db.metadata.sorted_tables if table in SHARDED_TABLES]
+    with db.engines[shard].begin() as connection:
+        widget_ids = connection.execute(
+            db.select(widgets.c.id).where(widgets.c.user_id == user_id)
+        ).scalars().all()
+        for table in reversed(tables):
+            connection.execute(table.delete().where(user_widget_rows(table, user_id, widget_ids)))
+
+
+def move_users(targets):
+    """Move users' widgets to other databases, given a target shard per user id; returns the rows copied.
+
+    The users are flagged as moving first, so their requests are answered
+    with 503 until their new shard is recorded. A user whose copy fails stays
+    where they were.
+    """
+    assignments = {}
+    for user_id in targets:
+        assignment = db.session.get(ShardAssignment, user_id) or ShardAssignment(user_id=user_id)
+        assignment.moving = True
+        db.session.add(assignment)
+        assignments[user_id] = assignment
     db.session.commit()
-    return jsonify({"widget": serialize_pie_widget(widget)})
+    # Requests that checked the assignment just before the flag was set may
+    # still be writing to the old shard.
+    time.sleep(app.config["SHARD_MOVE_GRACE_SECONDS"])
+
+    copied = 0
+    for user_id, target in targets.items():
+        assignment = assignments[user_id]
+        source = assignment.shard
+        if source != target:
+            try:
+                copied += copy_user_widgets(user_id, source, target)
+            except Exception:
+                for pending in assignments.values():
+                    pending.moving = False
+                db.session.commit()
+                raise
+        assignment.shard = target
+        assignment.moving = False
+        db.session.commit()
+        if source != target:
+            delete_user_widgets(user_id, source)
+    return copied
+
+
+def parse_shard_name(raw_value):
+    if raw_value == "main":
+        return None
+    if raw_value not in app.config["SQLALCHEMY_BINDS"]:
+        choices = ", ".join(["main", *app.config["SQLALCHEMY_BINDS"]])
+        raise click.BadParameter(f'"{raw_value}" is not a database; use one of {choices}.')
+    return raw_value
+
+
+@app.cli.command("move-user")
+@click.argument("username")
+@click.argument("shard")
+def move_user_command(username, shard):
+    """Move a user's widgets and history to another shard, or "main" for the main database."""
+    if not app.config["DATABASE_SHARDS"]:
+        raise click.ClickException("Sharding is off; set DATABASE_SHARDS first.")
+    target = parse_shard_name(shard)
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'User "{username}" does not exist.')
+
+    started = time.perf_counter()
+    copied = move_users({user.id: target})
+    click.echo(f"Moved {copied} rows of {username} to {shard} in {time.perf_counter() - started:.2f}s.")
+
+
+@app.cli.command("shard-users")
+@click.option("--chunk-size", default=50, show_default=True, help="Users flagged as moving at once.")
+def shard_users_command(chunk_size):
+    """Move every user whose widgets are still in the main database onto their hashed shard."""
+    if not app.config["DATABASE_SHARDS"]:
+        raise click.ClickException("Sharding is off; set DATABASE_SHARDS first.")
+    user_ids = [
+        user_id
+        for (user_id,) in db.session.query(User.id)
+        .outerjoin(ShardAssignment, ShardAssignment.user_id == User.id)
+        .filter(ShardAssignment.shard.is_(None))
+        .order_by(User.id)
+    ]
+    copied = 0
+    for offset in range(0, len(user_ids), chunk_size):
+        copied += move_users({user_id: hashed_shard(user_id) for user_id in user_ids[offset : offset + chunk_size]})
+    click.echo(f"Moved {len(user_ids)} users ({copied} rows) off the main database.")
+
+
+@app.cli.command("shard-stats")
+def shard_stats_command():
+    """Show the users, widgets and history rows each database holds."""
+    assigned = dict(
+        db.session.query(ShardAssignment.shard, db.func.count())
+        .filter(ShardAssignment.shard.isnot(None))
+        .group_by(ShardAssignment.shard)
+    )
+    assigned[None] = db.session.query(db.func.count(User.id)).scalar() - sum(assigned.values())
+    click.echo(f"{'database':<12} {'users':>8} {'widgets':>9} {'history rows':>13}")
+    for shard in each_shard():
+        widgets = db.session.query(db.func.count(DashboardWidget.id)).scalar()
+        history = sum(
+            db.session.query(db.func.count(model.id)).scalar() for model in (BarEntry, PieEntry, RadarDailyAdjustment)
+        )
+        click.echo(f"{shard or 'main':<12} {assigned.get(shard, 0):>8} {widgets:>9} {history:>13}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,326 @@
+"""A thread-pool ASGI adapter for the W-ProgVis Flask app.
+
+    pip install uvicorn aiosqlite greenlet      # asyncpg instead of aiosqlite for PostgreSQL
+    uvicorn asgi:application --port 5000
+
+``/events`` and ``/export`` are served as native coroutines, so an open push
+channel or a long download costs a socket and a little memory rather than a
+worker thread. Export reads its rows through SQLAlchemy's async engine, one
+chunk at a time, with every database round trip yielding to the event loop.
+
+Every other request, the whole JSON API included (``/dashboard-data``, bar
+history, the leaderboard, every write), is short and spends much of its time
+in NumPy and serialization, which would stall all open streams if it ran on
+the event loop. Those requests go through the Flask views unchanged in a
+small pool of ``ASGI_DISPATCH_WORKERS`` threads, on the regular synchronous
+engine, so they do not run any faster here than under WSGI; what this
+module saves is the thread an idle stream would otherwise hold.
+
+``loadtest.py`` compares how many concurrent connections this holds against
+the threaded WSGI server.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.wrappers import Response as WerkzeugResponse
+
+from app import (
+    EXPORT_FORMATS,
+    MemoryEventBroker,
+    app,
+    apply_sqlite_pragmas,
+    current_day,
+    db,
+    event_broker,
+    format_server_event,
+    iter_export_chunks,
+    iter_export_records,
+    record_query,
+    request,
+    session,
+    start_query_timer,
+)
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+# Kept apart from the default executor, where Redis event subscriptions wait.
+dispatch_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_DISPATCH_WORKERS", 8)), thread_name_prefix="dispatch"
+)
+
+
+def create_app_async_engine():
+    """An async engine on the same database, pool settings and listeners as ``db.engine``."""
+    if app.config["DATABASE_SHARDS"]:
+        # Only the regular session routes widget queries to a user's shard.
+        raise RuntimeError("The ASGI server does not support DATABASE_SHARDS; serve app.py instead.")
+    with app.app_context():
+        url = db.engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver is configured for {backend} databases.")
+
+    engine = create_async_engine(
+        url.set(drivername=ASYNC_DRIVERS[backend]),
+        **app.config["SQLALCHEMY_ENGINE_OPTIONS"],
+    )
+    if backend == "sqlite":
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    event.listen(engine.sync_engine, "before_cursor_execute", start_query_timer)
+    event.listen(engine.sync_engine, "after_cursor_execute", record_query)
+    return engine
+
+
+async_engine = create_app_async_engine()
+async_sessions = async_sessionmaker(async_engine)
+
+
+def wsgi_environ(scope, body):
+    """Build the WSGI environ of an ASGI HTTP request whose body was read already."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope["headers"]:
+        name, value = raw_name.decode("latin-1"), raw_value.decode("latin-1")
+        if name == "content-length":
+            continue
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+            continue
+        key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def route_endpoint(environ):
+    try:
+        endpoint, _ = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    return endpoint
+
+
+def read_flask_request(environ):
+    """The decoded session cookie, query arguments and headers of a request."""
+    with app.request_context(environ):
+        return dict(session), request.args, request.headers
+
+
+def run_in_session(sync_session, environ, function, *args):
+    """Call ``function`` with ``db.session`` bound to ``sync_session``, in the request's context.
+
+    Flask-SQLAlchemy scopes ``db.session`` to the app context, so pointing the
+    registry at the async session's sync facade sends the queries through the
+    async engine. ``run_sync()`` runs this in a greenlet that shares the
+    calling task's context variables, so concurrent requests each see their
+    own app context and session.
+    """
+    with app.request_context(environ):
+        db.session.registry.set(sync_session)
+        try:
+            return function(*args)
+        finally:
+            db.session.registry.clear()
+
+
+def dispatch_threaded(environ):
+    response = WerkzeugResponse.from_app(app.wsgi_app, environ, buffered=True)
+    return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+async def read_body(receive):
+    """The request body, or None once it grows past ``MAX_CONTENT_LENGTH``."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        size += len(chunks[-1])
+        if size > app.config["MAX_CONTENT_LENGTH"]:
+            return None
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def start_response(send, status, headers):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        }
+    )
+
+
+async def send_response(send, status, headers, body):
+    await start_response(send, status, headers)
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json_error(send, status, message):
+    body = json.dumps({"error": message}).encode()
+    await send_response(send, status, [("Content-Type", "application/json")], body)
+
+
+async def send_login_redirect(send):
+    await send_response(send, 302, [("Location", "/login"), ("Content-Length", "0")], b"")
+
+
+class AsyncSubscription:
+    """Await a broker subscription without parking a thread on it.
+
+    The in-process broker delivers straight into an ``asyncio.Queue`` from
+    whichever thread publishes. Redis subscriptions block in ``XREAD``, so they
+    are waited on in the default thread pool.
+    """
+
+    def __init__(self, user_id, last_event_id):
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue()
+        if isinstance(event_broker, MemoryEventBroker):
+            self.subscription = event_broker.subscribe(user_id, last_event_id, self)
+        else:
+            self.subscription = event_broker.subscribe(user_id, last_event_id)
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+
+    async def get(self, timeout):
+        if not isinstance(event_broker, MemoryEventBroker):
+            return await asyncio.to_thread(self.subscription.get, timeout)
+        try:
+            events = [await asyncio.wait_for(self.events.get(), timeout)]
+        except TimeoutError:
+            return []
+        while not self.events.empty():
+            events.append(self.events.get_nowait())
+        return events
+
+    def close(self):
+        self.subscription.close()
+
+
+async def stream_events(environ, receive, send):
+    """The async counterpart of ``event_stream`` in app.py, with the same framing."""
+    flask_session, args, headers = read_flask_request(environ)
+    if "user_id" not in flask_session:
+        return await send_login_redirect(send)
+
+    last_event_id = headers.get("Last-Event-ID") or args.get("last_event_id")
+    subscription = AsyncSubscription(flask_session["user_id"], last_event_id)
+    heartbeat = app.config["EVENT_HEARTBEAT_SECONDS"]
+    closes_at = time.monotonic() + app.config["EVENT_STREAM_MAX_SECONDS"]
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await start_response(
+            send,
+            200,
+            [("Content-Type", "text/event-stream"), ("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")],
+        )
+        chunk = f"retry: {app.config['EVENT_RETRY_MS']}\n\n"
+        while True:
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+            remaining = closes_at - time.monotonic()
+            if remaining <= 0:
+                break
+            getter = asyncio.ensure_future(subscription.get(min(heartbeat, remaining)))
+            await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                getter.cancel()
+                return
+            events = getter.result()
+            chunk = "".join(format_server_event(*event) for event in events) or ": heartbeat\n\n"
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+
+async def stream_export(environ, send):
+    """The async counterpart of ``export_history``: history rows are read chunk by chunk."""
+    flask_session, args, _ = read_flask_request(environ)
+    if "user_id" not in flask_session:
+        return await send_login_redirect(send)
+    export_format = args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return await send_json_error(send, 400, '"format" must be ndjson or csv.')
+
+    filename = f"w-progvis-{flask_session['username']}-{current_day().strftime('%Y-%m-%d')}.{export_format}"
+    await start_response(
+        send,
+        200,
+        [
+            ("Content-Type", f"{EXPORT_FORMATS[export_format]}; charset=utf-8"),
+            ("Content-Disposition", f'attachment; filename="{filename}"'),
+        ],
+    )
+    async with async_sessions() as db_session:
+        chunks = iter_export_chunks(iter_export_records(flask_session["user_id"]), export_format)
+        while (chunk := await db_session.run_sync(run_in_session, environ, next, chunks, None)) is not None:
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_engine.dispose()
+            dispatch_pool.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}.")
+
+    body = await read_body(receive)
+    if body is None:
+        return await send_json_error(send, 413, "The request body is too large.")
+    environ = wsgi_environ(scope, body)
+    endpoint = route_endpoint(environ)
+    if endpoint == "event_stream":
+        return await stream_events(environ, receive, send)
+    if endpoint == "export_history":
+        return await stream_export(environ, send)
+
+    loop = asyncio.get_running_loop()
+    status, headers, body = await loop.run_in_executor(dispatch_pool, dispatch_threaded, environ)
+    await send_response(send, status, headers, body)
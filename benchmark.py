@@ -0,0 +1,413 @@
+"""Benchmark the W-ProgVis routes against a synthetic dataset.
+
+Generates users with years of bar, pie and radar history in a throwaway
+SQLite database, drives the API routes (login, dashboard data, widget
+create/delete/order/move, daily entries, sync, import and export, analytics,
+snapshots, events and leaderboard) through the Flask test client and
+reports latency percentiles, SQL queries and peak Python memory per
+endpoint, then the size and encoding time of a year-long dashboard in each
+response format. Results can be saved as a JSON baseline and compared later:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import gzip
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from sqlalchemy import event
+
+BENCH_PASSWORD = "bench-password"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5, help="Synthetic users to generate.")
+    parser.add_argument("--widgets", type=int, default=2, help="Widgets of each type per user.")
+    parser.add_argument("--years", type=float, default=2.0, help="Years of history per widget.")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed requests per endpoint.")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per endpoint.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare the results with this JSON baseline.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="p95 ratio above which an endpoint counts as regressed.",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=2.0,
+        help="Ignore p95 slowdowns smaller than this, which are mostly timer noise.",
+    )
+    return parser.parse_args(argv)
+
+
+def history_records(widget, days, rng):
+    """Random import rows covering ``days`` days up to yesterday for one widget."""
+    today = datetime.now().date()
+    dates = [(today - timedelta(days=offset)).isoformat() for offset in range(days, 0, -1)]
+
+    if widget["type"] == "bar":
+        values = np.round(rng.gamma(2.0, 10.0, size=days), 1)
+        return [{"date": day, "value": float(value)} for day, value in zip(dates, values)]
+
+    if widget["type"] == "pie":
+        categories = widget["config"]["categories"]
+        hours = np.round(rng.dirichlet(np.ones(len(categories) + 1), size=days) * 16, 2)
+        return [
+            {"date": day, "category": name, "hours": float(day_hours[index])}
+            for day, day_hours in zip(dates, hours)
+            for index, name in enumerate(categories)
+            if day_hours[index] > 0
+        ]
+
+    domains = widget["config"]["domains"]
+    deltas = rng.choice([-1, 0, 1], p=[0.05, 0.45, 0.5], size=(days, len(domains)))
+    return [
+        {"date": day, "domain": name, "delta": int(day_deltas[index])}
+        for day, day_deltas in zip(dates, deltas)
+        for index, name in enumerate(domains)
+        if day_deltas[index]
+    ]
+
+
+def generate_dataset(progvis, args, rng):
+    """Create the synthetic users and their history; returns the widgets of the first user."""
+    widget_payloads = {
+        "bar": {"type": "bar", "metric_name": "Pages read", "unit": "pages"},
+        "pie": {"type": "pie", "categories": ["Work", "Study", "Gym", "Reading"]},
+        "radar": {"type": "radar", "domains": ["Body", "Mind", "Craft", "Social", "Money"]},
+    }
+    days = int(args.years * 365)
+    first_user = None
+
+    for user_number in range(args.users):
+        client = progvis.app.test_client()
+        username = f"bench{user_number}"
+        client.post("/register", json={"username": username, "password": BENCH_PASSWORD})
+        widgets = {"bar": [], "pie": [], "radar": []}
+        for widget_type, payload in widget_payloads.items():
+            for _ in range(args.widgets):
+                widget = client.post("/widgets", json=payload).get_json()["widget"]
+                widgets[widget_type].append(widget["id"])
+                with progvis.app.app_context():
+                    model = progvis.db.session.get(progvis.DashboardWidget, widget["id"])
+                    progvis.import_widget_entries(model, history_records(widget, days, rng))
+                if widget_type == "bar":
+                    client.post(f"/widgets/{widget['id']}/bar/entry", json={"value": 10})
+        if first_user is None:
+            first_user = {"username": username, "widgets": widgets}
+
+    return first_user
+
+
+def build_endpoints(progvis, widgets):
+    """The requests to time: (name, method, url, body factory, setup hook).
+
+    The url may also be a factory. A body factory returns a dict sent as JSON
+    or a string sent as is.
+    """
+    bar_id, pie_id, radar_id = widgets["bar"][0], widgets["pie"][0], widgets["radar"][0]
+    radar_changes = iter(np.tile([1, -1], 1_000_000).tolist())
+    move_targets = iter(np.tile([radar_id, pie_id], 1_000_000).tolist())
+    pie_hours = np.random.default_rng(0)
+    widget_ids = [widget_id for ids in widgets.values() for widget_id in ids]
+    orders = iter([widget_ids, widget_ids[::-1]] * 1_000_000)
+    sync_keys = iter(range(10**9))
+    today = datetime.now().date()
+    import_body = "\n".join(
+        json.dumps({"date": (today - timedelta(days=offset)).isoformat(), "value": offset % 20})
+        for offset in range(30, 0, -1)
+    )
+
+    def sync_batch():
+        return {
+            "operations": [
+                {"key": f"bench-{next(sync_keys)}", "op": "bar.set", "widget_id": bar_id, "value": 12},
+                {"key": f"bench-{next(sync_keys)}", "op": "pie.set", "widget_id": pie_id, "hours": [1, 2, 0, 1]},
+                {"key": f"bench-{next(sync_keys)}", "op": "radar.change", "widget_id": radar_id, "index": 1,
+                 "change": next(radar_changes)},
+            ]
+        }
+
+    def created_widget_url():
+        # The widget_create endpoint runs just before and leaves as many
+        # widgets behind as this one deletes, newest first.
+        with progvis.app.app_context():
+            widget = (
+                progvis.DashboardWidget.query.filter(progvis.DashboardWidget.id.notin_(widget_ids))
+                .filter_by(user_id=progvis.User.query.filter_by(username="bench0").one().id)
+                .order_by(progvis.DashboardWidget.id.desc())
+                .first()
+            )
+        return f"/widgets/{widget.id}"
+
+    def clear_dashboard_cache():
+        progvis.dashboard_cache.invalidate(lambda key: True)
+
+    def clear_leaderboard_cache():
+        progvis.leaderboard_cache.invalidate(lambda key: True)
+
+    def clear_bar_series_cache():
+        progvis.bar_series_cache.invalidate(lambda key: True)
+
+    def clear_snapshot_cache():
+        shutil.rmtree(progvis.snapshot_cache.directory, ignore_errors=True)
+
+    return [
+        ("login", "POST", "/login", lambda: {"username": "bench0", "password": BENCH_PASSWORD}, None),
+        ("dashboard_data", "GET", "/dashboard-data", None, clear_dashboard_cache),
+        ("dashboard_data_cached", "GET", "/dashboard-data", None, None),
+        ("dashboard_data_year", "GET", "/dashboard-data?days=365", None, clear_dashboard_cache),
+        ("dashboard_year_compact", "GET", "/dashboard-data?days=365&dates=compact", None, clear_dashboard_cache),
+        ("bar_history", "GET", f"/widgets/{bar_id}/bar/history?limit=200", None, None),
+        ("bar_series_year", "GET", f"/widgets/{bar_id}/bar/series?points=100", None, clear_bar_series_cache),
+        ("bar_series_year_cached", "GET", f"/widgets/{bar_id}/bar/series?points=100", None, None),
+        ("bar_series_lttb", "GET", f"/widgets/{bar_id}/bar/series?resolution=lttb&points=200", None, None),
+        ("bar_analytics", "GET", f"/widgets/{bar_id}/analytics", None, None),
+        ("radar_analytics", "GET", f"/widgets/{radar_id}/analytics", None, None),
+        ("bar_entry_update", "PUT", f"/widgets/{bar_id}/bar/entry", lambda: {"value": 12}, None),
+        ("bar_entry_update_delta", "PUT", f"/widgets/{bar_id}/bar/entry?delta=1", lambda: {"value": 12}, None),
+        (
+            "pie_entry_update",
+            "PUT",
+            f"/widgets/{pie_id}/pie/entry",
+            lambda: {"hours": np.round(pie_hours.uniform(0, 4, size=4), 1).tolist()},
+            None,
+        ),
+        (
+            "pie_entry_update_delta",
+            "PUT",
+            f"/widgets/{pie_id}/pie/entry?delta=1",
+            lambda: {"hours": np.round(pie_hours.uniform(0, 4, size=4), 1).tolist()},
+            None,
+        ),
+        ("pie_summary_week", "GET", f"/widgets/{pie_id}/pie/summary?period=week", None, None),
+        ("pie_summary_month", "GET", f"/widgets/{pie_id}/pie/summary?period=month", None, None),
+        (
+            "radar_update_score",
+            "POST",
+            f"/widgets/{radar_id}/radar/update-score",
+            lambda: {"index": 0, "change": next(radar_changes)},
+            None,
+        ),
+        ("widget_move", "POST", f"/widgets/{bar_id}/move", lambda: {"after": next(move_targets)}, None),
+        ("widget_order", "PUT", "/widgets/order", lambda: {"order": next(orders)}, None),
+        ("sync_batch", "POST", "/sync", sync_batch, None),
+        ("bar_import_month", "POST", f"/widgets/{bar_id}/import?format=jsonl", lambda: import_body, None),
+        ("bar_snapshot", "GET", f"/widgets/{bar_id}/snapshot", None, clear_snapshot_cache),
+        ("bar_snapshot_cached", "GET", f"/widgets/{bar_id}/snapshot", None, None),
+        ("radar_snapshot", "GET", f"/widgets/{radar_id}/snapshot", None, clear_snapshot_cache),
+        ("leaderboard", "GET", "/leaderboard", None, clear_leaderboard_cache),
+        ("leaderboard_me", "GET", "/leaderboard/me", None, None),
+        ("export_ndjson", "GET", "/export?format=ndjson", None, None),
+        ("events_connect", "GET", "/events", None, None),
+        ("widget_create", "POST", "/widgets", lambda: {"type": "bar", "metric_name": "Bench", "unit": "x"}, None),
+        ("widget_delete", "DELETE", created_widget_url, None, None),
+    ]
+
+
+def run_endpoint(client, method, url, body, setup, iterations, counter, trace_memory=False):
+    """Issue ``iterations`` requests; returns their durations, query counts and peak memory."""
+    durations, queries, peaks = [], [], []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        request_url = url() if callable(url) else url
+        payload = body() if body else None
+        request_body = {"data": payload} if isinstance(payload, str) else {"json": payload}
+        counter["queries"] = 0
+        if trace_memory:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        response = client.open(request_url, method=method, buffered=False, **request_body)
+        if response.mimetype == "text/event-stream":
+            # An event stream stays open; time it up to its first message.
+            next(iter(response.response))
+        else:
+            response.get_data()
+        response.close()
+        durations.append(time.perf_counter() - started)
+        if trace_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        queries.append(counter["queries"])
+        if response.status_code >= 400:
+            detail = response.get_data(as_text=True)[:200]
+            raise RuntimeError(f"{method} {request_url} returned {response.status_code}: {detail}")
+    return durations, queries, peaks
+
+
+def run_benchmarks(progvis, endpoints, args):
+    counter = {"queries": 0}
+
+    def count_query(*_):
+        counter["queries"] += 1
+
+    with progvis.app.app_context():
+        engine = progvis.db.engine
+    event.listen(engine, "before_cursor_execute", count_query)
+
+    client = progvis.app.test_client()
+    client.post("/login", json={"username": "bench0", "password": BENCH_PASSWORD})
+
+    results = {}
+    for name, method, url, body, setup in endpoints:
+        run_endpoint(client, method, url, body, setup, args.warmup, counter)
+        durations, queries, _ = run_endpoint(client, method, url, body, setup, args.iterations, counter)
+        tracemalloc.start()
+        _, _, peaks = run_endpoint(client, method, url, body, setup, max(1, args.iterations // 10), counter, True)
+        tracemalloc.stop()
+
+        p50, p95, p99 = np.percentile(np.array(durations) * 1000, [50, 95, 99])
+        results[name] = {
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "mean_ms": round(float(np.mean(durations) * 1000), 3),
+            "queries": int(np.median(queries)),
+            "peak_kib": round(max(peaks) / 1024, 1),
+        }
+        print(
+            f"{name:<24} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  p99 {p99:8.2f} ms"
+            f"  {results[name]['queries']:3d} queries  {results[name]['peak_kib']:9.1f} KiB"
+        )
+    event.remove(engine, "before_cursor_execute", count_query)
+    return results
+
+
+def measure_serialization(progvis, username, iterations):
+    """Encode the user's year-long dashboard with every available encoder, with ISO and compact dates.
+
+    Returns the body size, its gzipped size and the median encoding time per
+    combination.
+    """
+    provider = progvis.app.json
+    with progvis.app.app_context():
+        user_id = progvis.User.query.filter_by(username=username).one().id
+        payloads = {
+            dates: {"widgets": progvis.load_dashboard_widgets(user_id, 365, None, dates == "compact")}
+            for dates in ("iso", "compact")
+        }
+
+    encoders = {"json": lambda payload: json.dumps(payload, default=provider.default, sort_keys=True).encode()}
+    if progvis.orjson is not None:
+        encoders["orjson"] = lambda payload: provider.encode(payload, "json")[0]
+    if progvis.msgpack is not None:
+        encoders["msgpack"] = lambda payload: provider.encode(payload, "msgpack")[0]
+
+    print(f"\n{'encoding':<24} {'bytes':>10} {'gzipped':>10} {'encode p50':>12}")
+    results = {}
+    for dates, payload in payloads.items():
+        for encoder_name, encode in encoders.items():
+            durations = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                body = encode(payload)
+                durations.append(time.perf_counter() - started)
+            name = f"{encoder_name}_{dates}"
+            results[name] = {
+                "bytes": len(body),
+                "gzip_bytes": len(gzip.compress(body)),
+                "encode_p50_ms": round(float(np.median(durations) * 1000), 3),
+            }
+            print(
+                f"{name:<24} {len(body):>10} {results[name]['gzip_bytes']:>10}"
+                f" {results[name]['encode_p50_ms']:>9.3f} ms"
+            )
+    return results
+
+
+def compare_results(results, baseline, threshold, min_delta_ms):
+    """Print the change against a saved baseline; returns the regressed endpoint names."""
+    regressed = []
+    print(f"\n{'endpoint':<24} {'p95 before':>12} {'p95 now':>12} {'ratio':>7} {'queries':>10}")
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:<24} {'(new)':>12} {current['p95_ms']:>10.2f}ms")
+            continue
+        ratio = current["p95_ms"] / previous["p95_ms"] if previous["p95_ms"] else float("inf")
+        more_queries = current["queries"] > previous["queries"]
+        flag = ""
+        slower = ratio > threshold and current["p95_ms"] - previous["p95_ms"] > min_delta_ms
+        if slower or more_queries:
+            regressed.append(name)
+            flag = "  REGRESSED"
+        print(
+            f"{name:<24} {previous['p95_ms']:>10.2f}ms {current['p95_ms']:>10.2f}ms {ratio:>7.2f}"
+            f" {previous['queries']:>4} -> {current['queries']:<3}{flag}"
+        )
+    return regressed
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # app.py binds its database when imported, so point it at a scratch file first.
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["SNAPSHOT_CACHE_DIR"] = os.path.join(workdir, "snapshots")
+        import app as progvis
+
+        # Every synthetic request comes from the same address and the login
+        # endpoint is timed repeatedly, so lift the brute-force throttle.
+        progvis.app.config["AUTH_RATE_LIMIT_PER_IP"] = float("inf")
+        progvis.app.config["AUTH_RATE_LIMIT_PER_USERNAME"] = float("inf")
+
+        started = time.perf_counter()
+        user = generate_dataset(progvis, args, rng)
+        print(
+            f"Generated {args.users} users x {args.widgets * 3} widgets x {args.years:g} years"
+            f" in {time.perf_counter() - started:.1f}s\n"
+        )
+
+        results = run_benchmarks(progvis, build_endpoints(progvis, user["widgets"]), args)
+        serialization = measure_serialization(progvis, user["username"], args.iterations)
+        with progvis.app.app_context():
+            progvis.db.engine.dispose()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "users": args.users,
+            "widgets_per_type": args.widgets,
+            "years": args.years,
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "results": results,
+        "serialization": serialization,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressed = compare_results(results, baseline, args.threshold, args.min_delta_ms)
+        if regressed:
+            print(f"\n{len(regressed)} endpoint(s) regressed: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
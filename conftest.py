@@ -0,0 +1,30 @@
+"""Point the app at a throwaway database before any test imports it."""
+
+import os
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="w-progvis-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'tracker.db')}"
+os.environ["SNAPSHOT_CACHE_DIR"] = os.path.join(_workdir, "snapshots")
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+os.environ.pop("DATABASE_SHARDS", None)
+os.environ.pop("EVENT_BROKER_URL", None)
+
+
+@pytest.fixture
+def register(monkeypatch):
+    """Return a function that registers a user and gives back a test client logged in as them."""
+    from app import app
+
+    # Every test client registers from the same address.
+    monkeypatch.setitem(app.config, "AUTH_RATE_LIMIT_PER_IP", 10**6)
+
+    def register_user(username):
+        client = app.test_client()
+        response = client.post("/register", json={"username": username, "password": "test-password"})
+        assert response.status_code == 200
+        return client
+
+    return register_user
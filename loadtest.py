@@ -0,0 +1,251 @@
+"""Compare how many concurrent connections the WSGI and ASGI servers hold.
+
+Starts each server on a throwaway database, opens a growing number of idle
+``/events`` streams -- the long-lived connections that tie up one WSGI thread
+each -- and, while they are open, times a burst of ``/dashboard-data``
+requests. Every level reports the streams established, the dashboard latency
+and failures, and the server's thread count and resident memory:
+
+    python loadtest.py
+    python loadtest.py --servers asgi --levels 100 1000 5000 --output loadtest.json
+
+The WSGI server is the threaded ``flask run`` that ``app.py`` starts; the ASGI
+one is ``uvicorn asgi:application`` and needs ``uvicorn``, ``aiosqlite`` and
+``greenlet`` installed.
+"""
+
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+LOADTEST_PASSWORD = "loadtest-password"
+SERVER_COMMANDS = {
+    "wsgi": ["-m", "flask", "--app", "app", "run", "--with-threads", "--port", "{port}"],
+    "asgi": ["-m", "uvicorn", "asgi:application", "--log-level", "warning", "--port", "{port}"],
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", nargs="+", choices=sorted(SERVER_COMMANDS), default=["wsgi", "asgi"])
+    parser.add_argument(
+        "--levels",
+        nargs="+",
+        type=int,
+        default=[50, 200, 800],
+        help="Numbers of open event streams to measure at.",
+    )
+    parser.add_argument("--requests", type=int, default=50, help="Dashboard requests timed per level.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Dashboard requests in flight at once.")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds before a request counts as failed.")
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    return parser.parse_args(argv)
+
+
+async def http_request(port, method, path, body=None, cookie=None):
+    """Send one HTTP/1.1 request and return its status, headers and body."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    head = [f"{method} {path} HTTP/1.1", f"Host: 127.0.0.1:{port}", "Connection: close"]
+    if body is not None:
+        head += ["Content-Type: application/json", f"Content-Length: {len(payload)}"]
+    if cookie:
+        head.append(f"Cookie: {cookie}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    raw_head, _, response_body = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = raw_head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers.setdefault(name.strip().lower(), value.strip())
+    return int(status_line.split()[1]), headers, response_body
+
+
+async def open_event_stream(port, cookie, timeout):
+    """Open an ``/events`` stream and wait for its first bytes; returns the writer or None."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), timeout)
+        writer.write(
+            f"GET /events HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nCookie: {cookie}\r\n\r\n".encode()
+        )
+        await writer.drain()
+        first_bytes = await asyncio.wait_for(reader.readuntil(b"retry:"), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return None
+    return writer if b" 200 " in first_bytes.split(b"\r\n", 1)[0] else None
+
+
+async def time_dashboard(port, cookie, total, concurrency, timeout):
+    """Issue ``total`` dashboard requests, ``concurrency`` at a time; returns latencies and failures."""
+    durations, failures = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        nonlocal failures
+        async with slots:
+            started = time.perf_counter()
+            try:
+                request = http_request(port, "GET", "/dashboard-data", cookie=cookie)
+                status, _, _ = await asyncio.wait_for(request, timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                failures += 1
+                return
+            if status == 200:
+                durations.append(time.perf_counter() - started)
+            else:
+                failures += 1
+
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    return durations, failures
+
+
+def process_stats(pid):
+    """Thread count and resident memory of a process, read from /proc on Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            fields = dict(line.split(":", 1) for line in status_file)
+    except OSError:
+        return None, None
+    return int(fields["Threads"]), round(int(fields["VmRSS"].split()[0]) / 1024, 1)
+
+
+async def prepare_user(port):
+    """Register the load-test user, give it a widget of each type and return its session cookie."""
+    status, headers, body = await http_request(
+        port, "POST", "/register", {"username": "loadtest", "password": LOADTEST_PASSWORD}
+    )
+    if status != 200:
+        raise RuntimeError(f"Registration failed with {status}: {body[:200]!r}")
+    cookie = headers["set-cookie"].split(";", 1)[0]
+    for payload in (
+        {"type": "bar", "metric_name": "Pages read", "unit": "pages"},
+        {"type": "pie", "categories": ["Work", "Study", "Gym"]},
+        {"type": "radar", "domains": ["Body", "Mind", "Craft"]},
+    ):
+        await http_request(port, "POST", "/widgets", payload, cookie)
+    return cookie
+
+
+async def wait_until_ready(port, server, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with status {server.returncode}.")
+        try:
+            await http_request(port, "GET", "/login")
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("The server did not start in time.")
+
+
+async def measure_server(name, server, args):
+    await wait_until_ready(args.port, server)
+    cookie = await prepare_user(args.port)
+    streams, results = [], []
+
+    for level in sorted(args.levels):
+        opened = await asyncio.gather(
+            *(open_event_stream(args.port, cookie, args.timeout) for _ in range(level - len(streams)))
+        )
+        streams += [writer for writer in opened if writer is not None]
+        durations, failures = await time_dashboard(
+            args.port, cookie, args.requests, args.concurrency, args.timeout
+        )
+        threads, rss_mib = process_stats(server.pid)
+        row = {
+            "server": name,
+            "streams_requested": level,
+            "streams_open": len(streams),
+            "dashboard_failures": failures,
+            "threads": threads,
+            "rss_mib": rss_mib,
+        }
+        if durations:
+            p50, p95 = np.percentile(np.array(durations) * 1000, [50, 95])
+            row.update(p50_ms=round(float(p50), 2), p95_ms=round(float(p95), 2))
+        results.append(row)
+        print(
+            f"{name:<5} {level:>6} {len(streams):>6} {row.get('p50_ms', float('nan')):>9.2f} "
+            f"{row.get('p95_ms', float('nan')):>9.2f} {failures:>8} {threads or '-':>8} {rss_mib or '-':>9}"
+        )
+
+    for writer in streams:
+        writer.close()
+    return results
+
+
+def run_server(name, args, workdir):
+    command = [sys.executable, *(part.format(port=args.port) for part in SERVER_COMMANDS[name])]
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, f'{name}.db')}",
+        "PASSWORD_HASH_WORKERS": "0",
+    }
+    # The WSGI server logs every request; keep that out of the results table.
+    with open(os.path.join(workdir, f"{name}.log"), "w+") as log:
+        server = subprocess.Popen(
+            command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)), stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            return asyncio.run(measure_server(name, server, args))
+        except RuntimeError:
+            log.seek(0)
+            print(log.read()[-2000:], file=sys.stderr)
+            raise
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Every open stream is a file descriptor here and in the server.
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+    if hard_limit != resource.RLIM_INFINITY and max(args.levels) * 2 > hard_limit:
+        print(f"Warning: the open-file limit ({hard_limit}) caps the streams that can be opened.")
+
+    print(
+        f"{'mode':<5} {'level':>6} {'open':>6} {'p50 ms':>9} {'p95 ms':>9}"
+        f" {'failures':>8} {'threads':>8} {'RSS MiB':>9}"
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.servers:
+            results += run_server(name, args, workdir)
+
+    if args.output:
+        report = {
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "levels": sorted(args.levels),
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nWrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
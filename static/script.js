@@ -19,13 +19,157 @@ async function fetchJson(url, options = {}) {
   return data;
 }
 
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+// The dashboard is fetched with ?dates=compact: dates arrive as days since
+// 1970-01-01, timestamps as seconds since then, and bar series carry their
+// first day instead of a label per day. They are expanded back into the
+// strings the rest of this file works with.
+function epochDayToIsoDate(epochDay) {
+  return new Date(epochDay * DAY_MS).toISOString().slice(0, 10);
+}
+
+function expandCompactBarEntry(entry) {
+  if (!entry) {
+    return entry;
+  }
+  return {
+    ...entry,
+    date: epochDayToIsoDate(entry.date),
+    timestamp: new Date(entry.timestamp * 1000).toISOString().slice(0, 19).replace("T", " "),
+  };
+}
+
+function expandCompactDates(widget) {
+  if (widget.type === "radar" && widget.plot.comparison) {
+    widget.plot.comparison.date = epochDayToIsoDate(widget.plot.comparison.date);
+  }
+  if (widget.type === "bar") {
+    const { start, values } = widget.series;
+    widget.entries = widget.entries.map(expandCompactBarEntry);
+    widget.today_entry = expandCompactBarEntry(widget.today_entry);
+    widget.series = { labels: values.map((_, offset) => epochDayToIsoDate(start + offset).slice(5)), values };
+  }
+  return widget;
+}
+
 async function loadDashboard() {
-  const data = await fetchJson("/dashboard-data");
-  dashboardWidgets = data.widgets || [];
+  const data = await fetchJson("/dashboard-data?dates=compact");
+  dashboardWidgets = (data.widgets || []).map(expandCompactDates);
   renderDashboard();
 }
 
+// Charts are drawn only once their card comes near the viewport, and Plotly
+// itself is downloaded for the first of them. After that, a change restyles
+// the trace data it touched instead of drawing the whole chart again.
+const drawnCharts = new Map();
+const chartObserver = window.IntersectionObserver
+  ? new IntersectionObserver(drawVisibleCharts, { rootMargin: "300px 0px" })
+  : null;
+let plotlyLoading = null;
+
+function loadPlotly() {
+  if (!plotlyLoading) {
+    plotlyLoading = new Promise((resolve, reject) => {
+      const script = document.createElement("script");
+      script.src = dashboardEl.dataset.plotlySrc;
+      script.onload = () => resolve(window.Plotly);
+      script.onerror = () => {
+        plotlyLoading = null;
+        script.remove();
+        reject(new Error("Could not load the charting library."));
+      };
+      document.head.appendChild(script);
+    });
+  }
+  return plotlyLoading;
+}
+
+function drawVisibleCharts(entries) {
+  entries.forEach((entry) => {
+    if (!entry.isIntersecting) {
+      return;
+    }
+    chartObserver.unobserve(entry.target);
+    const widget = dashboardWidgets.find((item) => `widget-graph-${item.id}` === entry.target.id);
+    if (widget) {
+      drawWidgetChart(widget).catch(() => chartObserver.observe(entry.target));
+    }
+  });
+}
+
+function scheduleWidgetChart(widget) {
+  const element = document.getElementById(`widget-graph-${widget.id}`);
+  if (chartObserver) {
+    chartObserver.observe(element);
+  } else {
+    drawWidgetChart(widget).catch(() => {});
+  }
+}
+
+async function drawWidgetChart(widget) {
+  await loadPlotly();
+  const graphId = `widget-graph-${widget.id}`;
+  const element = document.getElementById(graphId);
+  if (!element) {
+    return;
+  }
+
+  if (widget.type === "radar") {
+    renderRadarWidget(graphId, widget);
+  } else if (widget.type === "bar") {
+    renderBarWidget(graphId, widget);
+  } else if (widget.type === "pie") {
+    renderPieWidget(graphId, widget);
+  }
+  element.classList.remove("widget-graph-pending");
+  const labels = widget.series?.labels || [];
+  drawnCharts.set(widget.id, { element, lastLabel: labels[labels.length - 1] });
+}
+
+// Only the data a change can touch is restyled: the radar's "Today" trace,
+// the pie's values and the bar heights. A bar series that moved on to a new
+// day since it was drawn is extended by that day. Returns false when the chart
+// has to be drawn again instead.
+function restyleWidgetChart(widget, chart) {
+  const { element } = chart;
+  if (widget.type === "radar") {
+    Plotly.restyle(element, { r: [[...widget.plot.r]] }, [element.data.length - 1]);
+    return true;
+  }
+  if (widget.type === "pie") {
+    Plotly.restyle(element, { values: [[...widget.plot.values]] }, [0]);
+    return true;
+  }
+
+  const { labels, values } = widget.series;
+  const last = labels.length - 1;
+  if (chart.lastLabel === labels[last]) {
+    Plotly.restyle(element, { y: [[...values]] }, [0]);
+  } else if (chart.lastLabel === labels[last - 1]) {
+    Plotly.extendTraces(element, { x: [[labels[last]]], y: [[values[last]]] }, [0], labels.length);
+    chart.lastLabel = labels[last];
+  } else {
+    return false;
+  }
+  return true;
+}
+
+function updateWidgetChart(widget) {
+  const chart = drawnCharts.get(widget.id);
+  if (!chart || !chart.element.isConnected) {
+    // Not drawn yet; it is drawn from the current data once it is in view.
+    return;
+  }
+  if (!restyleWidgetChart(widget, chart)) {
+    drawWidgetChart(widget).catch(() => {});
+  }
+}
+
 function renderDashboard() {
+  chartObserver?.disconnect();
+  drawnCharts.forEach((chart) => Plotly.purge(chart.element));
+  drawnCharts.clear();
   dashboardEl.innerHTML = "";
   emptyStateEl.hidden = dashboardWidgets.length !== 0;
 
@@ -36,35 +180,30 @@ function renderDashboard() {
 
     const graphId = `widget-graph-${widget.id}`;
     const graphClass = widget.type === "radar" ? "widget-graph widget-graph-radar" : "widget-graph";
+    const pendingClass = `${graphClass} widget-graph-pending`;
 
     card.innerHTML = `
       <div class="widget-header">
-        <div>
-          <p class="widget-type">${widget.type}</p>
-          <h2>${widget.title}</h2>
+        <div class="widget-heading">
+          <button class="widget-drag-handle" type="button" title="Drag to reorder" aria-label="Drag to reorder">&#8942;&#8942;</button>
+          <div>
+            <p class="widget-type">${widget.type}</p>
+            <h2>${widget.title}</h2>
+          </div>
         </div>
         <button class="btn-danger widget-remove-button" type="button" onclick="removeWidget(${widget.id})">
           Remove Widget
         </button>
       </div>
       <div class="widget-body">
-        <div id="${graphId}" class="${graphClass}"></div>
+        <div id="${graphId}" class="${pendingClass}"></div>
         <div class="widget-actions" id="widget-actions-${widget.id}"></div>
       </div>
     `;
 
     dashboardEl.appendChild(card);
-
-    if (widget.type === "radar") {
-      renderRadarWidget(graphId, widget);
-      renderRadarActions(widget.id, widget.config.domains, widget.config.today_deltas);
-    } else if (widget.type === "bar") {
-      renderBarWidget(graphId, widget);
-      renderBarActions(widget.id, widget.config, widget.today_entry);
-    } else if (widget.type === "pie") {
-      renderPieWidget(graphId, widget);
-      renderPieActions(widget.id, widget);
-    }
+    renderWidgetActions(widget);
+    scheduleWidgetChart(widget);
   });
 
   const addButtonWrap = document.createElement("div");
@@ -77,18 +216,48 @@ function renderDashboard() {
   dashboardEl.appendChild(addButtonWrap);
 }
 
+function renderWidgetActions(widget) {
+  if (widget.type === "radar") {
+    renderRadarActions(widget.id, widget.config.domains, widget.config.today_deltas);
+  } else if (widget.type === "bar") {
+    renderBarActions(widget.id, widget.config, widget.today_entry);
+  } else if (widget.type === "pie") {
+    renderPieActions(widget.id, widget);
+  }
+}
+
+function renderWidgetContent(widget) {
+  updateWidgetChart(widget);
+  renderWidgetActions(widget);
+}
+
 function renderRadarWidget(graphId, widget) {
-  const plotData = [
-    {
+  const plotData = [];
+  const comparison = widget.plot.comparison;
+
+  if (comparison) {
+    plotData.push({
       type: "scatterpolar",
-      r: widget.plot.r,
+      r: comparison.r,
       theta: widget.plot.theta,
+      name: comparison.date,
       fill: "toself",
-      marker: { color: "rgb(106, 168, 79)", size: 10 },
-      line: { color: "rgb(106, 168, 79)", width: 3 },
-      fillcolor: "rgba(106, 168, 79, 0.3)",
-    },
-  ];
+      marker: { color: "rgb(148, 163, 184)", size: 6 },
+      line: { color: "rgb(148, 163, 184)", width: 2, dash: "dot" },
+      fillcolor: "rgba(148, 163, 184, 0.15)",
+    });
+  }
+
+  plotData.push({
+    type: "scatterpolar",
+    r: widget.plot.r,
+    theta: widget.plot.theta,
+    name: "Today",
+    fill: "toself",
+    marker: { color: "rgb(106, 168, 79)", size: 10 },
+    line: { color: "rgb(106, 168, 79)", width: 3 },
+    fillcolor: "rgba(106, 168, 79, 0.3)",
+  });
 
   const layout = {
     margin: { t: 20, r: 30, b: 20, l: 30 },
@@ -134,8 +303,8 @@ function renderRadarActions(widgetId, domains, todayDeltas = []) {
 function renderBarWidget(graphId, widget) {
   const series = widget.series || { labels: [], values: [] };
   const trace = {
-    x: series.labels,
-    y: series.values,
+    x: [...series.labels],
+    y: [...series.values],
     name: widget.config.metric_name,
     type: "bar",
     marker: { color: "#f59e0b" },
@@ -150,7 +319,7 @@ function renderBarWidget(graphId, widget) {
     [trace],
     {
       margin: { t: 20, r: 20, b: 50, l: 50 },
-      xaxis: { title: "Last 30 days", type: "category" },
+      xaxis: { title: `Last ${series.labels.length} days`, type: "category" },
       yaxis: { title: yAxisTitle },
       bargap: 0.35,
     },
@@ -261,31 +430,348 @@ function renderPieActions(widgetId, widget) {
   `;
 }
 
-async function updateRadarScore(widgetId, index, change) {
+function localIsoDate(daysAgo = 0) {
+  const now = new Date();
+  now.setDate(now.getDate() - daysAgo);
+  const month = String(now.getMonth() + 1).padStart(2, "0");
+  const day = String(now.getDate()).padStart(2, "0");
+  return `${now.getFullYear()}-${month}-${day}`;
+}
+
+function todayIsoDate() {
+  return localIsoDate();
+}
+
+// Sets one day of a bar series. When the dashboard stayed open past midnight,
+// today follows the last day shown, and the window moves forward by one day.
+function setBarPoint(series, label, value) {
+  const pointIndex = series.labels.lastIndexOf(label);
+  if (pointIndex !== -1) {
+    series.values[pointIndex] = value;
+  } else if (
+    label === todayIsoDate().slice(5) &&
+    series.labels[series.labels.length - 1] === localIsoDate(1).slice(5)
+  ) {
+    series.labels = [...series.labels.slice(1), label];
+    series.values = [...series.values.slice(1), value];
+  }
+}
+
+// Radar clicks, and any change made while offline, wait in an IndexedDB queue
+// that survives reloads. The queue is sent to /sync in batches, where each
+// operation's key makes a retried batch safe to send again.
+const SYNC_DB_NAME = "w-progvis-sync";
+const SYNC_STORE = "operations";
+const SYNC_BATCH_SIZE = 50;
+const SYNC_FLUSH_DELAY_MS = 800;
+const SYNC_RETRY_DELAY_MS = 30000;
+
+let syncDbPromise = null;
+let syncFlushTimer = null;
+let syncFlushing = false;
+let syncSequence = 0;
+const syncInFlight = new Set();
+// Operations this page applied to its widgets when they were queued. Ones left
+// in the queue by an earlier page are not reflected here yet.
+const syncAppliedLocally = new Set();
+// The widgets of the batch on its way, and the highest version a
+// widget.changed event reported for each while it was.
+const syncInFlightWidgets = new Set();
+const syncHeldVersions = new Map();
+
+function openSyncDb() {
+  if (!syncDbPromise) {
+    syncDbPromise = new Promise((resolve, reject) => {
+      const request = indexedDB.open(SYNC_DB_NAME, 1);
+      request.onupgradeneeded = () => request.result.createObjectStore(SYNC_STORE, { keyPath: "key" });
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+  }
+  return syncDbPromise;
+}
+
+async function withSyncStore(mode, callback) {
+  const database = await openSyncDb();
+  return new Promise((resolve, reject) => {
+    const transaction = database.transaction(SYNC_STORE, mode);
+    const request = callback(transaction.objectStore(SYNC_STORE));
+    transaction.oncomplete = () => resolve(request ? request.result : undefined);
+    transaction.onerror = () => reject(transaction.error);
+  });
+}
+
+async function readQueuedOperations() {
+  const operations = await withSyncStore("readonly", (store) => store.getAll());
+  return operations.sort((a, b) => a.seq - b.seq);
+}
+
+function deleteQueuedOperations(keys) {
+  return withSyncStore("readwrite", (store) => {
+    keys.forEach((key) => store.delete(key));
+  });
+}
+
+// Coalesce a new operation with the queued ones of the same widget and day
+// that are not already on their way: a later bar or pie write replaces the
+// earlier ones, and a radar change cancels a queued opposite one.
+function coalesceOperation(store, operation) {
+  const request = store.getAll();
+  request.onsuccess = () => {
+    const related = request.result.filter(
+      (item) =>
+        !syncInFlight.has(item.key) && item.widget_id === operation.widget_id && item.date === operation.date,
+    );
+
+    if (operation.op === "radar.change") {
+      const opposite = related.find(
+        (item) => item.op === "radar.change" && item.index === operation.index && item.change === -operation.change,
+      );
+      if (opposite) {
+        store.delete(opposite.key);
+        return;
+      }
+    } else {
+      related.filter((item) => item.op !== "radar.change").forEach((item) => store.delete(item.key));
+    }
+    store.put(operation);
+  };
+}
+
+async function enqueueOperation(operation) {
+  const queued = {
+    ...operation,
+    key: crypto.randomUUID(),
+    date: todayIsoDate(),
+    seq: Date.now() * 1000 + (syncSequence++ % 1000),
+  };
+
+  // Every caller has already applied the change to its widget.
+  syncAppliedLocally.add(queued.key);
   try {
-    const data = await fetchJson(`/widgets/${widgetId}/radar/update-score`, {
+    await withSyncStore("readwrite", (store) => {
+      coalesceOperation(store, queued);
+    });
+  } catch (error) {
+    // Without IndexedDB (e.g. some private windows) send the change on its own.
+    const { seq, ...single } = queued;
+    const data = await fetchJson("/sync", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ index, change }),
+      body: JSON.stringify({ operations: [single] }),
     });
+    if (data.results[0].status !== 200) {
+      throw new Error(data.results[0].error);
+    }
+    if (!adoptSyncedVersions([single], data)) {
+      await loadDashboard();
+    }
+    return;
+  }
+  scheduleSyncFlush(SYNC_FLUSH_DELAY_MS);
+}
+
+async function hasQueuedOperations() {
+  try {
+    return (await readQueuedOperations()).length > 0;
+  } catch (error) {
+    return false;
+  }
+}
+
+function scheduleSyncFlush(delay) {
+  clearTimeout(syncFlushTimer);
+  syncFlushTimer = setTimeout(flushSyncQueue, delay);
+}
 
+// After a batch, each widget whose operations all went through and were
+// already applied here takes the version the server reports, so the
+// widget.changed events of this batch are recognised as already reflected.
+// Returns false when some widget differs from the server and needs a reload.
+function adoptSyncedVersions(batch, data) {
+  const applied = new Map();
+  const stale = new Set();
+  batch.forEach((operation, index) => {
+    const result = data.results[index];
+    if (result.status !== 200 || result.replayed || !syncAppliedLocally.has(operation.key)) {
+      stale.add(operation.widget_id);
+    } else {
+      applied.set(operation.widget_id, (applied.get(operation.widget_id) ?? 0) + 1);
+    }
+    syncAppliedLocally.delete(operation.key);
+  });
+
+  let current = true;
+  applied.forEach((count, widgetId) => {
     const widget = dashboardWidgets.find((item) => item.id === widgetId);
-    if (!widget) {
+    const version = data.versions[String(widgetId)];
+    // Another tab changed the widget in between: the local copy lacks that change.
+    if (!widget || stale.has(widgetId) || version !== widget.version + count) {
+      current = false;
       return;
     }
+    widget.version = version;
+  });
+  syncHeldVersions.forEach((version, widgetId) => {
+    const widget = dashboardWidgets.find((item) => item.id === widgetId);
+    if (!widget || version > widget.version) {
+      current = false;
+    }
+  });
+  return current && stale.size === 0;
+}
 
-    widget.plot = {
-      theta: data.theta,
-      r: data.r,
-    };
-    widget.config.scores = data.scores;
-    widget.config.today_deltas = data.today_deltas;
+async function flushSyncQueue() {
+  if (syncFlushing || !navigator.onLine) {
+    return;
+  }
 
-    renderRadarWidget(`widget-graph-${widgetId}`, widget);
-    renderRadarActions(widget.id, widget.config.domains, widget.config.today_deltas);
+  syncFlushing = true;
+  const errors = [];
+  let current = true;
+
+  try {
+    for (;;) {
+      const batch = (await readQueuedOperations()).slice(0, SYNC_BATCH_SIZE);
+      if (batch.length === 0) {
+        break;
+      }
+
+      batch.forEach((operation) => {
+        syncInFlight.add(operation.key);
+        syncInFlightWidgets.add(operation.widget_id);
+      });
+      const response = await fetch("/sync", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ operations: batch.map(({ seq, ...operation }) => operation) }),
+      });
+      if (response.status >= 500) {
+        throw new Error("Sync failed");
+      }
+
+      const data = await response.json();
+      if (response.ok) {
+        data.results
+          .filter((result) => result.status !== 200 && !result.replayed)
+          .forEach((result) => errors.push(result.error));
+        current = adoptSyncedVersions(batch, data) && current;
+      } else {
+        // The whole batch was refused; resending it cannot succeed.
+        errors.push(data.error || data.message);
+        current = false;
+      }
+      syncInFlightWidgets.clear();
+      syncHeldVersions.clear();
+      await deleteQueuedOperations(batch.map((operation) => operation.key));
+      syncInFlight.clear();
+    }
+  } catch (error) {
+    // Offline, signed out or a server error: keep the queue and try again later.
+    scheduleSyncFlush(SYNC_RETRY_DELAY_MS);
+  } finally {
+    syncInFlight.clear();
+    syncInFlightWidgets.clear();
+    syncFlushing = false;
+  }
+  if (syncHeldVersions.size) {
+    // The batch may have been applied without its response arriving.
+    syncHeldVersions.clear();
+    current = false;
+  }
+
+  if (errors.length) {
+    alert(`Some changes could not be saved:\n${[...new Set(errors)].join("\n")}`);
+  }
+  if (!current) {
+    scheduleDashboardReload();
+  }
+}
+
+function applyRadarChangeLocally(widget, index, change) {
+  const nextDelta = (widget.config.today_deltas[index] ?? 0) + change;
+  if (Math.abs(nextDelta) > 1) {
+    alert("For each domain, today's net change must stay between -1 and +1.");
+    return false;
+  }
+
+  widget.config.today_deltas[index] = nextDelta;
+  widget.config.scores[index] += change;
+  widget.plot.r = widget.config.scores.map((score) => 100 / (1 + Math.exp(-0.1 * score)));
+  return true;
+}
+
+async function updateRadarScore(widgetId, index, change) {
+  const widget = dashboardWidgets.find((item) => item.id === widgetId);
+  if (!widget || !applyRadarChangeLocally(widget, index, change)) {
+    return;
+  }
+
+  renderWidgetContent(widget);
+
+  try {
+    await enqueueOperation({ op: "radar.change", widget_id: widgetId, index, change });
   } catch (error) {
     alert(error.message);
+    await loadDashboard();
+  }
+}
+
+// Bar and pie saves go straight to their routes, unless the browser is offline
+// or older changes are still queued, which must reach the server first.
+async function shouldQueueChange() {
+  return !navigator.onLine || (await hasQueuedOperations());
+}
+
+function queueBarValueLocally(widget, value) {
+  const today = todayIsoDate();
+  widget.today_entry = { ...(widget.today_entry || {}), date: today, value };
+  setBarPoint(widget.series, today.slice(5), value);
+  return enqueueOperation({ op: "bar.set", widget_id: widget.id, value });
+}
+
+function queuePieHoursLocally(widget, hours) {
+  const totalTracked = hours.reduce((sum, value) => sum + value, 0);
+  const wastedHours = Math.max(0, 24 - totalTracked);
+  widget.today_entries = hours;
+  widget.plot = {
+    ...widget.plot,
+    values: [...hours, wastedHours],
+    total_tracked: totalTracked,
+    wasted_hours: wastedHours,
+  };
+  return enqueueOperation({ op: "pie.set", widget_id: widget.id, hours });
+}
+
+// Mutations ask for a compact delta (?delta=1) and patch the local widget with
+// it. A delta only applies on top of the version it was made from; if another
+// tab changed the widget in between, the whole dashboard is reloaded instead.
+function applyBarDelta(widget, delta) {
+  if (delta.version !== widget.version + 1) {
+    return false;
   }
+
+  widget.version = delta.version;
+  widget.entries = (widget.entries || []).filter((entry) => entry.date !== delta.date);
+  if (delta.entry) {
+    widget.entries.push(delta.entry);
+    widget.entries.sort((a, b) => a.date.localeCompare(b.date));
+  }
+  widget.today_entry = delta.entry;
+
+  setBarPoint(widget.series, delta.point.label, delta.point.value);
+  return true;
+}
+
+function applyPieDelta(widget, delta) {
+  if (delta.version !== widget.version + 1) {
+    return false;
+  }
+
+  widget.version = delta.version;
+  widget.today_entries = delta.today_entries;
+  widget.plot = { ...widget.plot, ...delta.plot };
+  return true;
 }
 
 async function submitBarEntry(event, widgetId) {
@@ -307,16 +793,28 @@ async function submitBarEntry(event, widgetId) {
   const method = widget.today_entry ? "PUT" : "POST";
 
   try {
-    const data = await fetchJson(`/widgets/${widgetId}/bar/entry`, {
-      method,
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ value }),
-    });
-
-    Object.assign(widget, data.widget);
-    renderBarWidget(`widget-graph-${widgetId}`, widget);
-    renderBarActions(widget.id, widget.config, widget.today_entry);
+    if (await shouldQueueChange()) {
+      await queueBarValueLocally(widget, value);
+    } else {
+      const data = await fetchJson(`/widgets/${widgetId}/bar/entry?delta=1`, {
+        method,
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ value }),
+      });
+
+      if (!applyBarDelta(widget, data.delta)) {
+        await loadDashboard();
+        return;
+      }
+    }
+    renderWidgetContent(widget);
   } catch (error) {
+    if (error instanceof TypeError) {
+      // The request never reached the server; keep the change for later.
+      await queueBarValueLocally(widget, value);
+      renderWidgetContent(widget);
+      return;
+    }
     alert(error.message);
   }
 }
@@ -346,20 +844,139 @@ async function submitPieEntry(event, widgetId) {
   }
 
   try {
-    const data = await fetchJson(`/widgets/${widgetId}/pie/entry`, {
-      method: "PUT",
+    if (await shouldQueueChange()) {
+      await queuePieHoursLocally(widget, hours);
+    } else {
+      const data = await fetchJson(`/widgets/${widgetId}/pie/entry?delta=1`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ hours }),
+      });
+
+      if (!applyPieDelta(widget, data.delta)) {
+        await loadDashboard();
+        return;
+      }
+    }
+    renderWidgetContent(widget);
+  } catch (error) {
+    if (error instanceof TypeError) {
+      // The request never reached the server; keep the change for later.
+      await queuePieHoursLocally(widget, hours);
+      renderWidgetContent(widget);
+      return;
+    }
+    alert(error.message);
+  }
+}
+
+// Cards are dragged by their handle only, so the forms inside stay usable.
+// Dropping a card sends a single move, which the server applies by giving the
+// widget a position between its new neighbours.
+let draggedCard = null;
+
+function sortDashboardWidgets() {
+  dashboardWidgets.sort((a, b) => a.position - b.position || a.id - b.id);
+}
+
+function reorderDashboardCards() {
+  const addButtonWrap = dashboardEl.querySelector(".dashboard-add-wrap");
+  dashboardWidgets.forEach((widget) => {
+    const card = dashboardEl.querySelector(`.widget-card[data-widget-id="${widget.id}"]`);
+    if (card) {
+      dashboardEl.insertBefore(card, addButtonWrap);
+    }
+  });
+}
+
+function applyWidgetPositions(positions) {
+  dashboardWidgets.forEach((widget) => {
+    if (positions[widget.id] !== undefined) {
+      widget.position = positions[widget.id];
+    }
+  });
+  sortDashboardWidgets();
+  reorderDashboardCards();
+}
+
+async function moveWidget(widgetId, afterId) {
+  try {
+    const data = await fetchJson(`/widgets/${widgetId}/move`, {
+      method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ hours }),
+      body: JSON.stringify({ after: afterId }),
     });
-
-    Object.assign(widget, data.widget);
-    renderPieWidget(`widget-graph-${widgetId}`, widget);
-    renderPieActions(widget.id, widget);
+    applyWidgetPositions(data.positions);
   } catch (error) {
+    reorderDashboardCards();
     alert(error.message);
   }
 }
 
+dashboardEl.addEventListener("pointerdown", (event) => {
+  const handle = event.target.closest(".widget-drag-handle");
+  if (handle) {
+    handle.closest(".widget-card").draggable = true;
+  }
+});
+
+dashboardEl.addEventListener("pointerup", () => {
+  if (!draggedCard) {
+    dashboardEl.querySelectorAll('.widget-card[draggable="true"]').forEach((card) => {
+      card.draggable = false;
+    });
+  }
+});
+
+dashboardEl.addEventListener("dragstart", (event) => {
+  draggedCard = event.target.closest(".widget-card");
+  if (!draggedCard) {
+    return;
+  }
+  draggedCard.classList.add("widget-card-dragging");
+  event.dataTransfer.effectAllowed = "move";
+  event.dataTransfer.setData("text/plain", draggedCard.dataset.widgetId);
+});
+
+dashboardEl.addEventListener("dragover", (event) => {
+  if (!draggedCard) {
+    return;
+  }
+  event.preventDefault();
+  const target = event.target.closest(".widget-card");
+  if (!target || target === draggedCard) {
+    return;
+  }
+  const { top, height } = target.getBoundingClientRect();
+  const before = event.clientY < top + height / 2;
+  dashboardEl.insertBefore(draggedCard, before ? target : target.nextSibling);
+});
+
+dashboardEl.addEventListener("drop", (event) => {
+  if (draggedCard) {
+    event.preventDefault();
+  }
+});
+
+dashboardEl.addEventListener("dragend", () => {
+  if (!draggedCard) {
+    return;
+  }
+  const card = draggedCard;
+  draggedCard = null;
+  card.draggable = false;
+  card.classList.remove("widget-card-dragging");
+
+  const widgetId = Number(card.dataset.widgetId);
+  const previous = card.previousElementSibling;
+  const afterId = previous ? Number(previous.dataset.widgetId) : null;
+  const index = dashboardWidgets.findIndex((item) => item.id === widgetId);
+  const currentAfterId = index > 0 ? dashboardWidgets[index - 1].id : null;
+  if (afterId !== currentAfterId) {
+    moveWidget(widgetId, afterId);
+  }
+});
+
 async function removeWidget(widgetId) {
   const widget = dashboardWidgets.find((item) => item.id === widgetId);
   if (!widget) {
@@ -523,7 +1140,93 @@ window.addEventListener("click", (event) => {
   }
 });
 
-loadDashboard().catch((error) => {
-  emptyStateEl.hidden = false;
-  emptyStateEl.querySelector("p").textContent = error.message;
-});
+// Changes made in other tabs and on other devices arrive as server-sent
+// events. Each carries the widget version it produced: events this tab
+// already reflects are skipped, and one it cannot apply on top of its copy
+// falls back to a reload.
+let dashboardReloadTimer = null;
+
+function scheduleDashboardReload() {
+  clearTimeout(dashboardReloadTimer);
+  dashboardReloadTimer = setTimeout(() => loadDashboard().catch(() => {}), 300);
+}
+
+function applyRadarEvent(widget, data) {
+  widget.version = data.version;
+  widget.config.scores = data.scores;
+  widget.config.today_deltas = data.today_deltas;
+  widget.plot = { ...widget.plot, r: data.r };
+  return true;
+}
+
+function onWidgetEvent(applyEvent) {
+  return (event) => {
+    const data = JSON.parse(event.data);
+    const widget = dashboardWidgets.find((item) => item.id === data.id);
+    if (widget && data.version <= widget.version) {
+      return;
+    }
+    if (!widget || !applyEvent(widget, data)) {
+      scheduleDashboardReload();
+      return;
+    }
+    renderWidgetContent(widget);
+  };
+}
+
+// A widget.changed event carries no data to apply, so it reloads the
+// dashboard, unless it only reports this tab's own batch still on its way:
+// that is settled once the /sync response arrives.
+const reloadOnWidgetChanged = onWidgetEvent(() => false);
+
+function onWidgetChanged(event) {
+  const data = JSON.parse(event.data);
+  if (syncInFlightWidgets.has(data.id)) {
+    syncHeldVersions.set(data.id, Math.max(syncHeldVersions.get(data.id) ?? 0, data.version));
+    return;
+  }
+  reloadOnWidgetChanged(event);
+}
+
+function subscribeToWidgetEvents() {
+  if (!window.EventSource) {
+    return;
+  }
+
+  const source = new EventSource("/events");
+  source.addEventListener("widget.radar", onWidgetEvent(applyRadarEvent));
+  source.addEventListener("widget.bar", onWidgetEvent(applyBarDelta));
+  source.addEventListener("widget.pie", onWidgetEvent(applyPieDelta));
+  source.addEventListener("widget.changed", onWidgetChanged);
+  source.addEventListener("widget.created", (event) => {
+    const { widget } = JSON.parse(event.data);
+    if (!dashboardWidgets.some((item) => item.id === widget.id)) {
+      dashboardWidgets.push(widget);
+      sortDashboardWidgets();
+      renderDashboard();
+    }
+  });
+  source.addEventListener("widget.deleted", (event) => {
+    const { id } = JSON.parse(event.data);
+    if (dashboardWidgets.some((item) => item.id === id)) {
+      dashboardWidgets = dashboardWidgets.filter((item) => item.id !== id);
+      renderDashboard();
+    }
+  });
+  source.addEventListener("widgets.reordered", (event) => {
+    applyWidgetPositions(JSON.parse(event.data).positions);
+  });
+  source.addEventListener("resync", scheduleDashboardReload);
+}
+
+window.addEventListener("online", () => scheduleSyncFlush(0));
+
+loadDashboard()
+  .then(() => {
+    subscribeToWidgetEvents();
+    scheduleSyncFlush(0);
+  })
+  .catch((error) => {
+    emptyStateEl.hidden = false;
+    emptyStateEl.querySelector("p").textContent = error.message;
+  });
@@ -0,0 +1,48 @@
+from datetime import timedelta
+import json
+
+import pytest
+
+import app as progvis
+
+VALUES = [1, 2, 0, 3, 3, 3, 3, 0, 4, 5]
+
+
+def test_streaks_and_moving_averages_of_a_known_series(register, monkeypatch):
+    client = register("analytics-series")
+    widget_id = client.post("/widgets", json={"type": "bar", "metric_name": "Pages", "unit": "pages"}).get_json()[
+        "widget"
+    ]["id"]
+    today = progvis.current_day()
+    first_day = today - timedelta(days=len(VALUES) - 1)
+    rows = "\n".join(
+        json.dumps({"date": (first_day + timedelta(days=offset)).isoformat(), "value": value})
+        for offset, value in enumerate(VALUES)
+        if value
+    )
+    assert client.post(f"/widgets/{widget_id}/import?format=jsonl", data=rows).status_code == 200
+    monkeypatch.setattr(progvis, "current_day", lambda: today)
+
+    analytics = client.get(f"/widgets/{widget_id}/analytics").get_json()
+    assert analytics["first_day"] == first_day.isoformat()
+    assert analytics["tracked_days"] == 10
+    assert analytics["streak"] == {"current": 2, "longest": 4}
+    assert analytics["active_days"] == 8
+    assert analytics["consistency"] == 0.8
+    assert analytics["total"] == 24
+    assert analytics["moving_averages"]["start"] == first_day.isoformat()
+    assert analytics["moving_averages"]["7"] == pytest.approx(
+        [1, 1.5, 1, 1.5, 1.8, 2, 2.1429, 2, 2.2857, 3], abs=1e-4
+    )
+    assert analytics["moving_averages"]["30"] == pytest.approx(
+        [1, 1.5, 1, 1.5, 1.8, 2, 2.1429, 1.875, 2.1111, 2.4], abs=1e-4
+    )
+
+    # The next day is folded into the stored figures; nothing logged yet, so
+    # the streak that ended yesterday still counts as current.
+    monkeypatch.setattr(progvis, "current_day", lambda: today + timedelta(days=1))
+    analytics = client.get(f"/widgets/{widget_id}/analytics").get_json()
+    assert analytics["streak"] == {"current": 2, "longest": 4}
+    assert analytics["active_days"] == 8
+    assert analytics["tracked_days"] == 11
+    assert analytics["moving_averages"]["7"][-1] == pytest.approx(18 / 7, abs=1e-4)
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+
+async def call(application, method, path, cookie, body=b""):
+    """Run one request through the ASGI app; returns its status and body."""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "http_version": "1.1",
+        "headers": [(b"cookie", f"session={cookie}".encode()), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 40000),
+        "server": ("127.0.0.1", 5000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status, chunks = None, []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        else:
+            chunks.append(message.get("body", b""))
+            # Let the other requests run between the chunks of this one.
+            await asyncio.sleep(0)
+
+    await application(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def test_concurrent_requests_keep_their_own_session(register, monkeypatch):
+    import app as app_module
+    from asgi import application
+
+    # Send every record on its own and fetch a few rows per query, so the
+    # exports switch between each other many times on the event loop.
+    monkeypatch.setattr(app_module, "EXPORT_BUFFER_BYTES", 1)
+    monkeypatch.setattr(app_module, "EXPORT_FETCH_SIZE", 5)
+
+    clients, widget_ids = {}, []
+    for number in range(4):
+        username = f"asgi-{number}"
+        client = register(username)
+        widget = client.post("/widgets", json={"type": "bar", "metric_name": username, "unit": "x"}).get_json()
+        rows = "\n".join(json.dumps({"date": f"2020-01-{day:02d}", "value": number}) for day in range(1, 29))
+        client.post(f"/widgets/{widget['widget']['id']}/import?format=jsonl", data=rows)
+        clients[username] = client.get_cookie("session").value
+        widget_ids.append(widget["widget"]["id"])
+
+    async def run_all():
+        exports = [call(application, "GET", "/export", cookie) for cookie in clients.values()]
+        dashboards = [call(application, "GET", "/dashboard-data", cookie) for cookie in clients.values()]
+        return await asyncio.gather(*exports, *dashboards)
+
+    responses = asyncio.run(run_all())
+    exports, dashboards = responses[: len(clients)], responses[len(clients) :]
+    for number, (status, body) in enumerate(exports):
+        assert status == 200
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        widgets = [record for record in records if record["record"] == "widget"]
+        assert [widget["config"]["metric_name"] for widget in widgets] == [f"asgi-{number}"]
+        entries = [record for record in records if record["record"] == "bar_entry"]
+        assert len(entries) == 28 and {entry["value"] for entry in entries} == {number}
+    for number, (status, body) in enumerate(dashboards):
+        assert status == 200
+        assert [widget["id"] for widget in json.loads(body)["widgets"]] == [widget_ids[number]]
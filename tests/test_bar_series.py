@@ -0,0 +1,86 @@
+from datetime import date
+import itertools
+import json
+
+import numpy as np
+import pytest
+
+from app import bar_bucket_ids, bar_bucket_start_ordinals, lttb_indices
+
+ENTRIES = {
+    "2024-12-29": 1,
+    "2024-12-30": 2,
+    "2025-01-01": 4,
+    "2025-01-05": 8,
+    "2025-01-06": 16,
+    "2025-01-31": 32,
+    "2025-02-01": 64,
+}
+usernames = (f"bar-series-{number}" for number in itertools.count())
+
+
+@pytest.fixture
+def bar_widget(register):
+    client = register(next(usernames))
+    widget_id = client.post("/widgets", json={"type": "bar", "metric_name": "Pages", "unit": "pages"}).get_json()[
+        "widget"
+    ]["id"]
+    rows = "\n".join(json.dumps({"date": day, "value": value}) for day, value in ENTRIES.items())
+    assert client.post(f"/widgets/{widget_id}/import?format=jsonl", data=rows).status_code == 200
+
+    def series(**params):
+        query = "&".join(f"{name}={value}" for name, value in params.items())
+        response = client.get(f"/widgets/{widget_id}/bar/series?{query}")
+        assert response.status_code == 200
+        return response.get_json()
+
+    return series
+
+
+def test_lttb_keeps_the_ends_and_the_threshold():
+    values = np.random.default_rng(7).random(1000)
+    values[400] = 50
+    picked = lttb_indices(values, 50)
+    assert len(picked) == 50
+    assert picked[0] == 0 and picked[-1] == 999
+    assert np.all(np.diff(picked) > 0)
+    assert 400 in picked
+    # Nothing to drop below the threshold.
+    assert lttb_indices(values[:20], 50).tolist() == list(range(20))
+
+
+@pytest.mark.parametrize(
+    "before, after, resolution",
+    [
+        ("2024-12-29", "2024-12-30", "week"),  # Sunday, then Monday
+        ("2025-01-05", "2025-01-06", "week"),
+        ("2024-12-31", "2025-01-01", "month"),
+        ("2024-02-29", "2024-03-01", "month"),
+    ],
+)
+def test_bucket_boundaries(before, after, resolution):
+    ordinals = np.array([date.fromisoformat(before).toordinal(), date.fromisoformat(after).toordinal()])
+    first, second = bar_bucket_ids(ordinals, resolution)
+    assert second == first + 1
+    start = date.fromordinal(int(bar_bucket_start_ordinals(np.array([second]), resolution)[0]))
+    assert start == date.fromisoformat(after)
+
+
+def test_weeks_start_on_monday_across_the_new_year(bar_widget):
+    series = bar_widget(start="2024-12-25", end="2025-02-02", resolution="week", agg="sum")
+    assert series["dates"] == ["2024-12-23", "2024-12-30", "2025-01-06", "2025-01-13", "2025-01-20", "2025-01-27"]
+    assert series["values"] == [1, 14, 16, 0, 0, 96]
+
+
+def test_months_split_on_the_first(bar_widget):
+    sums = bar_widget(start="2024-12-15", end="2025-02-10", resolution="month", agg="sum")
+    assert sums["dates"] == ["2024-12-01", "2025-01-01", "2025-02-01"]
+    assert sums["values"] == [3, 60, 64]
+    assert bar_widget(start="2024-12-15", end="2025-02-10", resolution="month", agg="max")["values"] == [2, 32, 64]
+
+
+def test_lttb_series_spans_the_range(bar_widget):
+    series = bar_widget(start="2024-12-01", end="2025-02-28", resolution="lttb", points=10)
+    assert len(series["dates"]) == len(series["values"]) == 10
+    assert series["dates"][0] == "2024-12-01" and series["dates"][-1] == "2025-02-28"
+    assert "2025-02-01" in series["dates"]
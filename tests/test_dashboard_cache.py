@@ -0,0 +1,27 @@
+import json
+
+from app import app
+
+
+def test_writes_from_other_processes_reach_the_cache_and_etag(register, tmp_path):
+    client = register("dashboard-cache")
+    widget = client.post("/widgets", json={"type": "bar", "metric_name": "Pages", "unit": "pages"}).get_json()
+    first = client.get("/dashboard-data")
+    assert first.headers["X-Dashboard-Cache"] == "miss"
+    assert client.get("/dashboard-data").headers["X-Dashboard-Cache"] == "hit"
+    revalidated = client.get("/dashboard-data", headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["X-Dashboard-Cache"] == "revalidated"
+
+    # A CLI import writes through its own session, as another worker would;
+    # the version it bumps is read from the database on the next request.
+    path = tmp_path / "pages.jsonl"
+    path.write_text(json.dumps({"date": "2020-01-01", "value": 3}))
+    result = app.test_cli_runner().invoke(args=["import-entries", str(widget["widget"]["id"]), str(path)])
+    assert result.exit_code == 0, result.output
+
+    after = client.get("/dashboard-data", headers={"If-None-Match": first.headers["ETag"]})
+    assert after.status_code == 200
+    assert after.headers["X-Dashboard-Cache"] == "miss"
+    assert after.headers["ETag"] != first.headers["ETag"]
+    assert after.get_json()["widgets"][0]["version"] > widget["widget"]["version"]
@@ -0,0 +1,42 @@
+from sqlalchemy import event
+
+from app import app, db, load_dashboard_widgets
+
+
+def create_user_with_widgets(client, widgets_per_type):
+    """Give a user ``widgets_per_type`` widgets of each type, all with data for today."""
+    for _ in range(widgets_per_type):
+        radar = client.post("/widgets", json={"type": "radar", "domains": ["Body", "Mind", "Craft"]})
+        bar = client.post("/widgets", json={"type": "bar", "metric_name": "Pages read"})
+        pie = client.post("/widgets", json={"type": "pie", "categories": ["Work", "Study"]})
+        radar_id, bar_id, pie_id = (item.get_json()["widget"]["id"] for item in (radar, bar, pie))
+        assert client.post(f"/widgets/{radar_id}/radar/update-score", json={"index": 0, "change": 1}).status_code == 200
+        assert client.post(f"/widgets/{bar_id}/bar/entry", json={"value": 5}).status_code == 200
+        assert client.put(f"/widgets/{pie_id}/pie/entry", json={"hours": [2, 1]}).status_code == 200
+    with client.session_transaction() as flask_session:
+        return flask_session["user_id"]
+
+
+def count_dashboard_queries(user_id):
+    statements = []
+
+    def count_statement(*_):
+        statements.append(1)
+
+    with app.test_request_context():
+        # Pending radar decay is written on the first load only.
+        load_dashboard_widgets(user_id)
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        try:
+            widgets = load_dashboard_widgets(user_id)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+    return len(statements), len(widgets)
+
+
+def test_dashboard_query_count_does_not_grow_with_widgets(register):
+    few_queries, few_widgets = count_dashboard_queries(create_user_with_widgets(register("few-widgets"), 1))
+    many_queries, many_widgets = count_dashboard_queries(create_user_with_widgets(register("many-widgets"), 6))
+
+    assert (few_widgets, many_widgets) == (3, 18)
+    assert many_queries == few_queries
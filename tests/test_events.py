@@ -0,0 +1,68 @@
+import pytest
+
+from app import MemoryEventBroker, RedisEventBroker
+
+
+def event_types(events):
+    return [event_type for _, event_type, _ in events]
+
+
+@pytest.fixture
+def redis_broker(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.Redis, "from_url", lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)
+    )
+    return RedisEventBroker("redis://localhost:6379/0", replay_size=100)
+
+
+def test_redis_subscription_keeps_events_published_between_reads(redis_broker):
+    redis_broker.publish(1, "widget.changed", {"id": 1})
+    subscription = redis_broker.subscribe(1)
+    redis_broker.publish(1, "widget.changed", {"id": 2})
+    redis_broker.publish(1, "widget.deleted", {"id": 3})
+    assert [data["id"] for _, _, data in subscription.get(timeout=0.1)] == [2, 3]
+    redis_broker.publish(1, "widget.changed", {"id": 4})
+    assert [data["id"] for _, _, data in subscription.get(timeout=0.1)] == [4]
+
+
+def test_redis_subscription_replays_after_last_event_id(redis_broker):
+    for widget_id in range(3):
+        redis_broker.publish(1, "widget.changed", {"id": widget_id})
+    first_id = redis_broker.client.xrange(redis_broker.stream_key(1), count=1)[0][0]
+    assert [data["id"] for _, _, data in redis_broker.subscribe(1, first_id).get(timeout=0.1)] == [1, 2]
+
+
+@pytest.mark.parametrize("last_event_id", ["5-x", "abc", "99999999999999-0"])
+def test_redis_subscription_resyncs_on_unknown_ids(redis_broker, last_event_id):
+    redis_broker.publish(1, "widget.changed", {"id": 1})
+    subscription = redis_broker.subscribe(1, last_event_id)
+    assert event_types(subscription.get(timeout=0.1)) == ["resync"]
+    redis_broker.publish(1, "widget.changed", {"id": 2})
+    assert [data["id"] for _, _, data in subscription.get(timeout=0.1)] == [2]
+
+
+def test_memory_broker_replays_after_last_event_id():
+    broker = MemoryEventBroker(replay_size=10)
+    for widget_id in range(3):
+        broker.publish(1, "widget.changed", {"id": widget_id})
+    assert [data["id"] for _, _, data in broker.subscribe(1, "1").get(timeout=0.1)] == [1, 2]
+
+
+@pytest.mark.parametrize("last_event_id", ["5-x", "²", "50"])
+def test_memory_broker_resyncs_on_unknown_ids(last_event_id):
+    broker = MemoryEventBroker(replay_size=10)
+    for widget_id in range(3):
+        broker.publish(1, "widget.changed", {"id": widget_id})
+    assert event_types(broker.subscribe(1, last_event_id).get(timeout=0.1)) == ["resync"]
+
+
+def test_memory_broker_resyncs_when_events_were_dropped():
+    broker = MemoryEventBroker(replay_size=2)
+    for widget_id in range(5):
+        broker.publish(1, "widget.changed", {"id": widget_id})
+    assert event_types(broker.subscribe(1, "1").get(timeout=0.1)) == ["resync"]
+    assert [data["id"] for _, _, data in broker.subscribe(1, "3").get(timeout=0.1)] == [3, 4]
@@ -0,0 +1,164 @@
+from datetime import timedelta
+import threading
+import time
+
+import app as app_module
+from app import (
+    BarEntry,
+    LeaderboardEntry,
+    LeaderboardRankNode,
+    app,
+    current_day,
+    db,
+    rebuild_leaderboard_entries,
+    record_user_activity,
+)
+
+
+def user_id_of(client):
+    with client.session_transaction() as flask_session:
+        return flask_session["user_id"]
+
+
+def stored_and_rebuilt(user_id):
+    """The user's leaderboard row as kept by the write path and as recomputed from history."""
+    with app.app_context():
+        entry = db.session.get(LeaderboardEntry, user_id)
+        stored = (entry.score, entry.active_days, entry.last_active_day) if entry else (0, 0, None)
+        rebuild_leaderboard_entries([user_id])
+        entry = db.session.get(LeaderboardEntry, user_id)
+        rebuilt = (entry.score, entry.active_days, entry.last_active_day)
+        db.session.rollback()
+    return stored, rebuilt
+
+
+def test_clearing_todays_activity_matches_a_rebuild(register):
+    client = register("clears-today")
+    user_id = user_id_of(client)
+    bar_id = client.post("/widgets", json={"type": "bar", "metric_name": "Pages"}).get_json()["widget"]["id"]
+    pie_id = client.post("/widgets", json={"type": "pie", "categories": ["Work"]}).get_json()["widget"]["id"]
+
+    client.post(f"/widgets/{bar_id}/bar/entry", json={"value": 4})
+    client.put(f"/widgets/{pie_id}/pie/entry", json={"hours": [2]})
+    client.delete(f"/widgets/{bar_id}/bar/entry")
+    stored, rebuilt = stored_and_rebuilt(user_id)
+    assert stored == rebuilt and stored[1] == 1
+
+    client.put(f"/widgets/{pie_id}/pie/entry", json={"hours": [0]})
+    stored, rebuilt = stored_and_rebuilt(user_id)
+    assert stored == rebuilt == (0, 0, None)
+
+    client.post(f"/widgets/{bar_id}/bar/entry", json={"value": 4})
+    client.delete(f"/widgets/{bar_id}")
+    stored, rebuilt = stored_and_rebuilt(user_id)
+    assert stored == rebuilt == (0, 0, None)
+
+
+def test_pages_and_ranks_follow_the_scores(register):
+    today = current_day()
+    clients = [register(f"ranked-{index}") for index in range(6)]
+    with app.app_context():
+        for index, client in enumerate(clients):
+            bar_id = client.post("/widgets", json={"type": "bar", "metric_name": "Pages"}).get_json()["widget"]["id"]
+            # Two users share each score.
+            for offset in range(index // 2 + 1):
+                db.session.add(BarEntry(widget_id=bar_id, date=today - timedelta(days=offset), value=1))
+            db.session.commit()
+            rebuild_leaderboard_entries([user_id_of(client)])
+            db.session.commit()
+        scores = {entry.user.username: entry.score for entry in LeaderboardEntry.query}
+
+    client = clients[0]
+    seen, after = [], None
+    while True:
+        page = client.get("/leaderboard", query_string={"limit": 4, **({"after": after} if after else {})}).get_json()
+        seen += page["entries"]
+        if not page["has_more"]:
+            break
+        after = page["next_after"]
+
+    assert sorted(item["username"] for item in seen) == sorted(scores)
+    assert [item["score"] for item in seen] == sorted(scores.values(), reverse=True)
+    for item in seen:
+        assert item["rank"] == 1 + sum(score > item["score"] for score in scores.values())
+
+    me = client.get("/leaderboard/me", query_string={"neighbors": 2}).get_json()
+    assert me["me"]["rank"] == 1 + sum(score > scores["ranked-0"] for score in scores.values())
+    assert client.get("/leaderboard", query_string={"after": "5-x"}).status_code == 400
+
+
+def rank_tree_after_rebuild():
+    """The rank tree as the write path left it and as ``flask rebuild-leaderboard`` rebuilds it."""
+
+    def read_tree():
+        with app.app_context():
+            nodes = db.session.query(LeaderboardRankNode.node, LeaderboardRankNode.users)
+            return {node: users for node, users in nodes if users}
+
+    kept = read_tree()
+    result = app.test_cli_runner().invoke(args=["rebuild-leaderboard"])
+    assert result.exit_code == 0, result.output
+    return kept, read_tree()
+
+
+def test_a_radar_gain_taken_back_is_not_an_active_day(register):
+    client = register("radar-undo")
+    radar = client.post("/widgets", json={"type": "radar", "domains": ["Body", "Mind", "Craft"]}).get_json()
+    radar_id = radar["widget"]["id"]
+    client.post(f"/widgets/{radar_id}/radar/update-score", json={"index": 0, "change": -1})
+    client.post(f"/widgets/{radar_id}/radar/update-score", json={"index": 0, "change": 1})
+    stored, rebuilt = stored_and_rebuilt(user_id_of(client))
+    assert stored == rebuilt == (0, 0, None)
+
+    client.post(f"/widgets/{radar_id}/radar/update-score", json={"index": 1, "change": 1})
+    stored, rebuilt = stored_and_rebuilt(user_id_of(client))
+    assert stored == rebuilt == (2, 1, current_day())
+
+
+def test_same_day_writes_keep_the_rank_tree(register, monkeypatch):
+    # Start from a rebuilt leaderboard, which also gives every earlier user a row.
+    rank_tree_after_rebuild()
+    client = register("same-day")
+    bar_id = client.post("/widgets", json={"type": "bar", "metric_name": "Pages"}).get_json()["widget"]["id"]
+    radar = client.post("/widgets", json={"type": "radar", "domains": ["Body", "Mind", "Craft"]}).get_json()
+    radar_id = radar["widget"]["id"]
+    client.post(f"/widgets/{bar_id}/bar/entry", json={"value": 3})
+    client.post(f"/widgets/{radar_id}/radar/update-score", json={"index": 0, "change": 1})
+
+    # Two first writes of the day for a user without a leaderboard row yet, at once.
+    racing = register("racing")
+    user_id = user_id_of(racing)
+    racing_bar = racing.post("/widgets", json={"type": "bar", "metric_name": "Pages"}).get_json()["widget"]
+    with app.app_context():
+        db.session.add(BarEntry(widget_id=racing_bar["id"], date=current_day(), value=1))
+        db.session.commit()
+    barrier = threading.Barrier(2)
+    errors = []
+    # Hold each write between reading the user's row and moving their score,
+    # so the two overlap.
+    move_leaderboard_score = app_module.move_leaderboard_score
+
+    def slow_move_leaderboard_score(old_score, new_score):
+        time.sleep(0.2)
+        move_leaderboard_score(old_score, new_score)
+
+    monkeypatch.setattr(app_module, "move_leaderboard_score", slow_move_leaderboard_score)
+
+    def write():
+        with app.app_context():
+            barrier.wait()
+            try:
+                record_user_activity(user_id)
+                db.session.commit()
+            except Exception as exc:
+                errors.append(exc)
+
+    threads = [threading.Thread(target=write) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    kept, rebuilt = rank_tree_after_rebuild()
+    assert kept == rebuilt
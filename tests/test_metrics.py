@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import app, db
+
+
+def test_metrics_answers_loopback_only(monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "")
+    client = app.test_client()
+    assert client.get("/metrics").status_code == 200
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.7"}).status_code == 403
+
+
+def test_metrics_token(monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "scrape-me")
+    client = app.test_client()
+    assert client.get("/metrics").status_code == 403
+    response = client.get(
+        "/metrics",
+        headers={"Authorization": "Bearer scrape-me"},
+        environ_base={"REMOTE_ADDR": "203.0.113.7"},
+    )
+    assert response.status_code == 200
+    assert b"progvis_requests_total" in response.data
+
+
+def test_failed_statement_leaves_no_query_timer():
+    with app.app_context():
+        with db.engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM no_such_table"))
+            assert connection.info.get("query_started") == []
+            connection.execute(text("SELECT 1"))
+            assert connection.info.get("query_started") == []
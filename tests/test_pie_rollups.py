@@ -0,0 +1,46 @@
+from datetime import date
+
+import app as progvis
+from app import PieRollup, app, db
+
+
+def rollup_rows(widget_id):
+    # A category switched off again leaves an empty row behind, which a
+    # rebuild does not write.
+    with app.app_context():
+        return sorted(
+            (row.period, row.period_start, row.category_index, round(row.hours, 6), row.days)
+            for row in PieRollup.query.filter_by(widget_id=widget_id)
+            if row.hours or row.days
+        )
+
+
+def test_rollups_match_a_rebuild_across_week_and_month_edges(register, monkeypatch):
+    client = register("pie-rollups")
+    widget_id = client.post("/widgets", json={"type": "pie", "categories": ["Work", "Sport"]}).get_json()["widget"][
+        "id"
+    ]
+
+    # Sunday, Monday (a new week) and Tuesday (a new month), each saved more
+    # than once with categories switched on and off, and one day cleared.
+    edits = [
+        ("2025-03-30", [2, 1]),
+        ("2025-03-30", [3, 0]),
+        ("2025-03-31", [1.5, 2]),
+        ("2025-03-31", [0, 2.5]),
+        ("2025-04-01", [4, 0]),
+        ("2025-04-01", [0, 0]),
+        ("2025-04-02", [0, 1]),
+        ("2025-04-02", [6, 1]),
+    ]
+    for day, hours in edits:
+        monkeypatch.setattr(progvis, "current_day", lambda day=day: date.fromisoformat(day))
+        assert client.put(f"/widgets/{widget_id}/pie/entry", json={"hours": hours}).status_code == 200
+
+    kept = rollup_rows(widget_id)
+    assert ("week", date(2025, 3, 24), -1, 3.0, 1) in kept
+    assert ("month", date(2025, 4, 1), -1, 7.0, 1) in kept
+
+    result = app.test_cli_runner().invoke(args=["rebuild-pie-rollups"])
+    assert result.exit_code == 0, result.output
+    assert kept == rollup_rows(widget_id)
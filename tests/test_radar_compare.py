@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import app as progvis
+from app import DashboardWidget, app, db
+
+
+def test_comparison_uses_the_latest_snapshot_on_or_before_the_day(register, monkeypatch):
+    client = register("radar-compare")
+    widget_id = client.post("/widgets", json={"type": "radar", "domains": ["Body", "Mind", "Craft"]}).get_json()[
+        "widget"
+    ]["id"]
+    created = progvis.current_day() - timedelta(days=40)
+    with app.app_context():
+        widget = db.session.get(DashboardWidget, widget_id)
+        widget.created_at = datetime.combine(created, datetime.min.time())
+        widget.radar_data.decay_evaluated_on = None
+        db.session.commit()
+
+    # Body is worked on every third day and never decays; Mind once, on day
+    # 3, and loses that point again on day 7.
+    gains = {1: 0, 3: 1, 4: 0, 7: 0, 10: 0, 11: 0, 15: 1}
+    for offset, index in sorted(gains.items()):
+        monkeypatch.setattr(progvis, "current_day", lambda offset=offset: created + timedelta(days=offset))
+        response = client.post(f"/widgets/{widget_id}/radar/update-score", json={"index": index, "change": 1})
+        assert response.status_code == 200
+
+    monkeypatch.setattr(progvis, "current_day", lambda: created + timedelta(days=30))
+
+    def comparison(query=""):
+        widgets = client.get(f"/dashboard-data{query}").get_json()["widgets"]
+        return next(widget for widget in widgets if widget["id"] == widget_id)["plot"]["comparison"]
+
+    twenty_days_ago = comparison()
+    assert twenty_days_ago["date"] == (created + timedelta(days=10)).isoformat()
+    assert twenty_days_ago["scores"] == [4, 0, 0]
+    # Day 6 has no snapshot of its own; the one from day 4 still holds.
+    assert comparison("?compare_days=24")["scores"] == [2, 1, 0]
+    assert comparison(f"?compare_date={(created + timedelta(days=7)).isoformat()}")["scores"] == [3, 0, 0]
+    # Before the first snapshot the radar still had its initial scores.
+    assert comparison(f"?compare_date={created.isoformat()}")["scores"] == [0, 0, 0]
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import app as progvis
+from app import DashboardWidget, app, db
+
+
+def test_decay_after_four_inactive_days(register, monkeypatch):
+    client = register("radar-decay")
+    widget_id = client.post("/widgets", json={"type": "radar", "domains": ["Body", "Mind", "Craft"]}).get_json()[
+        "widget"
+    ]["id"]
+    created = progvis.current_day() - timedelta(days=10)
+    with app.app_context():
+        widget = db.session.get(DashboardWidget, widget_id)
+        widget.created_at = datetime.combine(created, datetime.min.time())
+        widget.radar_data.decay_evaluated_on = None
+        db.session.commit()
+
+    def on_day(offset):
+        monkeypatch.setattr(progvis, "current_day", lambda: created + timedelta(days=offset))
+
+    def radar():
+        widgets = client.get("/dashboard-data").get_json()["widgets"]
+        return next(widget for widget in widgets if widget["id"] == widget_id)
+
+    def gain(index):
+        response = client.post(f"/widgets/{widget_id}/radar/update-score", json={"index": index, "change": 1})
+        assert response.status_code == 200
+
+    on_day(0)
+    gain(0)
+    gain(1)
+    on_day(2)
+    gain(1)
+
+    # Body was last worked on day 0: days 1 to 4 are inactive, and day 4 is
+    # only evaluated once it is over.
+    on_day(4)
+    before = radar()
+    assert before["config"]["scores"] == [1, 2, 0]
+    on_day(5)
+    after = radar()
+    assert after["config"]["scores"] == [0, 2, 0]
+    assert after["version"] > before["version"]
+
+    # Decay stops at zero, and Mind decays four days after its last gain.
+    on_day(9)
+    assert radar()["config"]["scores"] == [0, 1, 0]
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+import json
+
+import app as progvis
+from app import DashboardWidget, RADAR_DECAY_FLOOR, RADAR_DECAY_INACTIVE_DAYS, app, db, get_radar_snapshot_scores
+
+DOMAINS = ["Body", "Mind", "Craft"]
+
+
+def simulate(changes, created, today):
+    """Scores at the end of each day, replaying ``changes`` with the decay rules one day at a time."""
+    scores = [0.0] * len(DOMAINS)
+    last_gain = [created] * len(DOMAINS)
+    history = {}
+    day = created
+    while day <= today:
+        for index, delta in changes.get(day, {}).items():
+            scores[index] += delta
+            if delta > 0:
+                last_gain[index] = day
+        if day < today:
+            for index in range(len(DOMAINS)):
+                gap = (day - last_gain[index]).days
+                if gap > 0 and gap % RADAR_DECAY_INACTIVE_DAYS == 0:
+                    scores[index] = max(scores[index] - 1, min(scores[index], RADAR_DECAY_FLOOR))
+        history[day] = list(scores)
+        day += timedelta(days=1)
+    return history
+
+
+def test_backdated_import_replays_decay(register, monkeypatch):
+    client = register("radar-importer")
+    widget_id = client.post("/widgets", json={"type": "radar", "domains": DOMAINS}).get_json()["widget"]["id"]
+    today = progvis.current_day()
+    created = today - timedelta(days=30)
+    with app.app_context():
+        widget = db.session.get(DashboardWidget, widget_id)
+        widget.created_at = datetime.combine(created, datetime.min.time())
+        widget.radar_data.decay_evaluated_on = None
+        db.session.commit()
+
+    # Live use: a few gains and losses, with the dashboard opened (and decay
+    # caught up) every day.
+    changes = {created + timedelta(days=offset): {offset % 3: 1} for offset in (0, 1, 2, 3, 9, 10)}
+    changes[created + timedelta(days=11)] = {0: -1}
+    for offset in range(31):
+        day = created + timedelta(days=offset)
+        monkeypatch.setattr(progvis, "current_day", lambda day=day: day)
+        for index, change in changes.get(day, {}).items():
+            response = client.post(f"/widgets/{widget_id}/radar/update-score", json={"index": index, "change": change})
+            assert response.status_code == 200
+        assert client.get("/dashboard-data").status_code == 200
+
+    def stored_history():
+        with app.app_context():
+            return {
+                created + timedelta(days=offset): get_radar_snapshot_scores(
+                    [widget_id], created + timedelta(days=offset)
+                ).get(widget_id, [0.0] * len(DOMAINS))
+                for offset in range(31)
+            }
+
+    assert stored_history() == simulate(changes, created, today)
+
+    imported_day = created + timedelta(days=20)
+    body = json.dumps({"date": imported_day.isoformat(), "domain": "Craft", "delta": 1})
+    assert client.post(f"/widgets/{widget_id}/import", data=body).status_code == 200
+
+    changes[imported_day] = {2: 1}
+    expected = simulate(changes, created, today)
+    assert stored_history() == expected
+    widget = client.get("/dashboard-data").get_json()["widgets"][0]
+    assert widget["config"]["scores"] == expected[today]
+
+
+def test_oversized_bodies_are_refused(register, monkeypatch):
+    client = register("big-importer")
+    widget_id = client.post("/widgets", json={"type": "bar", "metric_name": "Pages"}).get_json()["widget"]["id"]
+    monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 1024)
+    response = client.post(f"/widgets/{widget_id}/import", data="x" * 2048)
+    assert response.status_code == 413
+    assert "error" in response.get_json()
@@ -0,0 +1,53 @@
+import importlib.util
+
+import pytest
+
+import app as app_module
+
+
+def test_cached_snapshots_skip_serialization(register, monkeypatch):
+    client = register("snapshot-cache")
+    widget = client.post("/widgets", json={"type": "bar", "metric_name": "Pages", "unit": "pages"}).get_json()
+    url = f"/widgets/{widget['widget']['id']}/snapshot"
+    assert client.get(url).headers["X-Snapshot-Cache"] == "miss"
+
+    serialized = []
+    serialize_widget = app_module.serialize_widget
+
+    def counting_serialize_widget(*args, **kwargs):
+        serialized.append(1)
+        return serialize_widget(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, "serialize_widget", counting_serialize_widget)
+    assert client.get(url).headers["X-Snapshot-Cache"] == "hit"
+    assert serialized == []
+
+    # A new entry bumps the version, so the chart is drawn again.
+    client.post(f"/widgets/{widget['widget']['id']}/bar/entry", json={"value": 5})
+    response = client.get(url)
+    assert response.headers["X-Snapshot-Cache"] == "miss"
+    assert serialized == [1]
+    assert client.get(f"{url}?width=300").headers["X-Snapshot-Cache"] == "miss"
+
+
+@pytest.mark.skipif(importlib.util.find_spec("cairosvg") is not None, reason="cairosvg is installed")
+def test_png_snapshots_need_cairosvg(register):
+    client = register("snapshot-png")
+    widget = client.post("/widgets", json={"type": "bar", "metric_name": "Pages", "unit": "pages"}).get_json()
+    response = client.get(f"/widgets/{widget['widget']['id']}/snapshot?format=png")
+    assert response.status_code == 501
+    assert "cairosvg" in response.get_json()["error"]
+
+
+def test_backfilled_radar_snapshots_redraw_the_chart(register):
+    client = register("snapshot-backfill")
+    widget = client.post("/widgets", json={"type": "radar", "domains": ["Body", "Mind", "Craft"]}).get_json()
+    url = f"/widgets/{widget['widget']['id']}/snapshot"
+    client.post(f"/widgets/{widget['widget']['id']}/radar/update-score", json={"index": 0, "change": 1})
+    assert client.get(url).headers["X-Snapshot-Cache"] == "miss"
+    assert client.get(url).headers["X-Snapshot-Cache"] == "hit"
+
+    # The comparison may change with the replayed history, so the command bumps the version.
+    result = app_module.app.test_cli_runner().invoke(args=["backfill-radar-snapshots", "--all"])
+    assert result.exit_code == 0, result.output
+    assert client.get(url).headers["X-Snapshot-Cache"] == "miss"
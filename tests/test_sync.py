@@ -0,0 +1,92 @@
+import pytest
+
+import app as app_module
+from app import event_broker
+
+
+def create_widget(client, payload):
+    return client.post("/widgets", json=payload).get_json()["widget"]
+
+
+@pytest.mark.parametrize("number, widget_id", list(enumerate([[1], {"id": 1}, "1", None, True])))
+def test_operations_need_an_integer_widget_id(register, number, widget_id):
+    client = register(f"sync-bad-id-{number}")
+    operation = {"key": "op-1", "op": "bar.set", "widget_id": widget_id, "value": 1}
+    response = client.post("/sync", json={"operations": [operation]})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_sync_reports_the_new_versions(register):
+    client = register("sync-versions")
+    bar = create_widget(client, {"type": "bar", "metric_name": "Pages", "unit": "pages"})
+    radar = create_widget(client, {"type": "radar", "domains": ["Body", "Mind", "Craft"]})
+    operations = [
+        {"key": "a", "op": "bar.set", "widget_id": bar["id"], "value": 3},
+        {"key": "b", "op": "bar.set", "widget_id": bar["id"], "value": 4},
+        {"key": "c", "op": "radar.change", "widget_id": radar["id"], "index": 0, "change": 1},
+    ]
+    response = client.post("/sync", json={"operations": operations})
+    assert response.status_code == 200
+    assert [result["status"] for result in response.get_json()["results"]] == [200, 200, 200]
+
+    widgets = {widget["id"]: widget for widget in client.get("/dashboard-data").get_json()["widgets"]}
+    assert response.get_json()["versions"] == {
+        str(bar["id"]): widgets[bar["id"]]["version"],
+        str(radar["id"]): widgets[radar["id"]]["version"],
+    }
+    assert widgets[bar["id"]]["version"] > bar["version"]
+
+
+def user_id_of(client):
+    with client.session_transaction() as flask_session:
+        return flask_session["user_id"]
+
+
+def test_only_applied_operations_are_published(register):
+    client = register("sync-events")
+    bar = create_widget(client, {"type": "bar", "metric_name": "Pages", "unit": "pages"})
+    other = create_widget(client, {"type": "bar", "metric_name": "Steps", "unit": "steps"})
+    subscription = event_broker.subscribe(user_id_of(client))
+    operations = [
+        {"key": "set", "op": "bar.set", "widget_id": bar["id"], "value": 3},
+        {"key": "delete", "op": "bar.delete", "widget_id": other["id"]},
+    ]
+    try:
+        results = client.post("/sync", json={"operations": operations}).get_json()["results"]
+        assert [result["status"] for result in results] == [200, 404]
+        assert [data["id"] for _, _, data in subscription.get(timeout=0.1)] == [bar["id"]]
+
+        # A retried batch changes nothing, so nothing is published.
+        results = client.post("/sync", json={"operations": operations}).get_json()["results"]
+        assert all(result["replayed"] for result in results)
+        assert subscription.get(timeout=0.1) == []
+    finally:
+        subscription.close()
+
+
+def test_a_key_stored_by_a_concurrent_batch_is_replayed(register, monkeypatch):
+    client = register("sync-race")
+    radar = create_widget(client, {"type": "radar", "domains": ["Body", "Mind", "Craft"]})
+    first = {"key": "gain", "op": "radar.change", "widget_id": radar["id"], "index": 0, "change": 1}
+    assert client.post("/sync", json={"operations": [first]}).get_json()["results"][0]["status"] == 200
+
+    # The retried batch reads the stored outcomes before the first batch has
+    # committed them, as when both run at once, and only finds them on insert.
+    stored_sync_outcomes = app_module.stored_sync_outcomes
+    lookups = []
+
+    def racing_stored_sync_outcomes(user_id, keys):
+        lookups.append(keys)
+        return {} if len(lookups) == 1 else stored_sync_outcomes(user_id, keys)
+
+    monkeypatch.setattr(app_module, "stored_sync_outcomes", racing_stored_sync_outcomes)
+    second = {"key": "loss", "op": "radar.change", "widget_id": radar["id"], "index": 1, "change": -1}
+    response = client.post("/sync", json={"operations": [first, second]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert results[0]["replayed"] and results[1]["status"] == 200
+
+    # The gain was applied once, by the first batch.
+    widgets = {widget["id"]: widget for widget in client.get("/dashboard-data").get_json()["widgets"]}
+    assert widgets[radar["id"]]["config"]["scores"] == [1, -1, 0]